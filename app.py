@@ -1,14 +1,25 @@
 # audio_transcriber_flask_whisper/app.py
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, Response
 import os
+import gc
+import json
+import re
 import secrets
-from werkzeug.utils import secure_filename
+import shutil
 import whisper
 
 # Importaciones de nuestros módulos
 import audio_processor
 import transcriber
 import file_handler
+import job_queue
+import job_broker
+import transcription_cache
+import model_registry
+import streaming_upload
+import metrics
+import transcript_writers
+import disk_lifecycle
 
 app = Flask(__name__)
 
@@ -17,185 +28,663 @@ app.secret_key = secrets.token_hex(16)
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(APP_ROOT, 'uploads')
 TRANSCRIPTION_OUTPUT_FOLDER_DOCX = os.path.join(APP_ROOT, 'transcriptions_docx')
-TEMP_WAV_OUTPUT_FOLDER = UPLOAD_FOLDER
+TRANSCRIPTION_CACHE_FOLDER = os.path.join(APP_ROOT, 'transcription_cache')
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['TRANSCRIPTION_OUTPUT_FOLDER_DOCX'] = TRANSCRIPTION_OUTPUT_FOLDER_DOCX
-app.config['TEMP_WAV_OUTPUT_FOLDER'] = TEMP_WAV_OUTPUT_FOLDER # Carpeta para WAVs temporales
+app.config['TRANSCRIPTION_CACHE_FOLDER'] = TRANSCRIPTION_CACHE_FOLDER
 
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg', 'm4a', 'flac'} 
+# Formatos generados para cada transcripción desde los mismos segmentos (ver transcript_writers.WRITERS)
+OUTPUT_FORMATS = [f for f in os.environ.get('OUTPUT_FORMATS', 'docx,srt,vtt,json').split(',') if f]
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 2048))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(TRANSCRIPTION_OUTPUT_FOLDER_DOCX, exist_ok=True)
-os.makedirs(os.path.join(TEMP_WAV_OUTPUT_FOLDER, "temp_wav"), exist_ok=True)
-
-WHISPER_MODEL_NAME = "base" 
-try:
-    whisper_transcriber = transcriber.WhisperTranscriber(model_name=WHISPER_MODEL_NAME)
-except Exception as e:
-    print(f"FALLO CRÍTICO: No se pudo inicializar WhisperTranscriber: {e}")
-    whisper_transcriber = None 
-
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def parse_time_to_ms(time_str):
-    """Convierte una cadena HH:MM:SS a milisegundos. Retorna None si está vacía, 'invalid_format' si el formato es incorrecto."""
-    if not time_str or not time_str.strip():
-        return None
-    try:
-        parts = list(map(int, time_str.split(':')))
-        if len(parts) != 3:
-            raise ValueError("El formato debe ser HH:MM:SS")
-        h, m, s = parts
-        if not (0 <= h < 100 and 0 <= m < 60 and 0 <= s < 60): # H puede ser > 23 para duraciones
-             raise ValueError("Valores de tiempo fuera de rango (H < 100, M < 60, S < 60).")
-        return (h * 3600 + m * 60 + s) * 1000
-    except ValueError as e:
-        print(f"Error al parsear tiempo '{time_str}': {e}")
-        return "invalid_format"
 
-@app.route('/', methods=['GET', 'POST'])
-def index():
-    if request.method == 'POST':
-        if not whisper_transcriber:
-            flash('Error: El servicio de transcripción no está disponible. Revisa la consola del servidor.', 'danger')
-            return redirect(request.url)
-
-        if 'audio_file' not in request.files:
-            flash('No se seleccionó ningún archivo.', 'warning')
-            return redirect(request.url)
-        
-        file = request.files['audio_file']
-        
-        if file.filename == '':
-            flash('No se seleccionó ningún archivo.', 'warning')
-            return redirect(request.url)
-        
-        uploaded_audio_path = None # Para asegurar la limpieza
-        temp_wav_path_processed = None # Para el archivo WAV procesado
-
-        if file and allowed_file(file.filename):
-            original_filename = secure_filename(file.filename)
-            random_hex = secrets.token_hex(8)
-            _, f_ext = os.path.splitext(original_filename)
-            secure_input_filename = random_hex + f_ext
-            
-            uploaded_audio_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_input_filename)
-            file.save(uploaded_audio_path)
-            
-            flash(f"Archivo '{original_filename}' subido. Validando tiempos...", 'info')
+# Espacio temporal: una carpeta por request en uploads/ (o en tmpfs si el cuerpo declarado no supera
+# SCRATCH_TMPFS_MAX_MB). El audio decodificado vive en memoria (NumPy), sin WAV intermedio.
+SCRATCH_TMPFS_DIR = os.environ.get('SCRATCH_TMPFS_DIR', '/dev/shm/audio_transcriber' if os.path.isdir('/dev/shm') else '')
+SCRATCH_TMPFS_MAX_MB = int(os.environ.get('SCRATCH_TMPFS_MAX_MB', 64))
+scratch = disk_lifecycle.ScratchSpace(UPLOAD_FOLDER, tmpfs_root=SCRATCH_TMPFS_DIR or None,
+                                      tmpfs_max_bytes=SCRATCH_TMPFS_MAX_MB * 1024 * 1024)
 
-            # Obtener y parsear tiempos de recorte
-            start_time_str = request.form.get('start_time', '').strip()
-            end_time_str = request.form.get('end_time', '').strip()
+# Despliegue: SERVING_ROLE=all (web + inferencia en el mismo proceso, por defecto), web (solo recibe
+# y encola; requiere un broker compartido) o worker (solo inferencia, ver inference_worker.py).
+# PREFORK_SERVER=1 lo fija gunicorn.conf.py / inference_worker.py: los modelos se cargan en el proceso
+# maestro antes del fork y los hilos de fondo se inician en cada hijo con start_background_services().
+SERVING_ROLE = os.environ.get('SERVING_ROLE', 'all')
+if SERVING_ROLE not in ('all', 'web', 'worker'):
+    raise ValueError(f"SERVING_ROLE inválido: '{SERVING_ROLE}' (all, web o worker).")
+RUNS_INFERENCE = SERVING_ROLE != 'web'
+PREFORK_SERVER = os.environ.get('PREFORK_SERVER', '0') == '1'
 
-            start_ms = parse_time_to_ms(start_time_str)
-            end_ms = parse_time_to_ms(end_time_str)
+WHISPER_MODEL_NAME = "base" # Modelo por defecto si el request no elige uno
+AVAILABLE_WHISPER_MODELS = ["tiny", "base", "small", "medium"]
+TRANSCRIPTION_LANGUAGE = "es"
 
-            error_messages = []
-            if start_ms == "invalid_format":
-                error_messages.append('Formato de tiempo de inicio inválido. Use HH:MM:SS.')
-            if end_ms == "invalid_format":
-                error_messages.append('Formato de tiempo de fin inválido. Use HH:MM:SS.')
-            
-            if start_ms is not None and start_ms != "invalid_format" and \
-               end_ms is not None and end_ms != "invalid_format":
-                if start_ms >= end_ms:
-                    error_messages.append('El tiempo de inicio debe ser anterior al tiempo de fin.')
-
-            if error_messages:
-                for msg in error_messages:
-                    flash(msg, 'danger')
-                file_handler.cleanup_temp_file(uploaded_audio_path) # Limpiar el archivo subido si hay error de validación
-                return redirect(request.url)
-
-            flash("Tiempos validados. Procesando audio...", 'info')
-            print(f"Archivo subido: {uploaded_audio_path}")
-            print(f"Tiempos solicitados: Inicio MS: {start_ms}, Fin MS: {end_ms}")
+# Backend de inferencia en CPU: "pytorch" (referencia, fp32), "int8" (capas lineales cuantizadas)
+# o "torchscript" (encoder como grafo congelado). Hilos de torch: 0 deja el valor por defecto.
+WHISPER_BACKEND = os.environ.get('WHISPER_BACKEND', transcriber.REFERENCE_BACKEND)
+if WHISPER_BACKEND not in transcriber.MODEL_BACKENDS:
+    # Sin esta verificación el error aparecería recién al cargar un modelo, con cada trabajo fallando
+    raise ValueError(f"WHISPER_BACKEND inválido: '{WHISPER_BACKEND}' "
+                     f"(disponibles: {', '.join(sorted(transcriber.MODEL_BACKENDS))}).")
+TORCH_INTRA_OP_THREADS = int(os.environ.get('TORCH_INTRA_OP_THREADS', 0))
+TORCH_INTER_OP_THREADS = int(os.environ.get('TORCH_INTER_OP_THREADS', 0))
+if PREFORK_SERVER:
+    # El maestro carga los pesos con un solo hilo: así no crea el pool de OpenMP, que no sobrevive
+    # al fork. Cada hijo fija sus hilos en start_background_services().
+    _default_torch_threads, _ = transcriber.configure_torch_threads()
+    transcriber.configure_torch_threads(1)
+else:
+    transcriber.configure_torch_threads(TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS)
+
+# Registro de modelos: se cargan en su primer uso (el arranque no espera a Whisper) y se
+# mantienen residentes en orden LRU. WHISPER_PRELOAD_MODELS precarga en segundo plano.
+WHISPER_MAX_RESIDENT_MODELS = int(os.environ.get('WHISPER_MAX_RESIDENT_MODELS', 2))
+WHISPER_MODEL_MEMORY_BUDGET_MB = os.environ.get('WHISPER_MODEL_MEMORY_BUDGET_MB')
+WHISPER_PRELOAD_MODELS = [m for m in os.environ.get('WHISPER_PRELOAD_MODELS', WHISPER_MODEL_NAME).split(',') if m]
+models = model_registry.ModelRegistry(
+    AVAILABLE_WHISPER_MODELS,
+    max_resident_models=WHISPER_MAX_RESIDENT_MODELS,
+    memory_budget_mb=int(WHISPER_MODEL_MEMORY_BUDGET_MB) if WHISPER_MODEL_MEMORY_BUDGET_MB else None,
+    backend=WHISPER_BACKEND
+)
+if PREFORK_SERVER and RUNS_INFERENCE:
+    # Carga en el maestro: los hijos comparten las páginas de los pesos (copy-on-write) en lugar
+    # de tener cada uno su copia. Solo se comparten los modelos precargados aquí.
+    models.preload(WHISPER_PRELOAD_MODELS, background=False)
+
+# Inferencia por lotes para clips cortos: los clips de requests concurrentes se decodifican juntos
+# (requiere TRANSCRIPTION_WORKERS > 1). WHISPER_BATCH_SIZE=1 (por defecto) la desactiva.
+# Se decodifica sin marcas de tiempo, así que solo se usa para clips de una sola ventana de Whisper
+# (<= 30 s): en clips más largos los cortes fijos partirían palabras y los SRT/VTT serían bloques de 30 s.
+WHISPER_BATCH_SIZE = int(os.environ.get('WHISPER_BATCH_SIZE', 1))
+WHISPER_BATCH_MAX_WAIT_MS = int(os.environ.get('WHISPER_BATCH_MAX_WAIT_MS', 50))
+WHISPER_BATCH_MAX_AUDIO_SECONDS = min(int(os.environ.get('WHISPER_BATCH_MAX_AUDIO_SECONDS', 30)),
+                                      transcriber.BatchingTranscriber.MAX_AUDIO_SECONDS)
+batching_transcriber = None
+if WHISPER_BATCH_SIZE > 1 and RUNS_INFERENCE:
+    batching_transcriber = transcriber.BatchingTranscriber(models.get,
+                                                           max_batch_size=WHISPER_BATCH_SIZE,
+                                                           max_wait_ms=WHISPER_BATCH_MAX_WAIT_MS)
+
+# Caché de transcripciones por contenido (hash del audio + recorte + modelo + idioma)
+TRANSCRIPTION_CACHE_MAX_MB = int(os.environ.get('TRANSCRIPTION_CACHE_MAX_MB', 512))
+cache = transcription_cache.TranscriptionCache(TRANSCRIPTION_CACHE_FOLDER,
+                                               max_bytes=TRANSCRIPTION_CACHE_MAX_MB * 1024 * 1024)
+
+# Detección de voz antes de Whisper: solo las regiones con voz llegan al modelo y los tiempos de
+# los segmentos se traducen al audio original. VAD_ENABLED=1 la activa.
+VAD_ENABLED = os.environ.get('VAD_ENABLED', '0') == '1'
+
+# Variantes del pipeline que cambian el texto resultante: forman parte de la clave del caché.
+# La inferencia por lotes decodifica sin marcas de tiempo ni respaldo de temperatura, así que sus
+# resultados (clips de hasta WHISPER_BATCH_MAX_AUDIO_SECONDS) no se sirven a la configuración sin lotes.
+PIPELINE_OPTIONS = ",".join(option for option in (
+    "vad" if VAD_ENABLED else None,
+    WHISPER_BACKEND if WHISPER_BACKEND != transcriber.REFERENCE_BACKEND else None,
+    f"batch{WHISPER_BATCH_MAX_AUDIO_SECONDS}" if batching_transcriber else None,
+) if option) or None
+
+# Limpieza de disco en segundo plano: restos temporales huérfanos y salidas por antigüedad/cuota.
+# OUTPUT_MAX_AGE_HOURS=0 u OUTPUT_MAX_MB=0 desactivan la política correspondiente.
+SCRATCH_MAX_AGE_HOURS = float(os.environ.get('SCRATCH_MAX_AGE_HOURS', 6))
+OUTPUT_MAX_AGE_HOURS = float(os.environ.get('OUTPUT_MAX_AGE_HOURS', 72))
+OUTPUT_MAX_MB = int(os.environ.get('OUTPUT_MAX_MB', 2048))
+DISK_REAPER_INTERVAL_SECONDS = int(os.environ.get('DISK_REAPER_INTERVAL_SECONDS', 300))
+# Solo se podan las salidas que genera la app: <nombre>_<id de 16 hex>_transcripcion.<ext>
+# (ver output_base_name y transcript_writers.output_filename); los ejemplos versionados se conservan.
+GENERATED_OUTPUT_PATTERN = re.compile(r"_[0-9a-f]{16}_transcripcion\.[A-Za-z0-9]+$")
+disk_reaper = disk_lifecycle.DiskReaper(
+    scratch,
+    TRANSCRIPTION_OUTPUT_FOLDER_DOCX,
+    output_max_age_s=OUTPUT_MAX_AGE_HOURS * 3600 if OUTPUT_MAX_AGE_HOURS > 0 else None,
+    output_max_bytes=OUTPUT_MAX_MB * 1024 * 1024 if OUTPUT_MAX_MB > 0 else None,
+    scratch_max_age_s=SCRATCH_MAX_AGE_HOURS * 3600,
+    interval_s=DISK_REAPER_INTERVAL_SECONDS,
+    extra_folders={"cache": TRANSCRIPTION_CACHE_FOLDER},
+    # Con un broker compartido las carpetas de trabajos encolados las creó otro proceso (ver más abajo)
+    protected_ids=lambda: transcription_queue.active_ids(),
+    # Con varios workers de gunicorn sobre las mismas carpetas, limpia uno solo a la vez
+    leader_lock_path=os.path.join(UPLOAD_FOLDER, ".disk_reaper.lock"),
+    output_pattern=GENERATED_OUTPUT_PATTERN
+)
+
+# Instrumentación por etapa (METRICS_ENABLED=0 la desactiva) y registros estructurados por request.
+# Con varios procesos, METRICS_MULTIPROC_DIR combina las métricas de todos en /metrics (ver metrics.py);
+# los gauges "local" describen estado compartido (cola, caché, disco) y los calcula quien responde.
+metrics.configure_logging()
+JOBS_GAUGE = metrics.Gauge("transcription_jobs", "Trabajos conocidos por estado.", ("status",),
+                           multiprocess_mode="local")
+QUEUE_CAPACITY_GAUGE = metrics.Gauge("transcription_queue_capacity", "Profundidad máxima de la cola de trabajos.",
+                                     multiprocess_mode="local")
+CACHE_LOOKUPS = metrics.Counter("transcription_cache_lookups_total", "Consultas al caché por resultado.", ("result",))
+CACHE_BYTES_GAUGE = metrics.Gauge("transcription_cache_bytes", "Tamaño en disco del caché de transcripciones.",
+                                  multiprocess_mode="local")
+RESIDENT_MODELS_GAUGE = metrics.Gauge("transcription_resident_models", "Modelos Whisper cargados en memoria.")
+DISK_BYTES_GAUGE = metrics.Gauge("transcription_disk_bytes", "Bytes en disco por área (temporal, salidas, caché).",
+                                 ("area",), multiprocess_mode="local")
+DISK_FREE_GAUGE = metrics.Gauge("transcription_filesystem_free_bytes", "Espacio libre del sistema de archivos de salidas.",
+                                multiprocess_mode="local")
+SCRATCH_ACTIVE_GAUGE = metrics.Gauge("transcription_scratch_active_dirs", "Carpetas de trabajo en uso.")
+DISK_REAPED = metrics.Counter("transcription_disk_reaped_total", "Entradas eliminadas por la limpieza de disco.",
+                              ("reason",))
+
+# Cola de trabajos: las transcripciones se ejecutan fuera del request HTTP. JOB_BROKER=local la
+# mantiene en memoria; sqlite:///ruta/jobs.db la comparte entre procesos (varios workers de gunicorn,
+# frontends web separados de los procesos de inferencia). Ver job_broker.py.
+JOB_BROKER = os.environ.get('JOB_BROKER', 'local')
+TRANSCRIPTION_WORKERS = int(os.environ.get('TRANSCRIPTION_WORKERS', 1))
+TRANSCRIPTION_MAX_QUEUE = int(os.environ.get('TRANSCRIPTION_MAX_QUEUE', 8))
+QUEUE_RETRY_AFTER_SECONDS = 60
+SSE_KEEPALIVE_SECONDS = 15
+
+# Modo de transcripción larga: audios más largos que LONG_FORM_MIN_SECONDS se dividen en fragmentos
+# y se transcriben en paralelo en un pool de procesos. LONG_FORM_WORKERS=0 lo desactiva.
+LONG_FORM_WORKERS = int(os.environ.get('LONG_FORM_WORKERS', 0))
+LONG_FORM_TORCH_THREADS = int(os.environ.get('LONG_FORM_TORCH_THREADS', 2))
+LONG_FORM_MIN_SECONDS = int(os.environ.get('LONG_FORM_MIN_SECONDS', 600))
+parallel_transcriber = None
+if LONG_FORM_WORKERS > 0 and RUNS_INFERENCE:
+    parallel_transcriber = transcriber.ParallelTranscriber(model_name=WHISPER_MODEL_NAME,
+                                                           num_workers=LONG_FORM_WORKERS,
+                                                           torch_threads_per_worker=LONG_FORM_TORCH_THREADS,
+                                                           backend=WHISPER_BACKEND)
+transcription_queue = job_broker.create_broker(JOB_BROKER,
+                                               num_workers=TRANSCRIPTION_WORKERS if RUNS_INFERENCE else 0,
+                                               max_queue_size=TRANSCRIPTION_MAX_QUEUE,
+                                               start=False)
+if not RUNS_INFERENCE and not transcription_queue.shared:
+    raise ValueError("SERVING_ROLE=web requiere un broker compartido (p. ej. JOB_BROKER=sqlite:///ruta/jobs.db).")
+
+AUDIO_ERROR_MESSAGES = {
+    "invalid_start_time": "Tiempo de inicio proporcionado es inválido.",
+    "start_time_out_of_bounds": "El tiempo de inicio está fuera de los límites del audio.",
+    "invalid_end_time": "Tiempo de fin proporcionado es inválido.",
+    "end_time_before_start_time": "El tiempo de fin es anterior o igual al tiempo de inicio.",
+    "invalid_interval": "El intervalo de tiempo para el recorte es inválido.",
+    "zero_length_slice": "El recorte resultó en un audio de duración cero. Verifica los tiempos.",
+    "decode_error": "No se pudo decodificar el archivo de audio. ¿Formato corrupto o no soportado?",
+    "file_not_found": "Archivo de audio no encontrado durante el procesamiento (inesperado).",
+    "processing_error": "Error inesperado durante el procesamiento del audio."
+}
+
+def wants_json():
+    """True si el cliente prefiere JSON (clientes de API) en lugar de HTML."""
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return best == 'application/json' and \
+        request.accept_mimetypes[best] > request.accept_mimetypes['text/html']
 
-            # Usar la nueva función que recorta y convierte
-            # audio_processor.load_slice_and_export_to_wav retorna una ruta o un string de error
-            processing_result = audio_processor.load_slice_and_export_to_wav(
+def output_base_name(original_filename, job_id):
+    # El id del trabajo evita que dos subidas con el mismo nombre se sobrescriban las salidas
+    rit_identifier = os.path.splitext(original_filename)[0]
+    return f"{rit_identifier}_{job_id}"
+
+def write_transcript_outputs(segments, original_filename, job_id):
+    """Escribe la transcripción en OUTPUT_FORMATS. Retorna ({formato: archivo}, bytes escritos)."""
+    return transcript_writers.write_outputs(segments, app.config['TRANSCRIPTION_OUTPUT_FOLDER_DOCX'],
+                                            output_base_name(original_filename, job_id), OUTPUT_FORMATS,
+                                            title=original_filename)
+
+def run_transcription_job(job, uploaded_audio_path, original_filename, start_ms, end_ms,
+                          model_name=WHISPER_MODEL_NAME, cache_key=None):
+    """
+    Pipeline completo de una transcripción, ejecutado por un trabajador de la cola.
+    Retorna un dict con el resultado o lanza job_queue.JobError con un mensaje para el usuario.
+    """
+    try:
+        job.set_progress(0.05, "procesando audio")
+        print(f"[{job.id}] Tiempos solicitados: Inicio MS: {start_ms}, Fin MS: {end_ms}")
+
+        # audio_processor.load_slice_as_array decodifica solo la ventana pedida a 16 kHz mono
+        # y retorna un np.ndarray o un string de error (sin WAV intermedio)
+        with metrics.stage("decode", request_id=job.id) as stage:
+            processing_result = audio_processor.load_slice_as_array(
                 uploaded_audio_path,
-                app.config['TEMP_WAV_OUTPUT_FOLDER'],
-                start_ms=start_ms if isinstance(start_ms, int) else None, # Pasar None si es 'invalid_format' o vacío
-                end_ms=end_ms if isinstance(end_ms, int) else None
+                start_ms=start_ms,
+                end_ms=end_ms
             )
-            
-            # Verificar el resultado del procesamiento de audio
-            if isinstance(processing_result, str) and not processing_result.endswith(".wav"):
-                # Es un código de error de audio_processor
-                error_map = {
-                    "invalid_start_time": "Tiempo de inicio proporcionado es inválido.",
-                    "start_time_out_of_bounds": "El tiempo de inicio está fuera de los límites del audio.",
-                    "invalid_end_time": "Tiempo de fin proporcionado es inválido.",
-                    "end_time_before_start_time": "El tiempo de fin es anterior o igual al tiempo de inicio.",
-                    "invalid_interval": "El intervalo de tiempo para el recorte es inválido.",
-                    "zero_length_slice": "El recorte resultó en un audio de duración cero. Verifica los tiempos.",
-                    "decode_error": "No se pudo decodificar el archivo de audio. ¿Formato corrupto o no soportado?",
-                    "file_not_found": "Archivo de audio no encontrado durante el procesamiento (inesperado).",
-                    "processing_error": "Error inesperado durante el procesamiento del audio."
-                }
-                flash(error_map.get(processing_result, "Error desconocido al procesar el audio."), 'danger')
-                file_handler.cleanup_temp_file(uploaded_audio_path)
-                # temp_wav_path_processed podría no haberse creado o estar vacío, la limpieza general lo tomará.
-                return redirect(request.url)
-            else:
-                temp_wav_path_processed = processing_result # Es una ruta válida a un WAV
+            stage.bytes_read = os.path.getsize(uploaded_audio_path)
+            if not isinstance(processing_result, str):
+                stage.audio_seconds = len(processing_result) / audio_processor.WHISPER_SAMPLE_RATE
 
+        # Verificar el resultado del procesamiento de audio
+        if isinstance(processing_result, str):
+            # Es un código de error de audio_processor
+            raise job_queue.JobError(AUDIO_ERROR_MESSAGES.get(processing_result, "Error desconocido al procesar el audio."))
+        audio_samples = processing_result
+        original_seconds = len(audio_samples) / audio_processor.WHISPER_SAMPLE_RATE
 
-            transcription_text = None
-            if temp_wav_path_processed and os.path.exists(temp_wav_path_processed):
-                print(f"Transcribiendo archivo WAV procesado: {temp_wav_path_processed}")
-                transcription_text = whisper_transcriber.transcribe(temp_wav_path_processed, language="es")
+        time_map = None
+        if VAD_ENABLED:
+            with metrics.stage("vad", request_id=job.id) as stage:
+                stage.audio_seconds = original_seconds
+                speech_samples, timeline = audio_processor.compact_speech(audio_samples)
+            print(f"[{job.id}] VAD: {timeline.speech_seconds:.2f}s de voz en {original_seconds:.2f}s "
+                  f"({timeline.speech_ratio:.0%}).")
+            if len(speech_samples):
+                audio_samples = speech_samples
+                time_map = timeline.to_original
             else:
-                flash('Error: No se generó el archivo WAV para transcribir después del procesamiento.', 'danger')
-            
-            # Limpieza
-            file_handler.cleanup_temp_file(uploaded_audio_path) # Siempre eliminar el archivo original subido
-            if temp_wav_path_processed: # Eliminar el WAV temporal (recortado o completo)
-                 file_handler.cleanup_temp_file(temp_wav_path_processed)
-            
-            temp_wav_folder_path = os.path.join(app.config['TEMP_WAV_OUTPUT_FOLDER'], "temp_wav")
-            if os.path.exists(temp_wav_folder_path) and not os.listdir(temp_wav_folder_path):
-                 file_handler.cleanup_temp_folder(temp_wav_folder_path)
-
-            if transcription_text:
-                flash('Transcripción completada!', 'success')
-                rit_identifier = os.path.splitext(original_filename)[0]
-                docx_filename = f"{rit_identifier}_transcripcion.docx"
-                docx_output_path = os.path.join(app.config['TRANSCRIPTION_OUTPUT_FOLDER_DOCX'], docx_filename)
-                
-                file_handler.save_to_docx(transcription_text, docx_output_path)
-                
-                return render_template('result.html', 
-                                       transcription=transcription_text, 
-                                       docx_filename=docx_filename,
-                                       original_filename=original_filename)
+                # Sin regiones detectadas (p. ej. nivel constante sin pausas): transcribir todo el audio
+                print(f"[{job.id}] VAD sin regiones de voz; se transcribe el audio completo.")
+
+        job.set_progress(0.15, f"cargando modelo '{model_name}'")
+        try:
+            with metrics.stage("model_load", request_id=job.id, model=model_name):
+                whisper_transcriber = models.get(model_name)
+        except Exception:
+            raise job_queue.JobError('Error: El servicio de transcripción no está disponible. Revisa la consola del servidor.')
+
+        job.set_progress(0.2, "transcribiendo")
+        audio_seconds = len(audio_samples) / audio_processor.WHISPER_SAMPLE_RATE
+        print(f"[{job.id}] Transcribiendo {audio_seconds:.2f}s de audio decodificado.")
+        with metrics.stage("transcribe", request_id=job.id, model=model_name) as stage:
+            stage.audio_seconds = audio_seconds
+            if parallel_transcriber and parallel_transcriber.model_name == model_name and \
+               audio_seconds >= LONG_FORM_MIN_SECONDS:
+                result = parallel_transcriber.transcribe_segments(
+                    audio_samples, language=TRANSCRIPTION_LANGUAGE, time_map=time_map,
+                    progress_callback=lambda fraction: job.set_progress(0.2 + 0.75 * fraction))
+            elif batching_transcriber and audio_seconds <= WHISPER_BATCH_MAX_AUDIO_SECONDS:
+                result = batching_transcriber.transcribe_segments(audio_samples, model_name,
+                                                                  language=TRANSCRIPTION_LANGUAGE, time_map=time_map)
             else:
-                # Si la transcripción es None pero no hubo error antes, es un error de Whisper
-                if temp_wav_path_processed: # Solo si el WAV se procesó
-                    flash('No se pudo transcribir el audio. El modelo Whisper pudo haber fallado.', 'danger')
-                # Si temp_wav_path_processed fue None, el error ya se mostró.
-                return redirect(request.url)
-        else:
-            flash('Tipo de archivo no permitido.', 'danger')
-            return redirect(request.url)
+                # Camino por defecto: decodificación nativa de Whisper; los segmentos se publican en el
+                # trabajo (SSE) al terminar, junto con el avance
+                def publish_segment(segment):
+                    job.add_segment(segment)
+                    job.set_progress(0.2 + 0.75 * min(1.0, segment["end"] / original_seconds))
+
+                result = whisper_transcriber.transcribe_segments(audio_samples, language=TRANSCRIPTION_LANGUAGE,
+                                                                 on_segment=publish_segment, time_map=time_map)
+        if not result or not result["text"]:
+            raise job_queue.JobError('No se pudo transcribir el audio. El modelo Whisper pudo haber fallado.')
+        transcription_text = result["text"]
+
+        # Todos los formatos salen de la misma lista de segmentos, sin volver a transcribir
+        job.set_progress(0.95, "generando archivos")
+        with metrics.stage("write", request_id=job.id, model=model_name) as stage:
+            try:
+                output_files, stage.bytes_written = write_transcript_outputs(result["segments"], original_filename,
+                                                                             job.id)
+            except Exception as e:
+                print(f"[{job.id}] Error al escribir los archivos de la transcripción: {e}")
+                raise job_queue.JobError('No se pudieron generar los archivos de la transcripción.')
+        if cache_key:
+            docx_path = None
+            if "docx" in output_files:
+                docx_path = os.path.join(app.config['TRANSCRIPTION_OUTPUT_FOLDER_DOCX'], output_files["docx"])
+            cache.put(cache_key, transcription_text, docx_path,
+                      metadata={"model": model_name, "language": TRANSCRIPTION_LANGUAGE,
+                                "start_ms": start_ms, "end_ms": end_ms},
+                      segments=result["segments"])
+
+        return {
+            "transcription": transcription_text,
+            "docx_filename": output_files.get("docx"),
+            "output_files": output_files,
+            "original_filename": original_filename,
+        }
+    finally:
+        # Limpieza: la carpeta de trabajo del request, con el archivo subido y cualquier temporal
+        scratch.release(job.id)
+
+UPLOAD_ERROR_MESSAGES = {
+    "no_file": "No se seleccionó ningún archivo.",
+    "file_type_not_allowed": "Tipo de archivo no permitido.",
+    "unsupported_format": "El contenido del archivo no corresponde a un formato de audio soportado.",
+    "empty_file": "El archivo subido está vacío.",
+    "file_too_large": f"El archivo supera el tamaño máximo permitido ({MAX_UPLOAD_MB} MB).",
+    "malformed_request": "La solicitud de subida es inválida o llegó incompleta.",
+}
+
+def validate_form_fields(fields):
+    """
+    Valida los campos del formulario (modelo y tiempos de recorte).
+    Se llama antes de recibir el archivo, para rechazar la subida sin escribirla en disco.
+    Retorna la lista de mensajes de error.
+    """
+    error_messages = []
+    model_name = fields.get('model', '').strip() or WHISPER_MODEL_NAME
+    if not models.is_allowed(model_name):
+        error_messages.append(f"Modelo Whisper no disponible: '{model_name}'.")
+
+    start_ms = audio_processor.parse_time_to_ms(fields.get('start_time', '').strip())
+    end_ms = audio_processor.parse_time_to_ms(fields.get('end_time', '').strip())
+    if start_ms == "invalid_format":
+        error_messages.append('Formato de tiempo de inicio inválido. Use HH:MM:SS.')
+    if end_ms == "invalid_format":
+        error_messages.append('Formato de tiempo de fin inválido. Use HH:MM:SS.')
+
+    if start_ms is not None and start_ms != "invalid_format" and \
+       end_ms is not None and end_ms != "invalid_format":
+        if start_ms >= end_ms:
+            error_messages.append('El tiempo de inicio debe ser anterior al tiempo de fin.')
+    return error_messages
+
+def reject_upload(messages, status_code, category='danger'):
+    if wants_json():
+        return jsonify({'error': 'upload_rejected', 'messages': messages}), status_code
+    for msg in messages:
+        flash(msg, category)
+    return redirect(request.url)
+
+@app.route('/', methods=['GET', 'POST'])
+def index():
+    if request.method == 'POST':
+        # Rechazar por tamaño declarado antes de leer el cuerpo
+        if request.content_length is not None and request.content_length > MAX_UPLOAD_MB * 1024 * 1024:
+            return reject_upload([UPLOAD_ERROR_MESSAGES["file_too_large"]], 413)
+        if transcription_queue.is_full():
+            # Backpressure antes de recibir el archivo: no tiene sentido escribirlo en disco
+            print("Solicitud rechazada: la cola de transcripción está llena.")
+            retry_headers = {'Retry-After': str(QUEUE_RETRY_AFTER_SECONDS)}
+            if wants_json():
+                return jsonify({'error': 'queue_full'}), 503, retry_headers
+            flash('El servidor está ocupado con otras transcripciones. Intenta nuevamente en unos minutos.', 'warning')
+            return render_template('index.html'), 503, retry_headers
+
+        # Id del request: etiqueta los registros de cada etapa y pasa a ser el id del trabajo
+        request_id = secrets.token_hex(8)
+
+        # Carpeta de trabajo propia del request (en tmpfs si el tamaño declarado es chico); se elimina
+        # completa en cualquier salida temprana, o al terminar el trabajo si llega a encolarse
+        workdir = scratch.create(request_id, expected_bytes=request.content_length)
+        submitted = False
+        try:
+            # Recepción por streaming: campos validados antes del archivo, firma del contenedor
+            # verificada con los primeros bytes y SHA-256 calculado mientras se escribe.
+            try:
+                with metrics.stage("upload", request_id=request_id) as stage:
+                    upload = streaming_upload.receive_upload(
+                        request.stream,
+                        request.content_type,
+                        workdir,
+                        max_bytes=MAX_UPLOAD_MB * 1024 * 1024,
+                        allowed_extensions=ALLOWED_EXTENSIONS,
+                        validate_fields=validate_form_fields
+                    )
+                    stage.bytes_written = upload['bytes']
+            except streaming_upload.UploadRejected as e:
+                if e.code == "invalid_fields":
+                    return reject_upload(e.messages, 400)
+                status_code = 413 if e.code == "file_too_large" else 400
+                category = 'warning' if e.code == "no_file" else 'danger'
+                return reject_upload([UPLOAD_ERROR_MESSAGES.get(e.code, "Error desconocido al recibir el archivo.")],
+                                     status_code, category)
+
+            original_filename = upload['original_filename']
+            uploaded_audio_path = upload['path']
+            audio_sha256 = upload['sha256']
+            fields = upload['fields']
+            model_name = fields.get('model', '').strip() or WHISPER_MODEL_NAME
+            start_ms = audio_processor.parse_time_to_ms(fields.get('start_time', '').strip())
+            end_ms = audio_processor.parse_time_to_ms(fields.get('end_time', '').strip())
+
+            # Validar el inicio contra la duración leída de los metadatos (sin decodificar el audio)
+            try:
+                duration_ms = audio_processor.probe_duration_ms(uploaded_audio_path)
+            except audio_processor.CouldntDecodeError:
+                return reject_upload([AUDIO_ERROR_MESSAGES["decode_error"]], 400)
+            if duration_ms is not None and start_ms is not None and start_ms >= duration_ms:
+                return reject_upload([AUDIO_ERROR_MESSAGES["start_time_out_of_bounds"]], 400)
+
+            print(f"Archivo subido: {uploaded_audio_path}")
+            cache_key = transcription_cache.make_cache_key(audio_sha256, start_ms, end_ms,
+                                                           model_name, TRANSCRIPTION_LANGUAGE,
+                                                           options=PIPELINE_OPTIONS)
+            cached = cache.get(cache_key)
+            if cached:
+                CACHE_LOOKUPS.inc(result="hit")
+                metrics.log_event(request_id, "cache_hit", model=model_name)
+                return render_cached_result(cached, original_filename, request_id)
+            CACHE_LOOKUPS.inc(result="miss")
+
+            try:
+                job = transcription_queue.submit(
+                    run_transcription_job,
+                    uploaded_audio_path,
+                    original_filename,
+                    start_ms,
+                    end_ms,
+                    model_name=model_name,
+                    cache_key=cache_key,
+                    job_id=request_id
+                )
+                submitted = True
+                if transcription_queue.shared:
+                    # La carpeta la libera el proceso que ejecute el trabajo, quizás otro
+                    scratch.detach(request_id)
+            except job_queue.QueueFullError as e:
+                print(f"Solicitud rechazada: {e}")
+                retry_headers = {'Retry-After': str(QUEUE_RETRY_AFTER_SECONDS)}
+                if wants_json():
+                    return jsonify({'error': 'queue_full', 'message': str(e)}), 503, retry_headers
+                flash('El servidor está ocupado con otras transcripciones. Intenta nuevamente en unos minutos.', 'warning')
+                return render_template('index.html'), 503, retry_headers
+
+            metrics.log_event(job.id, "queued", model=model_name, upload_bytes=upload['bytes'])
+            request_id_header = {'X-Request-ID': job.id}
+            if wants_json():
+                return jsonify({
+                    'job_id': job.id,
+                    'status': job.status,
+                    'status_url': url_for('job_status', job_id=job.id),
+                    'stream_url': url_for('job_stream', job_id=job.id),
+                    'result_url': url_for('job_result', job_id=job.id),
+                }), 202, request_id_header
+            flash(f"Archivo '{original_filename}' recibido. La transcripción está en cola.", 'info')
+            response = redirect(url_for('job_page', job_id=job.id))
+            response.headers.update(request_id_header)
+            return response
+        finally:
+            if not submitted:
+                scratch.release(request_id)
             
     return render_template('index.html')
 
+def render_cached_result(cached, original_filename, request_id):
+    """Responde de inmediato con una transcripción encontrada en el caché."""
+    if cached["segments"] is not None:
+        output_files, _ = write_transcript_outputs(cached["segments"], original_filename, request_id)
+    else:
+        # Entrada anterior a los segmentos: solo se puede entregar el DOCX de texto continuo
+        docx_filename = transcript_writers.output_filename(output_base_name(original_filename, request_id), "docx")
+        docx_output_path = os.path.join(app.config['TRANSCRIPTION_OUTPUT_FOLDER_DOCX'], docx_filename)
+        try:
+            shutil.copyfile(cached["docx_path"], docx_output_path)
+        except (TypeError, FileNotFoundError):
+            # Sin DOCX en caché (o desalojado mientras tanto): regenerarlo desde el texto
+            file_handler.save_to_docx(cached["transcription"], docx_output_path)
+        output_files = {"docx": docx_filename}
+    result = {
+        "transcription": cached["transcription"],
+        "docx_filename": output_files.get("docx"),
+        "output_files": output_files,
+        "original_filename": original_filename,
+    }
+    if wants_json():
+        return jsonify(dict(result, status=job_queue.JOB_DONE, cached=True))
+    flash('Transcripción obtenida del caché.', 'success')
+    return render_template('result.html', **result)
+
+@app.context_processor
+def inject_model_choices():
+    return {'available_models': AVAILABLE_WHISPER_MODELS, 'default_model': WHISPER_MODEL_NAME}
+
+@app.route('/models')
+def model_stats():
+    return jsonify(models.stats())
+
+@app.route('/batching/stats')
+def batching_stats():
+    if batching_transcriber is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(batching_transcriber.stats(), enabled=True))
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
+@app.route('/disk/stats')
+def disk_stats():
+    return jsonify(disk_reaper.report())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Estado actual de la cola, el caché y los modelos, junto a los histogramas por etapa
+    queue_stats = transcription_queue.stats()
+    for status in (job_queue.JOB_QUEUED, job_queue.JOB_RUNNING, job_queue.JOB_DONE, job_queue.JOB_FAILED):
+        JOBS_GAUGE.set(queue_stats[status], status=status)
+    QUEUE_CAPACITY_GAUGE.set(queue_stats["max_queue_size"])
+    CACHE_BYTES_GAUGE.set(cache.stats()["bytes"])
+    disk_report = disk_reaper.report(run_if_missing=False)
+    if disk_report:
+        for area, size in disk_report["areas_bytes"].items():
+            DISK_BYTES_GAUGE.set(size, area=area)
+        DISK_FREE_GAUGE.set(disk_report["filesystem_free_bytes"])
+    return Response(metrics.render_latest(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@metrics.add_collector
+def collect_process_metrics():
+    # Estado propio de cada proceso: también lo publican los que no atienden /metrics
+    RESIDENT_MODELS_GAUGE.set(len(models.stats()["resident"]))
+    SCRATCH_ACTIVE_GAUGE.set(scratch.active_count())
+    for reason, count in disk_reaper.totals.items():
+        DISK_REAPED.set_total(count, reason=reason)
+
+@app.route('/job/<job_id>')
+def job_page(job_id):
+    job = transcription_queue.get(job_id)
+    if job is None:
+        flash('Trabajo de transcripción no encontrado.', 'danger')
+        return redirect(url_for('index'))
+    return render_template('job.html', job=job.to_dict())
+
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    job = transcription_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'job_not_found'}), 404
+    return jsonify(job.to_dict())
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/stream/<job_id>')
+def job_stream(job_id):
+    """Server-Sent Events: segmentos transcritos y progreso del trabajo a medida que ocurren."""
+    job = transcription_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'job_not_found'}), 404
+
+    result_url = url_for('job_result', job_id=job.id)
+
+    def generate():
+        sent_segments = 0
+        attempt = job.attempt
+        version = -1
+        while True:
+            version = job.wait_for_change(version, timeout=SSE_KEEPALIVE_SECONDS)
+            if job.attempt != attempt:
+                # El trabajo se reintentó (broker compartido): el cliente descarta lo recibido
+                attempt = job.attempt
+                if sent_segments:
+                    sent_segments = 0
+                    yield sse_event('reset', {'attempt': attempt})
+            segments = job.segments[sent_segments:]
+            for segment in segments:
+                yield sse_event('segment', segment)
+            sent_segments += len(segments)
+            if job.finished:
+                yield sse_event(job.status, dict(job.to_dict(), result_url=result_url))
+                return
+            # Sirve también como keepalive para proxies cuando no hubo cambios
+            yield sse_event('progress', job.to_dict())
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/result/<job_id>')
+def job_result(job_id):
+    job = transcription_queue.get(job_id)
+    if job is None:
+        if wants_json():
+            return jsonify({'error': 'job_not_found'}), 404
+        flash('Trabajo de transcripción no encontrado.', 'danger')
+        return redirect(url_for('index'))
+
+    if job.status == job_queue.JOB_DONE:
+        if wants_json():
+            return jsonify(dict(job.to_dict(), **job.result))
+        flash('Transcripción completada!', 'success')
+        return render_template('result.html', **job.result)
+    if job.status == job_queue.JOB_FAILED:
+        if wants_json():
+            return jsonify(job.to_dict())
+        flash(job.error, 'danger')
+        return redirect(url_for('index'))
+    # Todavía en cola o en proceso
+    if wants_json():
+        return jsonify(job.to_dict()), 202
+    return redirect(url_for('job_page', job_id=job.id))
+
+@app.route('/download/<filename>')
 @app.route('/download_docx/<filename>')
 def download_docx(filename):
+    # Sirve cualquiera de los formatos generados (DOCX, SRT, VTT, JSON)
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    writer = transcript_writers.WRITERS.get(extension)
+    if writer is None:
+        flash('Formato de archivo no disponible.', 'danger')
+        return redirect(url_for('index'))
     try:
         return send_from_directory(app.config['TRANSCRIPTION_OUTPUT_FOLDER_DOCX'], 
                                    filename, 
-                                   as_attachment=True)
+                                   as_attachment=True,
+                                   mimetype=writer.mimetype)
     except FileNotFoundError:
-        flash('Archivo DOCX no encontrado.', 'danger')
+        flash(f'Archivo {extension.upper()} no encontrado.', 'danger')
         return redirect(url_for('index'))
 
+transcription_queue.register_task(run_transcription_job)
+
+_background_services_started = False
+
+def start_background_services():
+    """
+    Inicia los hilos de fondo del proceso: trabajadores de la cola, limpieza de disco y precarga de modelos.
+    Sin PREFORK_SERVER se llama al importar el módulo; con él, en cada proceso hijo tras el fork
+    (los hilos del maestro no se heredan).
+    """
+    global _background_services_started
+    if _background_services_started:
+        return
+    _background_services_started = True
+    if PREFORK_SERVER:
+        transcriber.configure_torch_threads(TORCH_INTRA_OP_THREADS or _default_torch_threads, TORCH_INTER_OP_THREADS)
+    elif RUNS_INFERENCE:
+        models.preload(WHISPER_PRELOAD_MODELS)
+    transcription_queue.start()
+    if SERVING_ROLE != 'worker':
+        disk_reaper.start()
+    metrics.start_snapshot_writer()
+
+def prepare_for_fork():
+    """
+    Se llama en el maestro justo antes de crear los hijos. gc.freeze() saca del recolector los objetos
+    ya creados (modelos incluidos), de modo que sus recorridos no escriban en esas páginas y las
+    conviertan en copias privadas de cada hijo.
+    """
+    gc.collect()
+    gc.freeze()
+
+if not PREFORK_SERVER:
+    start_background_services()
+
 if __name__ == '__main__':
     # audio_processor.ensure_ffmpeg_is_available() # Llamar una vez al inicio
     print("FFmpeg/Libav check will be performed by audio_processor module upon first conversion.")
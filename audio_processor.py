@@ -4,6 +4,8 @@ from pydub.exceptions import CouldntDecodeError
 import os
 import tempfile
 import shutil
+import subprocess
+import numpy as np
 
 # Importar file_handler para usar cleanup_temp_file si es necesario internamente,
 # aunque es preferible que el вызывающий (app.py) maneje la limpieza si la función devuelve None.
@@ -12,6 +14,9 @@ import shutil
 # Variable global para verificar si se mostró la advertencia de FFmpeg
 ffmpeg_warning_shown = False
 
+# Whisper trabaja internamente con audio mono a 16 kHz en float32
+WHISPER_SAMPLE_RATE = 16000
+
 def ensure_ffmpeg_is_available():
     global ffmpeg_warning_shown
     if ffmpeg_warning_shown:
@@ -27,6 +32,22 @@ def ensure_ffmpeg_is_available():
         # print("FFmpeg (o Libav) detectado. La conversión de audio debería funcionar.")
 
 
+def parse_time_to_ms(time_str):
+    """Convierte una cadena HH:MM:SS a milisegundos. Retorna None si está vacía, 'invalid_format' si el formato es incorrecto."""
+    if not time_str or not time_str.strip():
+        return None
+    try:
+        parts = list(map(int, time_str.split(':')))
+        if len(parts) != 3:
+            raise ValueError("El formato debe ser HH:MM:SS")
+        h, m, s = parts
+        if not (0 <= h < 100 and 0 <= m < 60 and 0 <= s < 60): # H puede ser > 23 para duraciones
+             raise ValueError("Valores de tiempo fuera de rango (H < 100, M < 60, S < 60).")
+        return (h * 3600 + m * 60 + s) * 1000
+    except ValueError as e:
+        print(f"Error al parsear tiempo '{time_str}': {e}")
+        return "invalid_format"
+
 def load_slice_and_export_to_wav(input_audio_path, output_folder, start_ms=None, end_ms=None):
     """
     Carga un archivo de audio, opcionalmente lo recorta, y lo exporta a formato WAV.
@@ -49,6 +70,7 @@ def load_slice_and_export_to_wav(input_audio_path, output_folder, start_ms=None,
     )
     temp_wav_path = temp_wav_file.name
     temp_wav_file.close()
+    exported = False
 
     try:
         print(f"Cargando audio desde: '{input_audio_path}'...")
@@ -103,6 +125,7 @@ def load_slice_and_export_to_wav(input_audio_path, output_folder, start_ms=None,
         print(f"Duración del audio a procesar: {len(sliced_audio) / 1000.0:.2f} segundos.")
         sliced_audio.export(temp_wav_path, format="wav")
         print(f"Audio (potencialmente recortado) y convertido a WAV guardado en: {temp_wav_path}")
+        exported = True
         return temp_wav_path
         
     except CouldntDecodeError:
@@ -118,8 +141,283 @@ def load_slice_and_export_to_wav(input_audio_path, output_folder, start_ms=None,
         # if os.path.exists(temp_wav_path): os.remove(temp_wav_path)
         return "processing_error"
     finally:
-        # La limpieza del temp_wav_path en caso de error DENTRO de esta función
-        # puede ser complicada si la función retorna códigos de error string.
-        # Es más robusto que el llamador (app.py) limpie el temp_wav_path si la función
-        # no retorna una ruta válida. La función crea el archivo; el llamador gestiona su ciclo de vida.
-        pass
\ No newline at end of file
+        # Si la función retorna un código de error, el llamador no recibe la ruta del WAV
+        # y no podría borrarlo: se elimina aquí. Con éxito, el llamador gestiona su ciclo de vida.
+        if not exported and os.path.exists(temp_wav_path):
+            os.remove(temp_wav_path)
+
+
+def probe_duration_ms(input_audio_path):
+    """
+    Obtiene la duración del audio en milisegundos leyendo solo los metadatos del contenedor (ffprobe).
+    Retorna None si no se puede determinar (ffprobe ausente o contenedor sin duración).
+    Lanza CouldntDecodeError si ffprobe no reconoce el archivo.
+    """
+    if shutil.which("ffprobe") is None:
+        return None
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+           "-of", "default=noprint_wrappers=1:nokey=1", input_audio_path]
+    completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise CouldntDecodeError(completed.stderr.decode(errors="replace").strip())
+    try:
+        return int(float(completed.stdout.decode().strip()) * 1000)
+    except ValueError:
+        return None # Algunos contenedores (p. ej. streams ogg) no declaran duración
+
+
+def decode_slice_with_ffmpeg(input_audio_path, start_ms=None, duration_ms=None, sample_rate=WHISPER_SAMPLE_RATE):
+    """
+    Decodifica solo la ventana pedida usando el seek de FFmpeg y remuestrea a mono float32.
+    Retorna un np.ndarray float32; lanza CouldntDecodeError si FFmpeg falla.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "0"]
+    if start_ms:
+        cmd += ["-ss", f"{start_ms / 1000.0:.3f}"] # Seek a nivel de entrada: no decodifica lo anterior
+    cmd += ["-i", input_audio_path]
+    if duration_ms is not None:
+        cmd += ["-t", f"{duration_ms / 1000.0:.3f}"] # El decodificador se detiene al llegar al fin
+    cmd += ["-vn", "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(sample_rate), "-"]
+    completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise CouldntDecodeError(completed.stderr.decode(errors="replace").strip())
+    return np.frombuffer(completed.stdout, dtype=np.float32)
+
+
+def load_slice_as_array(input_audio_path, start_ms=None, end_ms=None):
+    """
+    Decodifica solo el intervalo [start_ms, end_ms) del audio directamente a un arreglo NumPy
+    mono float32 a 16 kHz, listo para WhisperTranscriber.transcribe (sin WAV intermedio).
+    Retorna el np.ndarray, o un código de error string (los mismos que load_slice_and_export_to_wav).
+    """
+    ensure_ffmpeg_is_available()
+
+    if not os.path.exists(input_audio_path):
+        print(f"Error: El archivo de entrada '{input_audio_path}' no fue encontrado.")
+        return "file_not_found"
+
+    try:
+        duration_ms = probe_duration_ms(input_audio_path)
+        if duration_ms is not None:
+            print(f"Duración original del audio: {duration_ms / 1000.0:.2f} segundos.")
+
+        actual_start_ms = 0
+        if start_ms is not None:
+            if not isinstance(start_ms, (int, float)) or start_ms < 0:
+                print(f"Error: Tiempo de inicio ({start_ms}) inválido. Debe ser un número no negativo.")
+                return "invalid_start_time"
+            if duration_ms is not None and start_ms >= duration_ms:
+                print(f"Error: El tiempo de inicio ({start_ms / 1000.0:.2f}s) es mayor o igual a la duración del audio ({duration_ms / 1000.0:.2f}s).")
+                return "start_time_out_of_bounds"
+            actual_start_ms = int(start_ms)
+
+        actual_end_ms = duration_ms
+        if end_ms is not None:
+            if not isinstance(end_ms, (int, float)) or end_ms <= 0:
+                print(f"Error: Tiempo de fin ({end_ms}) inválido. Debe ser un número positivo.")
+                return "invalid_end_time"
+            if end_ms <= actual_start_ms:
+                print(f"Error: El tiempo de fin ({end_ms / 1000.0:.2f}s) debe ser mayor que el tiempo de inicio ({actual_start_ms / 1000.0:.2f}s).")
+                return "end_time_before_start_time"
+            actual_end_ms = int(end_ms) if duration_ms is None else min(int(end_ms), duration_ms)
+
+        if actual_end_ms is not None and actual_start_ms >= actual_end_ms:
+            print(f"Error: Intervalo de tiempo inválido después de los ajustes. Inicio: {actual_start_ms}, Fin: {actual_end_ms}")
+            return "invalid_interval"
+
+        window_ms = None if actual_end_ms is None else actual_end_ms - actual_start_ms
+        print(f"Decodificando desde {actual_start_ms / 1000.0:.2f}s"
+              + (f" hasta {actual_end_ms / 1000.0:.2f}s." if actual_end_ms is not None else " hasta el final."))
+        samples = decode_slice_with_ffmpeg(input_audio_path, start_ms=actual_start_ms, duration_ms=window_ms)
+
+        if samples.size == 0:
+            if duration_ms is None and actual_start_ms > 0:
+                # Sin duración en los metadatos, un inicio fuera del audio solo se detecta aquí
+                print(f"Error: El tiempo de inicio ({actual_start_ms / 1000.0:.2f}s) está fuera de los límites del audio.")
+                return "start_time_out_of_bounds"
+            print("Error: El segmento de audio resultante del recorte tiene duración cero.")
+            return "zero_length_slice"
+
+        print(f"Duración del audio a procesar: {samples.size / WHISPER_SAMPLE_RATE:.2f} segundos.")
+        return samples
+
+    except CouldntDecodeError as e:
+        print(f"Error: No se pudo decodificar el archivo de audio '{input_audio_path}': {e}")
+        return "decode_error"
+    except FileNotFoundError:
+        # subprocess lanza FileNotFoundError si el ejecutable de FFmpeg no existe
+        print("Error: No se encontró el ejecutable de FFmpeg para decodificar el audio.")
+        return "decode_error"
+    except Exception as e:
+        print(f"Error inesperado durante el procesamiento de audio: {e}")
+        return "processing_error"
+
+
+def frame_energy_db(samples, sample_rate=WHISPER_SAMPLE_RATE, frame_ms=30):
+    """
+    Energía (dBFS) por trama no solapada, calculada de forma vectorizada.
+    Retorna (energías, tamaño_de_trama_en_muestras).
+    """
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.empty(0, dtype=np.float32), frame_len
+    frames = np.asarray(samples[:n_frames * frame_len], dtype=np.float32).reshape(n_frames, frame_len)
+    energy = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    return energy, frame_len
+
+
+def find_chunk_boundaries(samples, sample_rate=WHISPER_SAMPLE_RATE, target_chunk_s=90.0,
+                          search_window_s=15.0, overlap_s=1.0, silence_db=-40.0):
+    """
+    Divide el audio en fragmentos de ~target_chunk_s segundos cortando en la trama más silenciosa
+    dentro de ±search_window_s alrededor de cada corte ideal.
+    Si el punto de corte no es silencio, los fragmentos vecinos se solapan overlap_s segundos
+    para no perder palabras (el solapamiento se elimina luego al unir los textos).
+    Retorna una lista de tuplas (inicio, fin) en muestras.
+    """
+    total = len(samples)
+    target = int(target_chunk_s * sample_rate)
+    if total <= target + int(search_window_s * sample_rate):
+        return [(0, total)]
+
+    energy, frame_len = frame_energy_db(samples, sample_rate)
+    overlap = int(overlap_s * sample_rate)
+    window_frames = max(1, int(search_window_s * sample_rate) // frame_len)
+
+    cuts = [] # (muestra de corte, es_silencio)
+    position = 0
+    while total - position > target + window_frames * frame_len:
+        ideal_frame = (position + target) // frame_len
+        lo = max(position // frame_len + 1, ideal_frame - window_frames)
+        hi = min(len(energy), ideal_frame + window_frames + 1)
+        best_frame = lo + int(np.argmin(energy[lo:hi]))
+        cut = best_frame * frame_len + frame_len // 2
+        cuts.append((cut, bool(energy[best_frame] <= silence_db)))
+        position = cut
+
+    boundaries = []
+    start, start_is_silent = 0, True
+    for cut, is_silent in cuts:
+        chunk_start = start if start_is_silent else max(0, start - overlap)
+        chunk_end = cut if is_silent else min(total, cut + overlap)
+        boundaries.append((chunk_start, chunk_end))
+        start, start_is_silent = cut, is_silent
+    boundaries.append((start if start_is_silent else max(0, start - overlap), total))
+    return boundaries
+
+
+# --- Detección de voz (VAD) --------------------------------------------------
+def _frame_spectral_features(samples, frame_len, sample_rate, band_hz=(80.0, 4000.0), block_frames=4096):
+    """
+    Por trama: fracción de la energía dentro de la banda de voz y planitud espectral
+    (media geométrica / media aritmética del espectro: ~1 en ruido blanco, baja en voz y tonos).
+    Se procesa por bloques de tramas para acotar la memoria en audios largos.
+    """
+    n_frames = len(samples) // frame_len
+    band_ratio = np.empty(n_frames, dtype=np.float32)
+    flatness = np.empty(n_frames, dtype=np.float32)
+    window = np.hanning(frame_len).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_len, d=1.0 / sample_rate)
+    in_band = (freqs >= band_hz[0]) & (freqs <= band_hz[1])
+    for first in range(0, n_frames, block_frames):
+        last = min(n_frames, first + block_frames)
+        frames = np.asarray(samples[first * frame_len:last * frame_len], dtype=np.float32)
+        power = np.abs(np.fft.rfft(frames.reshape(-1, frame_len) * window, axis=1)) ** 2 + 1e-12
+        total = power.sum(axis=1)
+        band_ratio[first:last] = power[:, in_band].sum(axis=1) / total
+        flatness[first:last] = np.exp(np.mean(np.log(power), axis=1)) / (total / power.shape[1])
+    return band_ratio, flatness
+
+
+def _runs(mask):
+    """Tramos consecutivos de True en mask como arreglo de pares [inicio, fin) en tramas."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges.reshape(-1, 2)
+
+
+def detect_speech_regions(samples, sample_rate=WHISPER_SAMPLE_RATE, frame_ms=30, margin_db=12.0,
+                          min_energy_db=-55.0, min_band_ratio=0.6, max_flatness=0.4,
+                          min_speech_ms=250, min_silence_ms=600, pad_ms=200):
+    """
+    Encuentra las regiones con voz combinando, por trama, energía sobre el piso de ruido estimado
+    (percentil 10 + margin_db), proporción de energía en la banda de voz (descarta zumbidos graves
+    y siseo agudo) y planitud espectral (descarta ruido de banda ancha). Los huecos menores a min_silence_ms se rellenan, las regiones
+    menores a min_speech_ms se descartan y cada región se amplía pad_ms por lado para no cortar sílabas.
+    La música de espera con mucha energía en la banda de voz puede pasar como voz: en ese caso
+    Whisper la recibe igual que sin VAD.
+    Retorna una lista de tuplas (inicio, fin) en muestras, ordenadas y sin solaparse.
+    """
+    energy, frame_len = frame_energy_db(samples, sample_rate, frame_ms)
+    if energy.size == 0:
+        return []
+    threshold = max(min_energy_db, float(np.percentile(energy, 10)) + margin_db)
+    band_ratio, flatness = _frame_spectral_features(samples, frame_len, sample_rate)
+    is_speech = (energy > threshold) & (band_ratio >= min_band_ratio) & (flatness <= max_flatness)
+
+    # Rellenar silencios cortos dentro de una misma intervención (pausas entre palabras)
+    max_gap = max(1, int(min_silence_ms / frame_ms))
+    for start, end in _runs(~is_speech):
+        if 0 < start and end < len(is_speech) and end - start < max_gap:
+            is_speech[start:end] = True
+
+    min_frames = max(1, int(min_speech_ms / frame_ms))
+    pad = int(pad_ms * sample_rate / 1000)
+    total = len(samples)
+    regions = []
+    for start, end in _runs(is_speech):
+        if end - start < min_frames:
+            continue
+        region_start = max(0, int(start) * frame_len - pad)
+        region_end = min(total, int(end) * frame_len + pad)
+        if regions and region_start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], region_end)
+        else:
+            regions.append((region_start, region_end))
+    return regions
+
+
+class SpeechTimeline:
+    """
+    Mapa entre el audio compactado (solo regiones con voz) y el audio original.
+    to_original() traduce segundos del audio compactado a segundos del original.
+    """
+    def __init__(self, regions, gap_samples, sample_rate, original_samples):
+        self.sample_rate = sample_rate
+        self.original_seconds = original_samples / sample_rate
+        lengths = np.array([end - start for start, end in regions], dtype=np.int64)
+        self._original_starts = np.array([start for start, _ in regions], dtype=np.int64) / sample_rate
+        self._compact_starts = (np.concatenate(([0], np.cumsum(lengths + gap_samples)[:-1]))
+                                / sample_rate) if len(regions) else np.empty(0)
+        self._lengths = lengths / sample_rate
+        self.speech_seconds = float(self._lengths.sum())
+
+    @property
+    def speech_ratio(self):
+        return self.speech_seconds / self.original_seconds if self.original_seconds else 0.0
+
+    def to_original(self, seconds):
+        if not len(self._compact_starts):
+            return seconds
+        index = max(0, int(np.searchsorted(self._compact_starts, seconds, side="right")) - 1)
+        offset = min(max(0.0, seconds - self._compact_starts[index]), self._lengths[index])
+        return float(self._original_starts[index] + offset)
+
+
+def compact_speech(samples, sample_rate=WHISPER_SAMPLE_RATE, gap_ms=300, **vad_options):
+    """
+    Aplica el VAD y concatena solo las regiones con voz, separadas por gap_ms de silencio
+    para que Whisper no una palabras de intervenciones distintas.
+    Retorna (muestras_compactadas, SpeechTimeline). Si no hay voz, el arreglo queda vacío.
+    """
+    regions = detect_speech_regions(samples, sample_rate, **vad_options)
+    gap_samples = int(gap_ms * sample_rate / 1000)
+    timeline = SpeechTimeline(regions, gap_samples, sample_rate, len(samples))
+    if not regions:
+        return np.empty(0, dtype=np.float32), timeline
+    gap = np.zeros(gap_samples, dtype=np.float32)
+    pieces = []
+    for start, end in regions:
+        pieces.append(samples[start:end])
+        pieces.append(gap)
+    return np.concatenate(pieces[:-1]).astype(np.float32, copy=False), timeline
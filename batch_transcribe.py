@@ -0,0 +1,324 @@
+# audio_transcriber_flask_whisper/batch_transcribe.py
+"""
+Transcripción por lotes desde la línea de comandos (trabajos nocturnos).
+
+Uso:
+    python batch_transcribe.py <carpeta_o_manifiesto.csv> <carpeta_salida> [opciones]
+
+El manifiesto es un CSV con encabezado: path,start,end,language
+(start/end en HH:MM:SS, opcionales; language opcional, por defecto --language).
+--output-formats elige los archivos por audio (docx, srt, vtt, json; por defecto docx).
+Los archivos cuyas salidas ya existen se omiten, de modo que relanzar el comando tras una
+caída continúa donde quedó.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+
+import audio_processor
+import transcript_writers
+
+AUDIO_EXTENSIONS = {'wav', 'mp3', 'ogg', 'm4a', 'flac'}
+SUMMARY_JSONL = "summary.jsonl"
+SUMMARY_JSON = "summary.json"
+
+# Modelo del proceso actual (una sola carga por trabajador)
+_whisper_transcriber = None
+
+
+def _init_worker(model_name, torch_threads, interop_threads=None, backend="pytorch"):
+    global _whisper_transcriber
+    import transcriber
+    transcriber.configure_torch_threads(torch_threads, interop_threads)
+    _whisper_transcriber = transcriber.WhisperTranscriber(model_name=model_name, backend=backend)
+
+
+def _transcribe_timed(samples, language):
+    started = time.perf_counter()
+    result = _whisper_transcriber.transcribe_segments(samples, language=language)
+    return result, time.perf_counter() - started
+
+
+def output_name_for(path, root):
+    """
+    Nombre de salida único dentro del lote: la ruta relativa a root sin extensión, con '__' en lugar
+    de los separadores (a/x.mp3 -> a__x). Fuera de root se usa el nombre con un hash corto de la ruta.
+    """
+    try:
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    except ValueError: # Otra unidad (Windows)
+        relative = os.pardir
+    if relative.startswith(os.pardir):
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+        return f"{os.path.splitext(os.path.basename(path))[0]}_{digest}"
+    return os.path.splitext(relative)[0].replace(os.sep, "__")
+
+
+def collect_items(input_path, default_language):
+    """
+    Lista de trabajos {'path', 'name', 'start_ms', 'end_ms', 'language'} desde una carpeta o un
+    manifiesto CSV. name identifica la salida (ver output_name_for).
+    """
+    items = []
+    if os.path.isdir(input_path):
+        for name in sorted(os.listdir(input_path)):
+            if '.' in name and name.rsplit('.', 1)[1].lower() in AUDIO_EXTENSIONS:
+                path = os.path.join(input_path, name)
+                items.append({"path": path, "name": output_name_for(path, input_path), "start_ms": None,
+                              "end_ms": None, "language": default_language})
+        return items
+
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, newline='', encoding='utf-8') as f:
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            path = (row.get("path") or "").strip()
+            if not path:
+                continue
+            start_ms = audio_processor.parse_time_to_ms((row.get("start") or "").strip())
+            end_ms = audio_processor.parse_time_to_ms((row.get("end") or "").strip())
+            if "invalid_format" in (start_ms, end_ms):
+                print(f"Advertencia: línea {line_number} del manifiesto con tiempos inválidos; se omite.")
+                continue
+            path = path if os.path.isabs(path) else os.path.join(base_dir, path)
+            items.append({"path": path, "name": output_name_for(path, base_dir), "start_ms": start_ms, "end_ms": end_ms,
+                          "language": (row.get("language") or "").strip() or default_language})
+    return items
+
+
+def output_base_for(item):
+    name = item.get("name") or os.path.splitext(os.path.basename(item["path"]))[0]
+    if item["start_ms"] is not None or item["end_ms"] is not None:
+        end_label = "fin" if item["end_ms"] is None else f"{item['end_ms'] // 1000}s"
+        name += f"_{(item['start_ms'] or 0) // 1000}s-{end_label}"
+    return name
+
+
+def output_paths_for(item, output_dir, formats):
+    base_name = output_base_for(item)
+    return [os.path.join(output_dir, transcript_writers.output_filename(base_name, extension))
+            for extension in formats]
+
+
+def decode_item(item):
+    started = time.perf_counter()
+    samples = audio_processor.load_slice_as_array(item["path"], start_ms=item["start_ms"], end_ms=item["end_ms"])
+    return samples, time.perf_counter() - started
+
+
+def write_outputs(item, result, output_dir, formats):
+    """
+    Escribe un archivo por formato con los escritores de transcript_writers. Cada escritura es
+    atómica: un archivo final nunca queda a medias tras una caída.
+    """
+    try:
+        transcript_writers.write_outputs(result["segments"], output_dir, output_base_for(item), formats,
+                                         title=os.path.basename(item["path"]))
+        return True
+    except Exception as e:
+        print(f"Error al escribir las salidas de '{item['path']}': {e}")
+        return False
+
+
+def read_previous_records(output_dir):
+    """
+    Último registro de cada archivo en summary.jsonl (todas las ejecuciones del lote), por salidas:
+    un mismo audio puede aparecer con varios recortes.
+    """
+    latest = {}
+    try:
+        with open(os.path.join(output_dir, SUMMARY_JSONL), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # Línea cortada por una caída
+                latest[tuple(record["outputs"])] = record
+    except FileNotFoundError:
+        pass
+    return latest
+
+
+def write_summary(output_dir, records, model_name, workers, decode_workers, wall_s):
+    """
+    Escribe summary.json con los totales del lote y el detalle por archivo. Los archivos omitidos
+    (terminados en una ejecución anterior) aparecen con su registro de summary.jsonl, de modo que
+    tras reanudar el resumen sigue describiendo el lote completo.
+    """
+    previous = read_previous_records(output_dir)
+    batch_records = []
+    for record in records:
+        if record["status"] == "skipped" and tuple(record["outputs"]) in previous:
+            record = dict(previous[tuple(record["outputs"])], resumed=True)
+        batch_records.append(record)
+    processed = [r for r in batch_records if r["status"] == "done"]
+    audio_total = sum(r["audio_seconds"] for r in processed)
+    # El RTF de la ejecución se calcula solo con lo que se procesó en ella
+    run_audio = sum(r["audio_seconds"] for r in processed if not r.get("resumed"))
+    summary = {
+        "model": model_name,
+        "workers": workers,
+        "decode_workers": decode_workers,
+        "files": len(batch_records),
+        "done": len(processed),
+        "failed": sum(1 for r in batch_records if r["status"] == "failed"),
+        "skipped": sum(1 for r in batch_records if r["status"] == "skipped"),
+        "resumed": sum(1 for r in batch_records if r.get("resumed")),
+        "audio_seconds": round(audio_total, 2),
+        "run_audio_seconds": round(run_audio, 2),
+        "wall_seconds": round(wall_s, 2),
+        "real_time_factor": round(wall_s / run_audio, 4) if run_audio else None,
+        "files_detail": batch_records,
+    }
+    with open(os.path.join(output_dir, SUMMARY_JSON), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(f"Lote terminado: {summary['done']} ok ({summary['resumed']} de ejecuciones anteriores), "
+          f"{summary['failed']} con error, {summary['skipped']} omitidos; {summary['run_audio_seconds']}s de audio "
+          f"en {summary['wall_seconds']}s (RTF {summary['real_time_factor']}).")
+    return summary
+
+
+def run_batch(items, output_dir, model_name="base", workers=1, decode_workers=2, torch_threads=None,
+              interop_threads=None, backend="pytorch", output_formats=("docx",)):
+    """
+    Transcribe los items escribiendo un archivo por formato de output_formats en output_dir.
+    La decodificación (FFmpeg, en hilos) de los siguientes archivos se solapa con la inferencia del actual.
+    Con workers > 1 la inferencia corre en procesos, cada uno con su propio modelo cargado una vez.
+    Retorna la lista de registros por archivo.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pending = []
+    records = []
+    for item in items:
+        output_paths = output_paths_for(item, output_dir, output_formats)
+        if all(os.path.exists(path) for path in output_paths):
+            records.append({"path": item["path"], "outputs": output_paths, "status": "skipped"})
+        else:
+            pending.append((item, output_paths))
+    print(f"{len(items)} archivo(s): {len(pending)} por transcribir, {len(items) - len(pending)} ya terminados.")
+    if not pending:
+        write_summary(output_dir, records, model_name, workers, decode_workers, 0.0)
+        return records
+
+    if workers > 1:
+        inference = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker,
+                                        initargs=(model_name, torch_threads, interop_threads, backend))
+    else:
+        _init_worker(model_name, torch_threads, interop_threads, backend) # Un único modelo en este proceso
+        inference = ThreadPoolExecutor(max_workers=1)
+    decoder = ThreadPoolExecutor(max_workers=max(1, decode_workers))
+    summary_log = open(os.path.join(output_dir, SUMMARY_JSONL), "a", encoding="utf-8")
+
+    # Se decodifican por adelantado a lo sumo workers + decode_workers archivos para acotar la memoria
+    prefetch = workers + max(1, decode_workers)
+    queue_iter = iter(pending)
+    decoding = {}
+    running = {}
+    batch_started = time.perf_counter()
+
+    def refill():
+        while len(decoding) + len(running) < prefetch:
+            try:
+                item, output_paths = next(queue_iter)
+            except StopIteration:
+                return
+            decoding[decoder.submit(decode_item, item)] = (item, output_paths)
+
+    try:
+        refill()
+        while decoding or running:
+            done, _ = wait(list(decoding) + list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in decoding:
+                    item, output_paths = decoding.pop(future)
+                    samples, decode_s = future.result()
+                    if isinstance(samples, str):
+                        record = {"path": item["path"], "outputs": output_paths, "status": "failed",
+                                  "error": samples, "decode_seconds": round(decode_s, 3)}
+                        records.append(record)
+                        summary_log.write(json.dumps(record) + "\n")
+                        summary_log.flush()
+                        continue
+                    audio_s = len(samples) / audio_processor.WHISPER_SAMPLE_RATE
+                    inference_future = inference.submit(_transcribe_timed, samples, item["language"])
+                    running[inference_future] = (item, output_paths, decode_s, audio_s)
+                else:
+                    item, output_paths, decode_s, audio_s = running.pop(future)
+                    try:
+                        result, transcribe_s = future.result()
+                    except Exception as e:
+                        result, transcribe_s = None, 0.0
+                        print(f"Error en el trabajador de inferencia para '{item['path']}': {e}")
+                    write_started = time.perf_counter()
+                    ok = bool(result and result["text"]) and write_outputs(item, result, output_dir,
+                                                                           output_formats)
+                    write_s = time.perf_counter() - write_started
+                    total_s = decode_s + transcribe_s + write_s
+                    record = {
+                        "path": item["path"],
+                        "outputs": output_paths,
+                        "status": "done" if ok else "failed",
+                        "language": item["language"],
+                        "audio_seconds": round(audio_s, 2),
+                        "decode_seconds": round(decode_s, 3),
+                        "transcribe_seconds": round(transcribe_s, 3),
+                        "write_seconds": round(write_s, 3),
+                        "real_time_factor": round(total_s / audio_s, 4) if audio_s else None,
+                    }
+                    if not ok:
+                        record["error"] = "transcription_error"
+                    records.append(record)
+                    summary_log.write(json.dumps(record) + "\n")
+                    summary_log.flush()
+                    print(f"[{len(records)}/{len(items)}] {record['status']}: {item['path']} "
+                          f"(RTF {record['real_time_factor']})")
+            refill()
+    finally:
+        decoder.shutdown(wait=True)
+        inference.shutdown(wait=True)
+        summary_log.close()
+
+    write_summary(output_dir, records, model_name, workers, decode_workers,
+                  time.perf_counter() - batch_started)
+    return records
+
+
+def main(argv=None):
+    import transcriber # Registro de backends (incluidos los agregados con register_backend)
+    parser = argparse.ArgumentParser(description="Transcribe por lotes una carpeta o un manifiesto CSV con Whisper.")
+    parser.add_argument("input", help="Carpeta con audios o manifiesto CSV (path,start,end,language).")
+    parser.add_argument("output_dir", help="Carpeta donde se escriben las transcripciones y el resumen.")
+    parser.add_argument("--model", default="base", help="Modelo Whisper (tiny, base, small, medium...).")
+    parser.add_argument("--language", default="es", help="Idioma por defecto.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos de inferencia; cada uno carga el modelo una vez.")
+    parser.add_argument("--decode-workers", type=int, default=2,
+                        help="Hilos que decodifican los siguientes archivos mientras se transcribe.")
+    parser.add_argument("--torch-threads", type=int, default=None, help="Hilos intra-op de torch por trabajador.")
+    parser.add_argument("--interop-threads", type=int, default=None, help="Hilos inter-op de torch por trabajador.")
+    parser.add_argument("--backend", default=transcriber.REFERENCE_BACKEND, choices=sorted(transcriber.MODEL_BACKENDS),
+                        help="Backend de inferencia (int8 y torchscript son solo para CPU).")
+    parser.add_argument("--output-formats", nargs="+", default=["docx"],
+                        choices=sorted(transcript_writers.WRITERS),
+                        help="Formatos de salida por archivo.")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"Error: '{args.input}' no existe.")
+        return 1
+    items = collect_items(args.input, args.language)
+    records = run_batch(items, args.output_dir, model_name=args.model, workers=args.workers,
+                        decode_workers=args.decode_workers, torch_threads=args.torch_threads,
+                        interop_threads=args.interop_threads, backend=args.backend,
+                        output_formats=args.output_formats)
+    return 1 if any(r["status"] == "failed" for r in records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
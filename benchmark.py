@@ -0,0 +1,346 @@
+# audio_transcriber_flask_whisper/benchmark.py
+"""
+Benchmark del pipeline audio -> WAV/arreglo -> Whisper -> DOCX/SRT/VTT/JSON.
+
+Genera audios sintéticos sin conexión (tono, ruido y una señal parecida a la voz), mide cada
+etapa por separado y escribe los resultados en JSON para comparar versiones.
+
+Uso:
+    python benchmark.py --stub                                  # solo etapas de E/S, sin pesos del modelo
+    python benchmark.py --models tiny base --durations 60 600
+    python benchmark.py --stub --compare resultados_anteriores.json
+    python benchmark.py --models base --durations 600 --formats wav --vad   # inferencia con y sin VAD
+    python benchmark.py --models base --backends pytorch int8 --audio grabacion.mp3   # WER contra la referencia
+    python benchmark.py --stub --durations 3600 --output-formats docx srt   # escritores de transcript_writers
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import audio_processor
+import file_handler
+import transcript_writers
+from metrics import current_rss_bytes
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES_FOLDER = os.path.join(APP_ROOT, "bench_fixtures")
+SIGNALS = ("tone", "noise", "speechlike")
+FORMATS = ("wav", "mp3", "flac", "ogg", "m4a")
+FIXTURE_SAMPLE_RATE = 44100
+
+
+# --- Audios sintéticos -------------------------------------------------------
+def synthesize(signal, duration_s, sample_rate=FIXTURE_SAMPLE_RATE, seed=0):
+    """Genera una señal mono float32 en [-1, 1] de duration_s segundos."""
+    rng = np.random.default_rng(seed)
+    # float64: en float32 la fase acumulada pierde precisión en audios de más de unos minutos
+    t = np.arange(int(duration_s * sample_rate), dtype=np.float64) / sample_rate
+    if signal == "tone":
+        return (0.3 * np.sin(2 * np.pi * 440.0 * t)).astype(np.float32)
+    if signal == "noise":
+        return (0.1 * rng.standard_normal(t.size)).astype(np.float32)
+    if signal == "speechlike":
+        # Armónicos de un tono glotal que varía lentamente, con envolvente silábica (~4 Hz)
+        # y pausas de silencio, para que el VAD y los cortes por silencio tengan algo que encontrar.
+        f0 = 120.0 + 30.0 * np.sin(2 * np.pi * 0.3 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+        syllables = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None)
+        pauses = (np.sin(2 * np.pi * 0.1 * t) > -0.5).astype(np.float32)
+        audio = 0.2 * voiced * syllables * pauses + 0.005 * rng.standard_normal(t.size)
+        return audio.astype(np.float32)
+    raise ValueError(f"Señal desconocida: {signal}")
+
+
+def ensure_fixture(fixtures_folder, signal, duration_s, fmt):
+    """Crea (una sola vez) el audio sintético codificado en fmt con FFmpeg y retorna su ruta."""
+    os.makedirs(fixtures_folder, exist_ok=True)
+    path = os.path.join(fixtures_folder, f"{signal}_{int(duration_s)}s.{fmt}")
+    if os.path.exists(path):
+        return path
+    samples = synthesize(signal, duration_s)
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+    codec_args = {"m4a": ["-c:a", "aac"], "ogg": ["-c:a", "libvorbis"]}.get(fmt, [])
+    cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+           "-f", "s16le", "-ar", str(FIXTURE_SAMPLE_RATE), "-ac", "1", "-i", "-"] + codec_args + [path + ".part"]
+    if fmt == "m4a":
+        cmd[-1:-1] = ["-f", "ipod"]
+    else:
+        cmd[-1:-1] = ["-f", fmt]
+    completed = subprocess.run(cmd, input=pcm, stderr=subprocess.PIPE)
+    if completed.returncode != 0 and fmt == "ogg":
+        # Algunas compilaciones de FFmpeg no traen libvorbis: usar el codificador nativo
+        cmd[cmd.index("libvorbis")] = "vorbis"
+        cmd[-1:-1] = ["-strict", "-2"]
+        completed = subprocess.run(cmd, input=pcm, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        file_handler.cleanup_temp_file(path + ".part")
+        raise RuntimeError(f"FFmpeg no pudo generar {path}: {completed.stderr.decode(errors='replace').strip()}")
+    os.replace(path + ".part", path)
+    return path
+
+
+# --- Medición -----------------------------------------------------------------
+class PeakRssSampler:
+    """Muestrea el RSS en un hilo durante una etapa para obtener su pico."""
+    def __init__(self, interval_s=0.01):
+        self.interval_s = interval_s
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = current_rss_bytes()
+            if rss is not None:
+                self.peak = rss if self.peak is None else max(self.peak, rss)
+            self._stop.wait(self.interval_s)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def measure(func, *args, **kwargs):
+    """Ejecuta func midiendo tiempo de pared y pico de RSS. Retorna (resultado, segundos, pico_mb)."""
+    with PeakRssSampler() as sampler:
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - started
+    peak_mb = round(sampler.peak / (1024 * 1024), 1) if sampler.peak else None
+    return result, seconds, peak_mb
+
+
+class StubTranscriber:
+    """Sustituto de WhisperTranscriber que no carga pesos: permite medir solo las etapas de E/S."""
+    model_name = "stub"
+    backend = None
+
+    def transcribe(self, audio, language="es"):
+        result = self.transcribe_segments(audio, language=language)
+        return result["text"]
+
+    def transcribe_segments(self, audio, language="es", time_map=None):
+        # ~150 palabras por minuto en segmentos de 5 s, como los que entrega Whisper
+        seconds = len(audio) / audio_processor.WHISPER_SAMPLE_RATE
+        to_original = time_map or float
+        segments = [{"start": to_original(float(start)), "end": to_original(float(min(seconds, start + 5))),
+                     "text": " ".join(["palabra"] * 12)}
+                    for start in range(0, max(1, int(seconds)), 5)]
+        return {"text": " ".join(s["text"] for s in segments), "segments": segments}
+
+
+# --- Ejecución ----------------------------------------------------------------
+def stage_record(stage, seconds, peak_mb, audio_s, **extra):
+    record = {
+        "stage": stage,
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": peak_mb,
+        "real_time_factor": round(seconds / audio_s, 5) if audio_s else None,
+        "throughput_audio_s_per_s": round(audio_s / seconds, 2) if seconds else None,
+    }
+    record.update(extra)
+    return record
+
+
+def benchmark_fixture(path, audio_s, transcribers, language, include_legacy, include_vad=False,
+                      output_formats=tuple(transcript_writers.WRITERS)):
+    """Mide las etapas del pipeline sobre un audio. Retorna una lista de registros por etapa."""
+    records = []
+    if include_legacy:
+        # Camino anterior: pydub decodifica el archivo completo y exporta un WAV temporal
+        with tempfile.TemporaryDirectory() as temp_dir:
+            wav_path, seconds, peak_mb = measure(audio_processor.load_slice_and_export_to_wav, path, temp_dir)
+            records.append(stage_record("legacy_decode_and_wav_export", seconds, peak_mb, audio_s,
+                                        ok=isinstance(wav_path, str) and wav_path.endswith(".wav")))
+
+    samples, seconds, peak_mb = measure(audio_processor.load_slice_as_array, path)
+    if isinstance(samples, str):
+        records.append(stage_record("decode_to_array", seconds, peak_mb, audio_s, ok=False, error=samples))
+        return records
+    records.append(stage_record("decode_to_array", seconds, peak_mb, audio_s, ok=True))
+
+    if include_vad:
+        (speech_samples, timeline), seconds, peak_mb = measure(audio_processor.compact_speech, samples)
+        records.append(stage_record("vad", seconds, peak_mb, audio_s, ok=True,
+                                    speech_seconds=round(timeline.speech_seconds, 2),
+                                    speech_ratio=round(timeline.speech_ratio, 3)))
+
+    reference_texts = {} # modelo -> texto del backend de referencia (el primero de la lista)
+    for whisper_transcriber in transcribers:
+        result, seconds, peak_mb = measure(whisper_transcriber.transcribe_segments, samples, language=language)
+        text = result["text"] if result else None
+        record = stage_record("transcribe", seconds, peak_mb, audio_s, model=whisper_transcriber.model_name,
+                              backend=whisper_transcriber.backend, ok=bool(text))
+        if whisper_transcriber.model_name not in reference_texts:
+            reference_texts[whisper_transcriber.model_name] = (text, seconds)
+        elif text and reference_texts[whisper_transcriber.model_name][0]:
+            # Modo de verificación: calidad y latencia frente al backend de referencia sobre el mismo audio
+            import transcriber
+            reference_text, reference_seconds = reference_texts[whisper_transcriber.model_name]
+            record["wer_vs_reference"] = round(transcriber.word_error_rate(reference_text, text), 4)
+            record["speedup_vs_reference"] = round(reference_seconds / seconds, 2) if seconds else None
+        records.append(record)
+        if include_vad and len(speech_samples):
+            # Mismo punto de entrada que la etapa transcribe (y que la app), solo sobre las regiones con
+            # voz: el speedup compara la misma inferencia. El RTF se calcula contra el audio original
+            full_seconds = seconds
+            vad_result, seconds, peak_mb = measure(whisper_transcriber.transcribe_segments, speech_samples,
+                                                   language=language, time_map=timeline.to_original)
+            records.append(stage_record("transcribe_vad", seconds, peak_mb, audio_s,
+                                        model=whisper_transcriber.model_name,
+                                        backend=whisper_transcriber.backend,
+                                        ok=bool(vad_result and vad_result["text"]),
+                                        speedup=round(full_seconds / seconds, 2) if seconds else None))
+        if not text:
+            continue
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Los mismos escritores que usa la app, cada formato desde la misma lista de segmentos
+            for extension in output_formats:
+                output_path = os.path.join(temp_dir, transcript_writers.output_filename("bench", extension))
+                written, seconds, peak_mb = measure(transcript_writers.WRITERS[extension].write,
+                                                    result["segments"], output_path, title="bench")
+                records.append(stage_record(f"write_{extension}", seconds, peak_mb, audio_s,
+                                            model=whisper_transcriber.model_name,
+                                            backend=whisper_transcriber.backend, ok=True,
+                                            output_bytes=written, segments=len(result["segments"])))
+            if include_legacy:
+                # Camino anterior: python-docx con el texto continuo
+                docx_path = os.path.join(temp_dir, "legacy.docx")
+                ok, seconds, peak_mb = measure(file_handler.save_to_docx, text, docx_path)
+                records.append(stage_record("legacy_save_to_docx", seconds, peak_mb, audio_s,
+                                            model=whisper_transcriber.model_name,
+                                            backend=whisper_transcriber.backend, ok=ok,
+                                            output_bytes=os.path.getsize(docx_path) if ok else None))
+    return records
+
+
+def git_revision():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_ROOT,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return completed.stdout.decode().strip() or None
+    except OSError:
+        return None
+
+
+def compare_results(previous, current):
+    """Imprime la razón de tiempos actual/anterior por (audio, etapa, modelo)."""
+    def index(results):
+        return {(r["fixture"], r["stage"], r.get("model"), r.get("backend")): r for r in results["results"]}
+    before = index(previous)
+    print(f"\nComparación con {previous.get('revision')} ({previous.get('created_at')}):")
+    for key, record in index(current).items():
+        if key in before and before[key]["seconds"]:
+            ratio = record["seconds"] / before[key]["seconds"]
+            print(f"  {key[0]:<28} {key[1]:<30} {key[2] or '':<8} {key[3] or '':<12} x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapas del pipeline de transcripción.")
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 600],
+                        help="Duraciones en segundos de los audios sintéticos (p. ej. 60 600 3600 7200).")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--signals", nargs="+", default=["speechlike"], choices=SIGNALS)
+    parser.add_argument("--models", nargs="+", default=["base"], help="Modelos Whisper a medir.")
+    parser.add_argument("--backends", nargs="+", default=["pytorch"],
+                        help="Backends de inferencia a medir (pytorch, int8, torchscript). El primero es la "
+                             "referencia: los demás reportan WER y aceleración frente a él.")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="Hilos intra-op de torch.")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="Hilos inter-op de torch.")
+    parser.add_argument("--audio", nargs="+", default=[],
+                        help="Grabaciones reales a medir además de los audios sintéticos (útiles para el WER).")
+    parser.add_argument("--stub", action="store_true", help="Usar un transcriptor falso (sin pesos del modelo).")
+    parser.add_argument("--language", default="es")
+    parser.add_argument("--legacy", action="store_true",
+                        help="Medir también los caminos anteriores: pydub + WAV temporal y DOCX con python-docx.")
+    parser.add_argument("--output-formats", nargs="+", default=list(transcript_writers.WRITERS),
+                        choices=sorted(transcript_writers.WRITERS),
+                        help="Formatos de salida a medir (escritores de transcript_writers).")
+    parser.add_argument("--vad", action="store_true",
+                        help="Medir también el VAD y la inferencia sobre solo las regiones con voz.")
+    parser.add_argument("--fixtures-folder", default=DEFAULT_FIXTURES_FOLDER)
+    parser.add_argument("--output", default="benchmark_results.json", help="Archivo JSON de resultados.")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar.")
+    args = parser.parse_args(argv)
+
+    model_loads = []
+    if args.stub:
+        transcribers = [StubTranscriber()]
+    else:
+        import transcriber
+        threads = transcriber.configure_torch_threads(args.intra_op_threads, args.inter_op_threads)
+        print(f"Hilos de torch: {threads[0]} intra-op, {threads[1]} inter-op.")
+        transcribers = []
+        for model_name in args.models:
+            for backend in args.backends:
+                whisper_transcriber, seconds, peak_mb = measure(transcriber.WhisperTranscriber,
+                                                                model_name=model_name, backend=backend)
+                weights_mb = round(whisper_transcriber.memory_bytes() / (1024 * 1024), 1)
+                print(f"Modelo '{model_name}' ({backend}) cargado en {seconds:.2f}s "
+                      f"(pico RSS {peak_mb} MB, pesos {weights_mb} MB).")
+                model_loads.append({"model": model_name, "backend": backend, "load_seconds": round(seconds, 3),
+                                    "peak_rss_mb": peak_mb, "weights_mb": weights_mb})
+                transcribers.append(whisper_transcriber)
+
+    fixtures = [] # (ruta, duración, señal, formato)
+    for signal in args.signals:
+        for duration_s in args.durations:
+            for fmt in args.formats:
+                fixtures.append((ensure_fixture(args.fixtures_folder, signal, duration_s, fmt), duration_s, signal, fmt))
+    for path in args.audio:
+        samples = audio_processor.load_slice_as_array(path)
+        if isinstance(samples, str):
+            print(f"Advertencia: no se pudo decodificar '{path}' ({samples}); se omite.")
+            continue
+        fixtures.append((path, len(samples) / audio_processor.WHISPER_SAMPLE_RATE, "recording",
+                         os.path.splitext(path)[1].lstrip(".").lower()))
+
+    results = []
+    for path, duration_s, signal, fmt in fixtures:
+        fixture = os.path.basename(path)
+        print(f"Midiendo {fixture}...")
+        for record in benchmark_fixture(path, duration_s, transcribers, args.language, args.legacy, args.vad,
+                                        output_formats=args.output_formats):
+            record.update(fixture=fixture, signal=signal, format=fmt, audio_seconds=round(duration_s, 2),
+                          file_bytes=os.path.getsize(path))
+            results.append(record)
+            wer = f" WER {record['wer_vs_reference']}" if "wer_vs_reference" in record else ""
+            print(f"  {record['stage']:<30} {record.get('model') or '':<8} {record.get('backend') or '':<12} "
+                  f"{record['seconds']:>9.3f}s RTF {record['real_time_factor']} pico {record['peak_rss_mb']} MB{wer}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stub": args.stub,
+        "models": [t.model_name for t in transcribers],
+        "model_loads": model_loads,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados escritos en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_results(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
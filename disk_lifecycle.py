@@ -0,0 +1,332 @@
+# audio_transcriber_flask_whisper/disk_lifecycle.py
+"""
+Ciclo de vida del espacio en disco: carpetas de trabajo por request (uploads/<id>/ o tmpfs),
+limpieza garantizada al terminar y un proceso de fondo que elimina restos huérfanos, poda las
+salidas (transcriptions_docx/) por antigüedad y cuota, y mide el uso de disco.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+try:
+    import fcntl # No existe en Windows
+except ImportError:
+    fcntl = None
+
+
+def directory_usage(path):
+    """(archivos, bytes) bajo path, recorriendo con os.scandir. Ignora entradas que desaparecen."""
+    files = 0
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        sub_files, sub_bytes = directory_usage(entry.path)
+                        files += sub_files
+                        total += sub_bytes
+                    else:
+                        files += 1
+                        total += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return files, total
+
+
+def _remove_path(path):
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        print(f"Advertencia: No se pudo eliminar '{path}': {e}")
+        return False
+
+
+class ScratchSpace:
+    def __init__(self, disk_root, tmpfs_root=None, tmpfs_max_bytes=0):
+        """
+        Espacio temporal con una carpeta por request/trabajo.
+        Cada carpeta se crea con create() y se elimina completa con release(), de modo que ningún
+        camino (rechazo, acierto de caché, error, trabajo terminado) deja archivos sueltos y dos
+        requests nunca comparten ni listan la misma carpeta.
+        Args:
+            disk_root (str): Carpeta en disco (p. ej. uploads/).
+            tmpfs_root (str): Carpeta en memoria (p. ej. /dev/shm/...); None la desactiva.
+            tmpfs_max_bytes (int): Tamaño declarado máximo para ubicar un request en tmpfs.
+        """
+        self.disk_root = disk_root
+        self.tmpfs_root = tmpfs_root if tmpfs_max_bytes > 0 else None
+        self.tmpfs_max_bytes = int(tmpfs_max_bytes)
+        self._active = {} # id -> carpeta
+        self._lock = threading.Lock()
+        os.makedirs(disk_root, exist_ok=True)
+        if self.tmpfs_root:
+            try:
+                os.makedirs(self.tmpfs_root, exist_ok=True)
+            except OSError as e:
+                print(f"Advertencia: tmpfs no disponible en '{self.tmpfs_root}' ({e}); se usa solo el disco.")
+                self.tmpfs_root = None
+
+    def _use_tmpfs(self, expected_bytes):
+        if not self.tmpfs_root or expected_bytes is None or expected_bytes > self.tmpfs_max_bytes:
+            return False
+        # Dejar margen: tmpfs consume RAM y varios requests pueden escribir a la vez
+        return shutil.disk_usage(self.tmpfs_root).free > 2 * expected_bytes
+
+    def create(self, scratch_id, expected_bytes=None):
+        """Crea y retorna la carpeta de trabajo de scratch_id (en tmpfs si el tamaño esperado cabe)."""
+        root = self.tmpfs_root if self._use_tmpfs(expected_bytes) else self.disk_root
+        path = os.path.join(root, scratch_id)
+        os.makedirs(path)
+        with self._lock:
+            self._active[scratch_id] = path
+        return path
+
+    def release(self, scratch_id):
+        """Elimina la carpeta de trabajo de scratch_id con todo su contenido. Se puede llamar varias veces."""
+        with self._lock:
+            path = self._active.pop(scratch_id, None)
+        if path:
+            _remove_path(path)
+            return
+        # Carpeta creada por otro proceso (frontend web con un broker compartido)
+        for root in filter(None, (self.disk_root, self.tmpfs_root)):
+            candidate = os.path.join(root, os.path.basename(scratch_id))
+            if os.path.isdir(candidate):
+                _remove_path(candidate)
+
+    def detach(self, scratch_id):
+        """Deja de seguir la carpeta de scratch_id sin eliminarla: la libera el proceso que ejecuta el trabajo."""
+        with self._lock:
+            self._active.pop(scratch_id, None)
+
+    def sweep(self, max_age_s, keep_ids=()):
+        """
+        Elimina lo que quedó en las raíces sin un dueño activo y sin cambios hace más de max_age_s
+        (restos de una caída del proceso o archivos de versiones anteriores). keep_ids son carpetas
+        que sigue usando otro proceso (trabajos en espera o en curso en un broker compartido), por
+        antiguas que sean. Retorna la cantidad eliminada.
+        """
+        keep_ids = set(keep_ids)
+        with self._lock:
+            active = set(self._active.values())
+        now = time.time()
+        removed = 0
+        for root in filter(None, (self.disk_root, self.tmpfs_root)):
+            try:
+                entries = list(os.scandir(root))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.path in active or entry.name in keep_ids or entry.name.startswith("."):
+                    continue
+                try:
+                    if now - entry.stat(follow_symlinks=False).st_mtime < max_age_s:
+                        continue
+                except FileNotFoundError:
+                    continue
+                if _remove_path(entry.path):
+                    removed += 1
+        return removed
+
+    def active_count(self):
+        with self._lock:
+            return len(self._active)
+
+    def stats(self):
+        disk_files, disk_bytes = directory_usage(self.disk_root)
+        tmpfs_files, tmpfs_bytes = directory_usage(self.tmpfs_root) if self.tmpfs_root else (0, 0)
+        with self._lock:
+            active = len(self._active)
+        return {"active": active, "disk_root": self.disk_root, "disk_bytes": disk_bytes, "disk_files": disk_files,
+                "tmpfs_root": self.tmpfs_root, "tmpfs_bytes": tmpfs_bytes, "tmpfs_files": tmpfs_files}
+
+
+def prune_outputs(folder, max_age_s=None, max_bytes=None, min_age_s=60, name_pattern=None):
+    """
+    Poda una carpeta de salidas: elimina los archivos más antiguos que max_age_s y luego, del más
+    antiguo al más nuevo, los necesarios para quedar bajo max_bytes. Los archivos con menos de
+    min_age_s (recién escritos o en escritura) nunca se eliminan.
+    Con name_pattern (regex compilada) solo se consideran los archivos cuyo nombre coincide: el resto
+    de la carpeta (p. ej. ejemplos versionados) no se elimina ni cuenta para la cuota.
+    Retorna {'removed_by_age', 'removed_by_quota', 'bytes', 'files'} tras la poda.
+    """
+    now = time.time()
+    entries = [] # (mtime, tamaño, ruta)
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.name.startswith("."): # .gitkeep y similares
+                    continue
+                if name_pattern is not None and not name_pattern.search(entry.name):
+                    continue
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        return {"removed_by_age": 0, "removed_by_quota": 0, "bytes": 0, "files": 0}
+    entries.sort()
+
+    removed_by_age = removed_by_quota = 0
+    kept = []
+    for mtime, size, path in entries:
+        age = now - mtime
+        if max_age_s is not None and age > max(max_age_s, min_age_s) and _remove_path(path):
+            removed_by_age += 1
+        else:
+            kept.append((mtime, size, path))
+
+    total = sum(size for _, size, _ in kept)
+    if max_bytes is not None:
+        remaining = []
+        for mtime, size, path in kept:
+            if total > max_bytes and now - mtime > min_age_s and _remove_path(path):
+                total -= size
+                removed_by_quota += 1
+            else:
+                remaining.append((mtime, size, path))
+        kept = remaining
+    return {"removed_by_age": removed_by_age, "removed_by_quota": removed_by_quota,
+            "bytes": total, "files": len(kept)}
+
+
+class DiskReaper:
+    def __init__(self, scratch, output_folder, output_max_age_s=None, output_max_bytes=None,
+                 scratch_max_age_s=6 * 3600, interval_s=300, extra_folders=None, protected_ids=None,
+                 leader_lock_path=None, output_pattern=None):
+        """
+        Hilo de fondo que cada interval_s segundos limpia el espacio temporal huérfano, poda las
+        salidas por antigüedad/cuota y registra el uso de disco de cada área.
+        Args:
+            scratch (ScratchSpace): Espacio temporal de los requests.
+            output_folder (str): Carpeta de salidas (transcriptions_docx/).
+            output_max_age_s (float): Antigüedad máxima de una salida; None = sin límite.
+            output_max_bytes (int): Cuota de la carpeta de salidas; None = sin límite.
+            scratch_max_age_s (float): Antigüedad a partir de la cual un resto sin dueño se elimina.
+            extra_folders (dict): Otras áreas solo medidas, {nombre: carpeta} (p. ej. el caché).
+            protected_ids (callable): Retorna los ids cuyas carpetas temporales no se deben eliminar
+                                      (trabajos pendientes de la cola); None = solo las de este proceso.
+            leader_lock_path (str): Con varios procesos sobre las mismas carpetas (workers de gunicorn),
+                                    solo limpia el que tiene el flock de este archivo; si ese proceso
+                                    termina, otro lo toma en su siguiente ciclo. Los demás leen el último
+                                    reporte del líder (leader_lock_path + '.json'). None = siempre limpia.
+            output_pattern (re.Pattern): Solo se podan las salidas cuyo nombre coincide (ver prune_outputs).
+        """
+        self.scratch = scratch
+        self.output_folder = output_folder
+        self.output_max_age_s = output_max_age_s
+        self.output_max_bytes = output_max_bytes
+        self.scratch_max_age_s = scratch_max_age_s
+        self.interval_s = interval_s
+        self.extra_folders = dict(extra_folders or {})
+        self.protected_ids = protected_ids
+        self.leader_lock_path = leader_lock_path
+        self.output_pattern = output_pattern
+        self._leader_fd = None
+        self.last_report = None
+        self.totals = {"scratch_removed": 0, "outputs_removed_by_age": 0, "outputs_removed_by_quota": 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        started = time.perf_counter()
+        # Se consulta justo antes de barrer: un trabajo encolado después tiene una carpeta reciente
+        keep_ids = self.protected_ids() if self.protected_ids else ()
+        scratch_removed = self.scratch.sweep(self.scratch_max_age_s, keep_ids=keep_ids)
+        outputs = prune_outputs(self.output_folder, self.output_max_age_s, self.output_max_bytes,
+                                name_pattern=self.output_pattern)
+        self.totals["scratch_removed"] += scratch_removed
+        self.totals["outputs_removed_by_age"] += outputs["removed_by_age"]
+        self.totals["outputs_removed_by_quota"] += outputs["removed_by_quota"]
+
+        scratch_stats = self.scratch.stats()
+        areas = {
+            "scratch_disk": scratch_stats["disk_bytes"],
+            "scratch_tmpfs": scratch_stats["tmpfs_bytes"],
+            "outputs": outputs["bytes"],
+        }
+        for name, folder in self.extra_folders.items():
+            areas[name] = directory_usage(folder)[1]
+        disk = shutil.disk_usage(self.output_folder)
+        self.last_report = {
+            "at": time.time(),
+            "seconds": round(time.perf_counter() - started, 3),
+            "areas_bytes": areas,
+            "active_scratch_dirs": scratch_stats["active"],
+            "output_files": outputs["files"],
+            "output_max_bytes": self.output_max_bytes,
+            "output_max_age_s": self.output_max_age_s,
+            "filesystem_free_bytes": disk.free,
+            "filesystem_total_bytes": disk.total,
+            "removed": dict(self.totals),
+        }
+        if self.leader_lock_path:
+            self._write_shared_report()
+        if scratch_removed or outputs["removed_by_age"] or outputs["removed_by_quota"]:
+            print(f"Limpieza de disco: {scratch_removed} resto(s) temporales, "
+                  f"{outputs['removed_by_age']} salida(s) por antigüedad y "
+                  f"{outputs['removed_by_quota']} por cuota eliminados.")
+        return self.last_report
+
+    def is_leader(self):
+        """True si este proceso es el que limpia (toma el flock sin bloquear si todavía no lo tiene)."""
+        if not self.leader_lock_path or fcntl is None:
+            return True
+        if self._leader_fd is None:
+            fd = os.open(self.leader_lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._leader_fd = fd # Se mantiene abierto: el lock se libera al terminar el proceso
+            print(f"Limpieza de disco a cargo del proceso {os.getpid()}.")
+        return True
+
+    def _write_shared_report(self):
+        path = self.leader_lock_path + ".json"
+        temp_path = path + ".part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.last_report, f)
+        os.replace(temp_path, path)
+
+    def report(self, run_if_missing=True):
+        """Último reporte de uso de disco. Un proceso que no es el líder no limpia: lee el del líder."""
+        if self.is_leader():
+            return self.last_report or (self.run_once() if run_if_missing else None)
+        try:
+            with open(self.leader_lock_path + ".json", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self.is_leader():
+                    self.run_once()
+            except Exception as e:
+                print(f"Advertencia: Error en la limpieza de disco: {e}")
+            self._stop.wait(self.interval_s)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="disk-reaper", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
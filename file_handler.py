@@ -41,4 +41,3 @@ def cleanup_temp_folder(folder_path):
             print(f"Carpeta temporal '{folder_path}' eliminada.")
         except Exception as e:
             print(f"Advertencia: No se pudo eliminar la carpeta temporal '{folder_path}': {e}")
-
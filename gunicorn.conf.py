@@ -0,0 +1,63 @@
+# audio_transcriber_flask_whisper/gunicorn.conf.py
+"""
+Modo de producción con un servidor pre-fork:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+El proceso maestro importa la app (preload_app) y carga los modelos de WHISPER_PRELOAD_MODELS una
+sola vez; los workers se crean con fork y comparten esas páginas de memoria (copy-on-write) en lugar
+de cargar cada uno su copia de los pesos. Los trabajos se coordinan con un broker SQLite compartido,
+de modo que cualquier worker puede responder /status, /stream o /result de cualquier trabajo.
+
+Cada worker usa (núcleos // WEB_WORKERS) hilos de torch salvo que TORCH_INTRA_OP_THREADS lo fije:
+con el valor por defecto de torch (todos los núcleos) N workers compiten por los mismos núcleos.
+
+Cada worker atiende /metrics con sus propias métricas en memoria; METRICS_MULTIPROC_DIR (por
+defecto transcription_jobs/metrics/) las combina para que cualquier worker responda por todo el host,
+incluidos los procesos de inference_worker.py que usen la misma carpeta.
+
+Separar frontends web e inferencia:
+    SERVING_ROLE=web gunicorn -c gunicorn.conf.py app:app       (no carga modelos)
+    python inference_worker.py --processes 2                      (comparten los pesos entre sí)
+"""
+import os
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Se fijan antes de que gunicorn importe la app
+os.environ.setdefault("PREFORK_SERVER", "1")
+os.environ.setdefault("JOB_BROKER", "sqlite:///" + os.path.join(APP_ROOT, "transcription_jobs", "jobs.db"))
+os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(APP_ROOT, "transcription_jobs", "metrics"))
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_WORKERS", 2))
+
+# Reparte los núcleos entre los workers (la app lee TORCH_INTRA_OP_THREADS; OMP_NUM_THREADS acota
+# además los pools de OpenMP/MKL que se crean fuera de torch)
+_threads_per_worker = str(max(1, (os.cpu_count() or 1) // max(1, workers)))
+os.environ.setdefault("TORCH_INTRA_OP_THREADS", _threads_per_worker)
+os.environ.setdefault("OMP_NUM_THREADS", os.environ["TORCH_INTRA_OP_THREADS"])
+# Hilos por worker: cada cliente SSE (/stream) ocupa uno mientras dura su trabajo
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+preload_app = True
+# Las subidas grandes se reciben en streaming; el límite lo aplica la app (MAX_UPLOAD_MB)
+timeout = int(os.environ.get("WEB_TIMEOUT_SECONDS", 300))
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # Las instantáneas de una ejecución anterior no deben sumarse a los contadores de esta
+    import metrics
+    metrics.clear_multiprocess_dir()
+
+
+def when_ready(server):
+    # La app ya está importada (preload_app): congelar el heap antes de crear los workers
+    import app
+    app.prepare_for_fork()
+
+
+def post_fork(server, worker):
+    import app
+    app.start_background_services()
@@ -0,0 +1,84 @@
+# audio_transcriber_flask_whisper/inference_worker.py
+"""
+Procesos de inferencia para el despliegue separado: toman trabajos del broker compartido y
+ejecutan el pipeline completo (decodificación, Whisper, archivos de salida, caché).
+
+Uso:
+    JOB_BROKER=sqlite:///ruta/jobs.db python inference_worker.py [--processes N]
+
+Los frontends (SERVING_ROLE=web) deben usar el mismo JOB_BROKER y ver las mismas carpetas
+uploads/, transcriptions_docx/ y transcription_cache/; con el mismo METRICS_MULTIPROC_DIR
+(por defecto transcription_jobs/metrics/) sus métricas aparecen en el /metrics de los frontends. Con --processes > 1 los modelos se cargan
+una vez en el proceso padre y los hijos comparten los pesos (copy-on-write) tras el fork; cada hijo
+ejecuta TRANSCRIPTION_WORKERS trabajos a la vez.
+"""
+import argparse
+import os
+import signal
+import sys
+import time
+
+
+def _run_child():
+    import app
+    app.start_background_services()
+    app.transcription_queue.run_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesos de inferencia que toman trabajos del broker compartido.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Procesos de inferencia; comparten los pesos de los modelos precargados.")
+    args = parser.parse_args(argv)
+
+    # Fijados antes de importar la app: no inicia hilos al importarse y no atiende HTTP
+    os.environ["SERVING_ROLE"] = "worker"
+    os.environ["PREFORK_SERVER"] = "1"
+    os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                "transcription_jobs", "metrics"))
+    processes = max(1, args.processes)
+    # Los procesos se reparten los núcleos en lugar de usar todos cada uno (ver gunicorn.conf.py)
+    os.environ.setdefault("TORCH_INTRA_OP_THREADS", str(max(1, (os.cpu_count() or 1) // processes)))
+    os.environ.setdefault("OMP_NUM_THREADS", os.environ["TORCH_INTRA_OP_THREADS"])
+    import app
+    if not app.transcription_queue.shared:
+        print("Error: inference_worker.py requiere un broker compartido (p. ej. JOB_BROKER=sqlite:///ruta/jobs.db).")
+        return 1
+
+    if processes == 1:
+        _run_child()
+        return 0
+
+    app.prepare_for_fork()
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_child()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    print(f"{processes} proceso(s) de inferencia iniciados: {children}")
+
+    def _terminate(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _terminate)
+    status = 0
+    try:
+        for pid in children:
+            _, exit_status = os.waitpid(pid, 0)
+            status = status or exit_status
+    except KeyboardInterrupt:
+        _terminate(signal.SIGINT, None)
+        time.sleep(0.5)
+    return 1 if status else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
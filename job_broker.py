@@ -0,0 +1,481 @@
+# audio_transcriber_flask_whisper/job_broker.py
+"""
+Brokers de trabajos intercambiables. Con un broker compartido los frontends web y los procesos de
+inferencia pueden estar separados: los primeros encolan y consultan, los segundos toman trabajos y
+publican su progreso, segmentos y resultado.
+
+    local                      job_queue.JobQueue, en la memoria del proceso (por defecto)
+    sqlite:///ruta/jobs.db     SQLiteJobBroker, compartido por los procesos de un mismo host
+
+Todos exponen la interfaz de JobQueue: submit(), get(), is_full(), active_ids(), stats(), start() y
+register_task().
+Para agregar otro (p. ej. Redis) basta con registrar su fábrica con register_broker().
+"""
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+
+import job_queue
+from job_queue import JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JobError, QueueFullError
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_segments (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+_JOB_COLUMNS = ("id, status, progress, stage, result, error, attempts, version, "
+                "created_at, started_at, finished_at")
+
+
+class BrokerJob:
+    def __init__(self, broker, row):
+        """
+        Vista de un trabajo guardado en el broker, con la misma interfaz que job_queue.Job.
+        Los métodos de escritura (set_progress, add_segment) los usa el proceso que lo ejecuta;
+        los de lectura (segments, wait_for_change) los frontends que lo muestran.
+        """
+        self._broker = broker
+        self._segments = []
+        self._segments_attempt = None # Intento al que pertenecen los segmentos leídos
+        self._last_progress_write = 0.0
+        self._worker = None # Lease del intento en curso; solo lo tiene el proceso que lo ejecuta
+        self._load(row)
+
+    def _load(self, row):
+        (self.id, self.status, self.progress, self.stage, result, self.error, self.attempt, self.version,
+         self.created_at, self.started_at, self.finished_at) = row
+        self.result = json.loads(result) if result else None
+
+    def refresh(self):
+        row = self._broker._fetch_row(self.id)
+        if row is not None:
+            self._load(row)
+        return self
+
+    def set_progress(self, progress, stage=None):
+        """Actualiza el progreso (0.0 - 1.0) y, opcionalmente, la etapa actual."""
+        progress = max(0.0, min(1.0, float(progress)))
+        now = time.time()
+        # Sin cambio de etapa, no escribir más de una vez por segundo ni por menos de un 1 %
+        if stage is None and progress - self.progress < 0.01 and now - self._last_progress_write < 1.0:
+            return
+        self.progress = progress
+        if stage is not None:
+            self.stage = stage
+        self._last_progress_write = now
+        self._broker._update_progress(self.id, self._worker, self.progress, self.stage)
+
+    def add_segment(self, segment):
+        """Publica un segmento transcrito ({'start', 'end', 'text'}) para los clientes en streaming."""
+        self._broker._add_segment(self.id, self._worker, len(self._segments), segment)
+        self._segments.append(segment)
+
+    @property
+    def segments(self):
+        # Un intento nuevo (reencolado tras perder el lease) vuelve a publicar desde el principio
+        if self._segments_attempt != self.attempt:
+            self._segments = []
+            self._segments_attempt = self.attempt
+        # Solo se leen los segmentos que todavía no se conocen
+        self._segments.extend(self._broker._fetch_segments(self.id, len(self._segments)))
+        return self._segments
+
+    def wait_for_change(self, last_version, timeout=None):
+        """Espera (consultando el broker) hasta que version cambie respecto de last_version. Retorna la versión actual."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            version = self._broker._fetch_version(self.id)
+            if version is None or version != last_version:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(self._broker.poll_interval_s)
+        return self.refresh().version
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "stage": self.stage,
+            "attempt": self.attempt,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SQLiteJobBroker:
+    # Los trabajos se comparten con otros procesos a través del archivo SQLite
+    shared = True
+
+    def __init__(self, db_path, num_workers=0, max_queue_size=10, max_finished_jobs=200,
+                 lease_s=120, max_attempts=2, poll_interval_s=0.25, start=True):
+        """
+        Broker de trabajos sobre un archivo SQLite (modo WAL), para varios procesos de un mismo host:
+        frontends que solo encolan (num_workers=0) y procesos de inferencia que toman trabajos.
+        Los argumentos de cada trabajo se guardan como JSON y la función se resuelve por el nombre
+        registrado con register_task(), de modo que el proceso que lo ejecuta puede ser otro.
+        Args:
+            db_path (str): Archivo de la base de datos (se crea si no existe).
+            num_workers (int): Hilos de este proceso que ejecutan trabajos; 0 = solo encolar y consultar.
+            max_queue_size (int): Máximo de trabajos en espera entre todos los procesos.
+            max_finished_jobs (int): Trabajos terminados que se conservan para consultar su resultado.
+            lease_s (float): Sin latido durante este tiempo, un trabajo en curso se considera abandonado
+                             (proceso caído) y se reencola, o se marca fallido tras max_attempts intentos.
+            poll_interval_s (float): Intervalo de consulta de wait_for_change() y de los trabajadores ociosos.
+            start (bool): Iniciar los hilos de inmediato. Con False se inician con start() (p. ej. tras un fork).
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.num_workers = max(0, int(num_workers))
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.max_finished_jobs = max(1, int(max_finished_jobs))
+        self.lease_s = float(lease_s)
+        self.max_attempts = max(1, int(max_attempts))
+        self.poll_interval_s = float(poll_interval_s)
+        self._tasks = {} # nombre -> función
+        self._task_names = {} # función -> nombre
+        self._running = {} # id -> lease de los trabajos en ejecución en este proceso (para el latido)
+        self._running_lock = threading.Lock()
+        self._local = threading.local()
+        self._workers = []
+        self._stop = threading.Event()
+        self._last_reap = 0.0
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Conexión de corta vida: un proceso maestro pre-fork no debe heredar conexiones abiertas
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        conn.close()
+        if start:
+            self.start()
+
+    # --- Conexiones ----------------------------------------------------------
+    def _conn(self):
+        # Una conexión por hilo y por proceso (sqlite3 no admite compartirlas entre procesos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, sql, params=()):
+        return self._conn().execute(sql, params)
+
+    # --- Interfaz de JobQueue ------------------------------------------------
+    def register_task(self, func, name=None):
+        """Registra func para que los procesos que comparten el broker puedan ejecutarla por nombre."""
+        name = name or func.__name__
+        self._tasks[name] = func
+        self._task_names[func] = name
+        return func
+
+    def submit(self, func, *args, job_id=None, **kwargs):
+        """
+        Encola func(job, *args, **kwargs); func debe estar registrada y sus argumentos deben ser
+        serializables como JSON. Retorna el BrokerJob creado. Lanza QueueFullError si la cola está llena.
+        """
+        task = self._task_names.get(func)
+        if task is None:
+            raise ValueError(f"Tarea no registrada en el broker: '{getattr(func, '__name__', func)}'.")
+        job_id = job_id or secrets.token_hex(8)
+        payload = json.dumps({"args": args, "kwargs": kwargs}, ensure_ascii=False)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (JOB_QUEUED,)).fetchone()[0]
+            if queued >= self.max_queue_size:
+                raise QueueFullError(f"La cola de transcripción está llena ({self.max_queue_size} trabajos en espera).")
+            conn.execute("INSERT INTO jobs (id, task, payload, status, stage, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (job_id, task, payload, JOB_QUEUED, "en cola", time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"Trabajo {job_id} encolado ({queued + 1} en espera).")
+        return self.get(job_id)
+
+    def is_full(self):
+        queued = self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (JOB_QUEUED,)).fetchone()[0]
+        return queued >= self.max_queue_size
+
+    def active_ids(self):
+        """Ids de los trabajos en espera o en ejecución en cualquiera de los procesos."""
+        rows = self._conn().execute("SELECT id FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING))
+        return {job_id for (job_id,) in rows}
+
+    def get(self, job_id):
+        row = self._fetch_row(job_id)
+        return BrokerJob(self, row) if row is not None else None
+
+    def stats(self):
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for status, count in self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        counts["workers"] = self.num_workers
+        counts["max_queue_size"] = self.max_queue_size
+        return counts
+
+    def start(self):
+        """Inicia los hilos trabajadores y el latido de los trabajos en curso (una sola vez)."""
+        if self._workers or not self.num_workers:
+            return
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"transcription-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-broker-heartbeat", daemon=True)
+        heartbeat.start()
+        self._workers.append(heartbeat)
+        print(f"Broker SQLite '{self.db_path}': {self.num_workers} trabajador(es) en el proceso {os.getpid()}.")
+
+    def run_forever(self):
+        """Ejecuta trabajos hasta stop() o Ctrl+C (procesos de inferencia dedicados)."""
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- Lectura -------------------------------------------------------------
+    def _fetch_row(self, job_id):
+        return self._conn().execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def _fetch_version(self, job_id):
+        row = self._conn().execute("SELECT version FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def _fetch_segments(self, job_id, from_seq):
+        rows = self._conn().execute("SELECT data FROM job_segments WHERE job_id = ? AND seq >= ? ORDER BY seq",
+                                    (job_id, from_seq))
+        return [json.loads(data) for (data,) in rows]
+
+    # --- Escritura (proceso que ejecuta el trabajo) --------------------------
+    # Cada escritura exige que el intento siga siendo el dueño del trabajo (worker = lease y estado
+    # running): un proceso que perdió el lease (reencolado por falta de latido) no pisa el intento nuevo.
+    def _update_progress(self, job_id, worker, progress, stage):
+        self._write("UPDATE jobs SET progress = ?, stage = ?, heartbeat_at = ?, version = version + 1 "
+                    "WHERE id = ? AND worker = ? AND status = ?",
+                    (progress, stage, time.time(), job_id, worker, JOB_RUNNING))
+
+    def _add_segment(self, job_id, worker, seq, segment):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            owned = conn.execute("UPDATE jobs SET version = version + 1, heartbeat_at = ? "
+                                 "WHERE id = ? AND worker = ? AND status = ?",
+                                 (time.time(), job_id, worker, JOB_RUNNING)).rowcount
+            if owned:
+                conn.execute("INSERT OR REPLACE INTO job_segments (job_id, seq, data) VALUES (?, ?, ?)",
+                             (job_id, seq, json.dumps(segment, ensure_ascii=False)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, job_id, worker, status, result=None, error=None):
+        """Registra el resultado del intento. Retorna False si el intento ya no era el dueño del trabajo."""
+        return self._write(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, progress = CASE WHEN ? THEN 1.0 ELSE progress END, "
+            "stage = CASE WHEN ? THEN 'completado' ELSE stage END, finished_at = ?, version = version + 1 "
+            "WHERE id = ? AND worker = ? AND status = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+             status == JOB_DONE, status == JOB_DONE, time.time(), job_id, worker, JOB_RUNNING)).rowcount > 0
+
+    def _claim(self):
+        """
+        Toma el trabajo en espera más antiguo con un lease propio (host:pid:token, único por intento).
+        Retorna (BrokerJob, tarea, payload) o None.
+        """
+        worker = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id, task, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                               (JOB_QUEUED,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            # Los segmentos publicados pertenecen a un intento: el nuevo empieza sin ninguno
+            conn.execute("DELETE FROM job_segments WHERE job_id = ?", (row[0],))
+            conn.execute("UPDATE jobs SET status = ?, stage = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1, "
+                         "worker = ?, version = version + 1 WHERE id = ?",
+                         (JOB_RUNNING, "procesando", now, now, worker, row[0]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        job = self.get(row[0])
+        job._worker = worker
+        return job, row[1], json.loads(row[2])
+
+    def _reap_abandoned(self):
+        """
+        Reencola (o marca fallidos) los trabajos en curso cuyo proceso dejó de latir. Los segmentos del
+        intento abandonado se descartan: el intento nuevo vuelve a publicarlos desde el principio.
+        """
+        stale_before = time.time() - self.lease_s
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            requeue_ids = [job_id for (job_id,) in conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND heartbeat_at < ? AND attempts < ?",
+                (JOB_RUNNING, stale_before, self.max_attempts))]
+            for job_id in requeue_ids:
+                conn.execute("DELETE FROM job_segments WHERE job_id = ?", (job_id,))
+                conn.execute("UPDATE jobs SET status = ?, stage = 'en cola', progress = 0, worker = NULL, "
+                             "version = version + 1 WHERE id = ?", (JOB_QUEUED, job_id))
+            failed = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, worker = NULL, version = version + 1 "
+                "WHERE status = ? AND heartbeat_at < ?",
+                (JOB_FAILED, "El proceso de transcripción se detuvo inesperadamente.", time.time(),
+                 JOB_RUNNING, stale_before)).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        requeued = len(requeue_ids)
+        if requeued or failed:
+            print(f"Broker: {requeued} trabajo(s) abandonado(s) reencolado(s), {failed} marcado(s) como fallido(s).")
+
+    def _prune_finished(self):
+        """Descarta los trabajos terminados más antiguos (y sus segmentos)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old = [job_id for (job_id,) in conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY finished_at DESC LIMIT -1 OFFSET ?",
+                (JOB_DONE, JOB_FAILED, self.max_finished_jobs))]
+            for job_id in old:
+                conn.execute("DELETE FROM job_segments WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_s / 3):
+            with self._running_lock:
+                running = list(self._running.items())
+            try:
+                for job_id, worker in running:
+                    self._write("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                                (time.time(), job_id, worker, JOB_RUNNING))
+            except sqlite3.Error as e:
+                print(f"Advertencia: No se pudo registrar el latido de los trabajos: {e}")
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - self._last_reap > self.lease_s / 2:
+                    self._last_reap = time.monotonic()
+                    self._reap_abandoned()
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                print(f"Advertencia: Error al consultar el broker de trabajos: {e}")
+                claimed = None
+            if claimed is None:
+                self._stop.wait(self.poll_interval_s)
+                continue
+
+            job, task, payload = claimed
+            with self._running_lock:
+                self._running[job.id] = job._worker
+            try:
+                func = self._tasks.get(task)
+                if func is None:
+                    raise JobError(f"Tarea desconocida para este proceso: '{task}'.")
+                result = func(job, *payload["args"], **payload["kwargs"])
+                status, outcome = JOB_DONE, {"result": result}
+            except JobError as e:
+                status, outcome = JOB_FAILED, {"error": str(e)}
+            except Exception as e:
+                print(f"Error inesperado en el trabajo {job.id}: {e}")
+                status, outcome = JOB_FAILED, {"error": "Error inesperado durante la transcripción."}
+            finally:
+                with self._running_lock:
+                    self._running.pop(job.id, None)
+            if not self._finish(job.id, job._worker, status, **outcome):
+                print(f"Trabajo {job.id}: el lease expiró y otro intento lo tomó; se descarta este resultado.")
+                continue
+            self._prune_finished()
+            print(f"Trabajo {job.id} finalizado con estado '{status}' "
+                  f"en {time.time() - job.started_at:.2f} segundos.")
+
+
+# --- Registro de brokers ------------------------------------------------------
+def _local_broker(location, **options):
+    return job_queue.JobQueue(**options)
+
+
+def _sqlite_broker(location, **options):
+    if not location:
+        raise ValueError("El broker SQLite requiere una ruta: sqlite:///ruta/jobs.db")
+    return SQLiteJobBroker(location, **options)
+
+
+BROKERS = {
+    "local": _local_broker,
+    "sqlite": _sqlite_broker,
+}
+
+
+def register_broker(scheme, factory):
+    """Registra (o reemplaza) la fábrica factory(ubicación, **opciones) del esquema scheme."""
+    BROKERS[scheme] = factory
+
+
+def create_broker(url, **options):
+    """
+    Crea el broker indicado por url ('local' o 'esquema:///ubicación').
+    options se pasan a la fábrica (num_workers, max_queue_size, start...).
+    """
+    scheme, _, location = (url or "local").partition(":")
+    if location.startswith("///"):
+        location = location[3:]
+    factory = BROKERS.get(scheme)
+    if factory is None:
+        raise ValueError(f"Broker de trabajos no soportado: '{url}'. Disponibles: {', '.join(sorted(BROKERS))}.")
+    return factory(location, **options)
@@ -0,0 +1,189 @@
+# audio_transcriber_flask_whisper/job_queue.py
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Estados posibles de un trabajo
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Se lanza cuando la cola alcanzó su profundidad máxima (backpressure)."""
+
+
+class JobError(Exception):
+    """Error esperado dentro de un trabajo; su mensaje se muestra al usuario."""
+
+
+class Job:
+    def __init__(self, func, args, kwargs, job_id=None):
+        self.id = job_id or secrets.token_hex(8)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.stage = "en cola"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.segments = [] # Segmentos ya transcritos, para entrega incremental
+        self.attempt = 1 # Los trabajos locales no se reintentan (ver job_broker)
+        self.version = 0 # Se incrementa con cada cambio observable del trabajo
+        self._changed = threading.Condition()
+
+    def _notify(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def set_progress(self, progress, stage=None):
+        """Actualiza el progreso (0.0 - 1.0) y, opcionalmente, la etapa actual."""
+        self.progress = max(0.0, min(1.0, float(progress)))
+        if stage is not None:
+            self.stage = stage
+        self._notify()
+
+    def add_segment(self, segment):
+        """Publica un segmento transcrito ({'start', 'end', 'text'}) para los clientes en streaming."""
+        self.segments.append(segment)
+        self._notify()
+
+    def wait_for_change(self, last_version, timeout=None):
+        """Bloquea hasta que version cambie respecto de last_version (o venza timeout). Retorna la versión actual."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != last_version, timeout=timeout)
+            return self.version
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "stage": self.stage,
+            "attempt": self.attempt,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    # Los trabajos viven en la memoria de este proceso (ver job_broker para un broker compartido)
+    shared = False
+
+    def __init__(self, num_workers=2, max_queue_size=10, max_finished_jobs=200, start=True):
+        """
+        Cola de trabajos con un pool acotado de hilos trabajadores.
+        Args:
+            num_workers (int): Cantidad de hilos que ejecutan trabajos en paralelo.
+            max_queue_size (int): Máximo de trabajos en espera. Al superarlo, submit() lanza QueueFullError.
+            max_finished_jobs (int): Cantidad de trabajos terminados que se conservan para consultar su resultado.
+            start (bool): Iniciar los hilos de inmediato. Con False se inician con start() (p. ej. tras un fork).
+        """
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.max_finished_jobs = max(1, int(max_finished_jobs))
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = []
+        if start:
+            self.start()
+
+    def start(self):
+        """Inicia los hilos trabajadores (una sola vez)."""
+        if self._workers:
+            return
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"transcription-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"Cola de trabajos iniciada con {self.num_workers} trabajador(es) y profundidad máxima {self.max_queue_size}.")
+
+    def register_task(self, func, name=None):
+        """Los trabajos locales se ejecutan por referencia; se acepta por compatibilidad con los brokers compartidos."""
+        return func
+
+    def submit(self, func, *args, job_id=None, **kwargs):
+        """
+        Encola func(job, *args, **kwargs). Retorna el Job creado.
+        job_id permite reutilizar un id ya asignado al request (p. ej. para correlacionar registros).
+        Lanza QueueFullError si la cola está llena.
+        """
+        job = Job(func, args, kwargs, job_id=job_id)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(f"La cola de transcripción está llena ({self.max_queue_size} trabajos en espera).")
+            self._jobs[job.id] = job
+        print(f"Trabajo {job.id} encolado ({self._queue.qsize()} en espera).")
+        return job
+
+    def is_full(self):
+        return self._queue.full()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_ids(self):
+        """Ids de los trabajos en espera o en ejecución."""
+        with self._lock:
+            return {job_id for job_id, job in self._jobs.items() if job.status in (JOB_QUEUED, JOB_RUNNING)}
+
+    def stats(self):
+        with self._lock:
+            counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts["workers"] = self.num_workers
+        counts["max_queue_size"] = self.max_queue_size
+        return counts
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            job.stage = "procesando"
+            job._notify()
+            try:
+                job.result = job.func(job, *job.args, **job.kwargs)
+                job.set_progress(1.0, "completado")
+                job.status = JOB_DONE
+            except JobError as e:
+                job.error = str(e)
+                job.status = JOB_FAILED
+            except Exception as e:
+                print(f"Error inesperado en el trabajo {job.id}: {e}")
+                job.error = "Error inesperado durante la transcripción."
+                job.status = JOB_FAILED
+            finally:
+                job.finished_at = time.time()
+                job.func = job.args = job.kwargs = None  # Liberar referencias
+                job._notify()
+                self._queue.task_done()
+                self._prune_finished()
+                print(f"Trabajo {job.id} finalizado con estado '{job.status}' "
+                      f"en {job.finished_at - job.started_at:.2f} segundos.")
+
+    def _prune_finished(self):
+        """Descarta los trabajos terminados más antiguos para no acumular resultados en memoria."""
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.status in (JOB_DONE, JOB_FAILED)]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self._jobs[job_id]
@@ -0,0 +1,489 @@
+# audio_transcriber_flask_whisper/metrics.py
+"""
+Instrumentación por etapa del pipeline y exportación en formato de texto de Prometheus.
+
+    with metrics.stage("decode", request_id=job.id) as s:
+        ...
+        s.audio_seconds = 12.5
+        s.bytes_read = 1024
+
+Con METRICS_ENABLED=0 (o metrics.set_enabled(False)) stage() retorna un contexto vacío
+compartido, de modo que la instrumentación no cuesta casi nada.
+
+Varios procesos (workers de gunicorn, inference_worker.py): con METRICS_MULTIPROC_DIR cada proceso
+escribe una instantánea de sus métricas en esa carpeta (start_snapshot_writer()) y render_latest()
+las combina, de modo que /metrics muestra el total del host y no solo el del worker que respondió.
+Solo cuentan los procesos vivos: la instantánea de un proceso terminado se elimina al leerlas (sus
+contadores desaparecen del total, como un reinicio del contador para Prometheus). Los contadores e
+histogramas se suman; los gauges se muestran por proceso con la etiqueta pid, salvo los de
+multiprocess_mode="local", que calcula el proceso que responde.
+"""
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource # No existe en Windows
+except ImportError:
+    resource = None
+
+try:
+    import psutil # Opcional; sin él se lee /proc en Linux
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger("transcription.metrics")
+
+_enabled = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Intervalo de muestreo del RSS mientras hay etapas en curso (pico por etapa)
+RSS_SAMPLE_INTERVAL_S = float(os.environ.get("METRICS_RSS_SAMPLE_INTERVAL_MS", 50)) / 1000.0
+MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR") or None
+SNAPSHOT_INTERVAL_S = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL_SECONDS", 5))
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def is_enabled():
+    return _enabled
+
+
+_psutil_process = None
+
+
+def current_rss_bytes():
+    """Memoria residente actual del proceso (psutil si está disponible, /proc en Linux)."""
+    global _psutil_process
+    if psutil is not None:
+        if _psutil_process is None or _psutil_process.pid != os.getpid(): # Nuevo proceso tras un fork
+            _psutil_process = psutil.Process()
+        return _psutil_process.memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    """Pico de memoria residente del proceso desde su inicio (None si la plataforma no lo expone)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Linux lo reporta en KiB
+
+
+# --- Tipos de métricas -------------------------------------------------------
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, snapshots):
+        """Combina las instantáneas [(pid, {nombre: valores})] de los procesos. Retorna {clave: valor}."""
+        merged = {}
+        for _, metrics in snapshots:
+            for key, value in metrics.get(self.name, ()):
+                key = tuple(key)
+                merged[key] = self._combine(merged[key], value) if key in merged else value
+        return merged
+
+    def _combine(self, total, value):
+        return total + value
+
+    def render(self, values=None, label_names=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.extend(self._render_value(key, value, label_names or self.label_names))
+        return lines
+
+    def _render_value(self, key, value, label_names):
+        return [f"{self.name}{_format_labels(label_names, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Fija el total acumulado cuando el conteo lo lleva otro componente (p. ej. el caché)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, label_names=(), multiprocess_mode="all"):
+        """
+        multiprocess_mode (con METRICS_MULTIPROC_DIR): "all" muestra el valor de cada proceso vivo con
+        la etiqueta pid; "local" solo el del proceso que responde (valores que este calcula al exportar).
+        """
+        super().__init__(name, documentation, label_names)
+        self.multiprocess_mode = multiprocess_mode
+
+    def merge(self, snapshots):
+        merged = {}
+        for pid, metrics in snapshots:
+            for key, value in metrics.get(self.name, ()):
+                merged[tuple(key) + (str(pid),)] = value
+        return merged
+
+    def render(self, values=None, label_names=None):
+        if values is not None and self.multiprocess_mode == "all":
+            label_names = self.label_names + ("pid",)
+        return super().render(values, label_names)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), {"counts": list(state["counts"]), "sum": state["sum"], "count": state["count"]}]
+                    for key, state in self._values.items()]
+
+    def _combine(self, total, state):
+        return {"counts": [a + b for a, b in zip(total["counts"], state["counts"])],
+                "sum": total["sum"] + state["sum"], "count": total["count"] + state["count"]}
+
+    def _render_value(self, key, state, label_names):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            labels = _format_labels(label_names, key, [("le", repr(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(label_names, key, [("le", "+Inf")])
+        lines.append(f"{self.name}_bucket{labels} {state['count']}")
+        plain = _format_labels(label_names, key)
+        lines.append(f"{self.name}_sum{plain} {state['sum']}")
+        lines.append(f"{self.name}_count{plain} {state['count']}")
+        return lines
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram("transcription_stage_duration_seconds",
+                          "Duración de cada etapa del pipeline.", ("stage", "model"))
+STAGE_RTF = Histogram("transcription_stage_real_time_factor",
+                      "Segundos de cómputo por segundo de audio en cada etapa.", ("stage", "model"), RTF_BUCKETS)
+STAGE_ERRORS = Counter("transcription_stage_errors_total", "Etapas que terminaron con excepción.", ("stage",))
+AUDIO_SECONDS = Counter("transcription_audio_seconds_total", "Segundos de audio procesados por etapa.", ("stage",))
+BYTES_READ = Counter("transcription_bytes_read_total", "Bytes leídos por etapa.", ("stage",))
+BYTES_WRITTEN = Counter("transcription_bytes_written_total", "Bytes escritos por etapa.", ("stage",))
+STAGE_PEAK_RSS = Gauge("transcription_stage_peak_rss_bytes",
+                       "Pico de memoria residente del proceso durante la última ejecución de cada etapa.", ("stage",))
+PEAK_RSS = Gauge("transcription_process_peak_rss_bytes", "Pico de memoria residente del proceso.")
+
+
+# --- Etapas ------------------------------------------------------------------
+class _RssSampler:
+    """
+    Un único hilo que, mientras haya etapas en curso, muestrea el RSS del proceso y actualiza el
+    pico de cada una. Sin etapas en curso queda dormido. El RSS es del proceso: con etapas
+    concurrentes, el pico de cada una incluye la memoria de las demás.
+    """
+    def __init__(self, interval_s):
+        self.interval_s = interval_s
+        self._active = set()
+        self._changed = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def add(self, stage):
+        with self._changed:
+            self._active.add(stage)
+            if self._thread is None or self._pid != os.getpid(): # Los hilos no sobreviven a un fork
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="metrics-rss-sampler", daemon=True)
+                self._thread.start()
+            self._changed.notify()
+
+    def remove(self, stage):
+        with self._changed:
+            self._active.discard(stage)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._active)
+                active = list(self._active)
+            rss = current_rss_bytes()
+            if rss is None:
+                return
+            for stage in active:
+                stage.observe_rss(rss)
+            time.sleep(self.interval_s)
+
+
+_rss_sampler = _RssSampler(RSS_SAMPLE_INTERVAL_S)
+
+
+class _NoopStage:
+    """Contexto vacío usado cuando la instrumentación está desactivada."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass # Ignorar audio_seconds, bytes_read, etc.
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    def __init__(self, name, request_id, model):
+        self.name = name
+        self.request_id = request_id
+        self.model = model
+        self.audio_seconds = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.peak_rss = None
+
+    def observe_rss(self, rss):
+        if self.peak_rss is None or rss > self.peak_rss:
+            self.peak_rss = rss
+
+    def __enter__(self):
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.observe_rss(rss)
+            _rss_sampler.add(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._started
+        _rss_sampler.remove(self)
+        labels = {"stage": self.name, "model": self.model or ""}
+        STAGE_SECONDS.observe(seconds, **labels)
+        rtf = None
+        if self.audio_seconds:
+            rtf = seconds / self.audio_seconds
+            STAGE_RTF.observe(rtf, **labels)
+            AUDIO_SECONDS.inc(self.audio_seconds, stage=self.name)
+        if self.bytes_read:
+            BYTES_READ.inc(self.bytes_read, stage=self.name)
+        if self.bytes_written:
+            BYTES_WRITTEN.inc(self.bytes_written, stage=self.name)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.name)
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.observe_rss(rss)
+            STAGE_PEAK_RSS.set(self.peak_rss, stage=self.name)
+        log_event(self.request_id, "stage", stage=self.name, model=self.model,
+                  seconds=round(seconds, 4), audio_seconds=self.audio_seconds,
+                  real_time_factor=round(rtf, 4) if rtf is not None else None,
+                  bytes_read=self.bytes_read, bytes_written=self.bytes_written,
+                  rss_bytes=rss, peak_rss_bytes=self.peak_rss, error=exc_type.__name__ if exc_type else None)
+        return False
+
+
+def stage(name, request_id=None, model=None):
+    """Context manager que mide una etapa del pipeline."""
+    if not _enabled:
+        return _NOOP_STAGE
+    return _Stage(name, request_id, model)
+
+
+def log_event(request_id, event, **fields):
+    """Registro estructurado (JSON en una línea) etiquetado con el id del request."""
+    if not _enabled or not logger.isEnabledFor(logging.INFO):
+        return
+    record = {"ts": round(time.time(), 3), "request_id": request_id, "event": event}
+    record.update((key, value) for key, value in fields.items() if value is not None)
+    logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def configure_logging(level=logging.INFO):
+    """Envía los registros estructurados a stderr, una línea JSON por evento."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+
+
+# --- Recolección y varios procesos -------------------------------------------
+_collectors = []
+
+
+def add_collector(func):
+    """Registra func(), que actualiza gauges del proceso antes de cada exportación o instantánea."""
+    _collectors.append(func)
+    return func
+
+
+def _collect():
+    peak = peak_rss_bytes()
+    if peak is not None:
+        PEAK_RSS.set(peak)
+    for func in _collectors:
+        try:
+            func()
+        except Exception as e:
+            print(f"Advertencia: Error al recolectar métricas: {e}")
+
+
+def write_snapshot():
+    """Escribe (de forma atómica) la instantánea de este proceso en METRICS_MULTIPROC_DIR."""
+    if not MULTIPROC_DIR:
+        return
+    _collect()
+    path = os.path.join(MULTIPROC_DIR, f"metrics_{os.getpid()}.json")
+    temp_path = path + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({metric.name: metric.snapshot() for metric in REGISTRY}, f)
+    os.replace(temp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_snapshots():
+    """
+    Instantáneas de los procesos vivos: [(pid, {nombre: valores})]. Las de procesos terminados
+    (p. ej. un inference_worker.py detenido o un worker reciclado) se eliminan.
+    """
+    snapshots = []
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "metrics_*.json")):
+        try:
+            pid = int(os.path.basename(path)[len("metrics_"):-len(".json")])
+        except ValueError:
+            continue # Archivo ajeno
+        if not _pid_alive(pid):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append((pid, json.load(f)))
+        except (OSError, ValueError):
+            continue # Reemplazado mientras se leía
+    return snapshots
+
+
+def clear_multiprocess_dir():
+    """Descarta las instantáneas de una ejecución anterior (llamar al iniciar el servidor, antes de los workers)."""
+    if not MULTIPROC_DIR:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "metrics_*.json*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL_S)
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(f"Advertencia: No se pudo escribir la instantánea de métricas: {e}")
+
+
+def start_snapshot_writer():
+    """Con METRICS_MULTIPROC_DIR, inicia el hilo que publica las métricas de este proceso (una vez por proceso)."""
+    if not MULTIPROC_DIR or not _enabled:
+        return None
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    write_snapshot()
+    thread = threading.Thread(target=_snapshot_loop, name="metrics-snapshot-writer", daemon=True)
+    thread.start()
+    return thread
+
+
+def render_latest():
+    """Todas las métricas en formato de exposición de texto de Prometheus."""
+    lines = []
+    if MULTIPROC_DIR:
+        write_snapshot()
+        snapshots = read_snapshots()
+        for metric in REGISTRY:
+            if getattr(metric, "multiprocess_mode", None) == "local":
+                lines.extend(metric.render())
+            else:
+                lines.extend(metric.render(metric.merge(snapshots)))
+    else:
+        _collect()
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,137 @@
+# audio_transcriber_flask_whisper/model_registry.py
+import threading
+import time
+from collections import OrderedDict, deque
+
+import transcriber
+
+
+class ModelRegistry:
+    def __init__(self, allowed_models, max_resident_models=2, memory_budget_mb=None,
+                 backend=transcriber.REFERENCE_BACKEND):
+        """
+        Registro de modelos Whisper cargados bajo demanda.
+        Los modelos se cargan en su primer uso y se mantienen residentes en orden LRU;
+        al superar max_resident_models o memory_budget_mb se descarta el menos usado.
+        Un modelo descartado mientras un trabajo lo usa se libera cuando ese trabajo termina.
+        Args:
+            allowed_models (iterable): Nombres de modelos que se pueden pedir (e.g., "tiny", "base").
+            max_resident_models (int): Cantidad máxima de modelos residentes a la vez.
+            memory_budget_mb (int): Presupuesto de memoria para los pesos; None = sin límite.
+            backend (str): Backend de inferencia con el que se cargan los modelos (ver transcriber.MODEL_BACKENDS).
+        """
+        if backend not in transcriber.MODEL_BACKENDS:
+            raise ValueError(f"Backend de inferencia desconocido: '{backend}' "
+                             f"(disponibles: {', '.join(sorted(transcriber.MODEL_BACKENDS))}).")
+        self.allowed_models = list(allowed_models)
+        self.backend = backend
+        self.max_resident_models = max(1, int(max_resident_models))
+        self.memory_budget_bytes = None if memory_budget_mb is None else int(memory_budget_mb) * 1024 * 1024
+        self._models = OrderedDict() # model_name -> WhisperTranscriber, del menos al más usado
+        self._usage = {} # model_name -> {"uses": int, "last_used": float}
+        self._load_locks = {name: threading.Lock() for name in self.allowed_models}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        self.load_history = deque(maxlen=20) # (model_name, segundos) de las últimas cargas
+
+    def is_allowed(self, model_name):
+        return model_name in self._load_locks
+
+    def get(self, model_name):
+        """
+        Retorna el WhisperTranscriber de model_name, cargándolo si no está residente.
+        Lanza ValueError si el modelo no está permitido y re-lanza los errores de carga.
+        """
+        if not self.is_allowed(model_name):
+            raise ValueError(f"Modelo Whisper no permitido: '{model_name}'.")
+
+        with self._lock:
+            whisper_transcriber = self._touch(model_name)
+        if whisper_transcriber is not None:
+            return whisper_transcriber
+
+        # Un lock por modelo: dos requests que piden el mismo modelo no lo cargan dos veces,
+        # pero la carga de un modelo no bloquea a quienes usan otros ya residentes.
+        with self._load_locks[model_name]:
+            with self._lock:
+                whisper_transcriber = self._touch(model_name)
+            if whisper_transcriber is not None:
+                return whisper_transcriber
+
+            whisper_transcriber = transcriber.WhisperTranscriber(model_name=model_name, backend=self.backend)
+            with self._lock:
+                self._models[model_name] = whisper_transcriber
+                self._usage[model_name] = {"uses": 1, "last_used": time.time()}
+                self.loads += 1
+                self.load_history.append((model_name, round(whisper_transcriber.load_seconds, 3)))
+                self._evict_locked(keep=model_name)
+            return whisper_transcriber
+
+    def _touch(self, model_name):
+        whisper_transcriber = self._models.get(model_name)
+        if whisper_transcriber is not None:
+            self._models.move_to_end(model_name)
+            usage = self._usage[model_name]
+            usage["uses"] += 1
+            usage["last_used"] = time.time()
+        return whisper_transcriber
+
+    def _resident_bytes_locked(self):
+        return sum(t.memory_bytes() for t in self._models.values())
+
+    def _evict_locked(self, keep):
+        while len(self._models) > 1:
+            over_count = len(self._models) > self.max_resident_models
+            over_budget = self.memory_budget_bytes is not None and \
+                self._resident_bytes_locked() > self.memory_budget_bytes
+            if not (over_count or over_budget):
+                break
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            del self._models[oldest]
+            self.evictions += 1
+            print(f"Modelo Whisper '{oldest}' descartado de memoria (LRU).")
+
+    def preload(self, model_names, background=True):
+        """
+        Carga modelos (pool caliente). En segundo plano por defecto, sin bloquear el arranque del servidor;
+        con background=False se cargan en el hilo actual, p. ej. en el proceso maestro de un servidor
+        pre-fork, antes de crear los procesos hijos que comparten los pesos.
+        """
+        def _load_all():
+            for model_name in model_names:
+                try:
+                    self.get(model_name)
+                except Exception as e:
+                    print(f"Advertencia: No se pudo precargar el modelo '{model_name}': {e}")
+        if not background:
+            _load_all()
+            return None
+        thread = threading.Thread(target=_load_all, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            resident = []
+            for model_name, whisper_transcriber in reversed(self._models.items()):
+                usage = self._usage[model_name]
+                resident.append({
+                    "model": model_name,
+                    "load_seconds": round(whisper_transcriber.load_seconds, 3),
+                    "memory_mb": round(whisper_transcriber.memory_bytes() / (1024 * 1024), 1),
+                    "uses": usage["uses"],
+                    "last_used": usage["last_used"],
+                })
+            return {
+                "allowed_models": self.allowed_models,
+                "backend": self.backend,
+                "resident": resident,
+                "max_resident_models": self.max_resident_models,
+                "memory_budget_mb": None if self.memory_budget_bytes is None else self.memory_budget_bytes // (1024 * 1024),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "load_history": list(self.load_history),
+            }
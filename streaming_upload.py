@@ -0,0 +1,160 @@
+# audio_transcriber_flask_whisper/streaming_upload.py
+import hashlib
+import os
+import secrets
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+
+import file_handler
+
+READ_CHUNK_SIZE = 256 * 1024
+HEADER_PROBE_BYTES = 12 # Suficiente para reconocer las firmas de los contenedores soportados
+MAX_FIELD_BYTES = 4 * 1024
+
+
+class UploadRejected(Exception):
+    """Subida rechazada durante la recepción. code es un código de error como los de audio_processor."""
+    def __init__(self, code, messages=None):
+        super().__init__(code)
+        self.code = code
+        self.messages = messages or []
+
+
+def detect_container(header):
+    """
+    Reconoce el contenedor de audio a partir de los primeros bytes del archivo.
+    Retorna 'wav', 'mp3', 'ogg', 'flac', 'm4a' o None si no es un formato soportado.
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[:3] == b"ID3" or (len(header) >= 2 and header[0] == 0xFF and (header[1] & 0xE0) == 0xE0):
+        return "mp3" # Etiqueta ID3 o sincronismo de trama MPEG
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[4:8] == b"ftyp":
+        return "m4a" # Contenedor ISO/MP4 (m4a, mp4)
+    return None
+
+
+def receive_upload(stream, content_type, upload_folder, max_bytes, allowed_extensions,
+                   file_field="audio_file", validate_fields=None):
+    """
+    Recibe un multipart/form-data leyendo el cuerpo del request por bloques, sin pasar por
+    request.files (que primero guarda el cuerpo completo en un archivo temporal).
+    - Los campos de texto que llegan antes del archivo se validan con validate_fields(fields)
+      antes de leer el archivo; debe retornar una lista de mensajes de error.
+    - La extensión y la firma del contenedor se verifican con los primeros bytes.
+    - El archivo se escribe en upload_folder calculando su SHA-256 y cortando al superar max_bytes.
+    Retorna un dict con 'fields', 'original_filename', 'path', 'sha256', 'bytes' y 'container'.
+    Lanza UploadRejected; en ese caso no queda ningún archivo parcial en disco.
+    """
+    mimetype, options = parse_options_header(content_type or "")
+    boundary = options.get("boundary", "").encode("ascii")
+    if mimetype != "multipart/form-data" or not boundary:
+        raise UploadRejected("malformed_request")
+
+    decoder = MultipartDecoder(boundary)
+    fields = {}
+    upload = None
+    current = None # ("field", nombre, [bloques]) o ("file", None, None)
+    header = b""
+    output = None
+    output_path = None
+    sha256 = hashlib.sha256()
+    total_bytes = 0
+
+    def start_writing(data):
+        nonlocal output, output_path
+        container = detect_container(header)
+        if container is None:
+            raise UploadRejected("unsupported_format")
+        upload["container"] = container
+        _, f_ext = os.path.splitext(upload["original_filename"])
+        output_path = os.path.join(upload_folder, secrets.token_hex(8) + f_ext)
+        output = open(output_path, "wb")
+        write(data)
+
+    def write(data):
+        nonlocal total_bytes
+        total_bytes += len(data)
+        if total_bytes > max_bytes:
+            raise UploadRejected("file_too_large")
+        sha256.update(data)
+        output.write(data)
+
+    try:
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    current = ("field", event.name, [])
+                elif isinstance(event, File):
+                    if event.name != file_field or upload is not None:
+                        raise UploadRejected("malformed_request")
+                    if validate_fields:
+                        errors = validate_fields(fields)
+                        if errors:
+                            raise UploadRejected("invalid_fields", errors)
+                    if not event.filename:
+                        raise UploadRejected("no_file")
+                    original_filename = secure_filename(event.filename)
+                    extension = original_filename.rsplit(".", 1)[-1].lower() if "." in original_filename else ""
+                    if extension not in allowed_extensions:
+                        raise UploadRejected("file_type_not_allowed")
+                    upload = {"original_filename": original_filename}
+                    current = ("file", None, None)
+                elif isinstance(event, Data):
+                    if current[0] == "field":
+                        current[2].append(event.data)
+                        if sum(len(part) for part in current[2]) > MAX_FIELD_BYTES:
+                            raise UploadRejected("malformed_request")
+                        if not event.more_data:
+                            fields[current[1]] = b"".join(current[2]).decode("utf-8", errors="replace")
+                    elif output is not None:
+                        write(event.data)
+                    else:
+                        # Acumular hasta tener la cabecera para identificar el contenedor
+                        header += event.data
+                        if len(header) >= HEADER_PROBE_BYTES:
+                            start_writing(header)
+                        elif not event.more_data and header:
+                            start_writing(header) # Archivo más corto que la cabecera
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+
+        if upload is None:
+            raise UploadRejected("no_file")
+        if output is None:
+            raise UploadRejected("empty_file")
+        # Campos que llegaron después del archivo
+        if validate_fields:
+            errors = validate_fields(fields)
+            if errors:
+                raise UploadRejected("invalid_fields", errors)
+    except ValueError as e:
+        # MultipartDecoder lanza ValueError ante cuerpos mal formados o truncados
+        if output is not None:
+            output.close()
+            file_handler.cleanup_temp_file(output_path)
+        print(f"Subida rechazada: cuerpo multipart inválido ({e}).")
+        raise UploadRejected("malformed_request")
+    except Exception as e:
+        if output is not None:
+            output.close()
+            file_handler.cleanup_temp_file(output_path)
+        if isinstance(e, UploadRejected):
+            print(f"Subida rechazada tempranamente: {e.code} (tras {total_bytes} bytes escritos).")
+        raise
+    finally:
+        if output is not None and not output.closed:
+            output.close()
+
+    upload.update(fields=fields, path=output_path, sha256=sha256.hexdigest(), bytes=total_bytes)
+    return upload
@@ -0,0 +1,103 @@
+# audio_transcriber_flask_whisper/test_audio_processor.py
+import numpy as np
+import pytest
+
+from audio_processor import SpeechTimeline, compact_speech, detect_speech_regions
+
+SR = 16000
+FRAME = int(SR * 30 / 1000) # Trama por defecto del VAD (30 ms)
+PAD = int(SR * 200 / 1000) # Margen por defecto de cada región (200 ms)
+
+
+def silence(seconds, rng):
+    return (rng.standard_normal(int(seconds * SR)) * 1e-4).astype(np.float32)
+
+
+def voiced(seconds):
+    # Armónicos de 200 Hz dentro de la banda de voz: energía alta, espectro poco plano
+    t = np.arange(int(seconds * SR)) / SR
+    return (0.1 * sum(np.sin(2 * np.pi * 200 * k * t) for k in range(2, 8))).astype(np.float32)
+
+
+def build(*parts):
+    rng = np.random.default_rng(0)
+    return np.concatenate([voiced(seconds) if kind == "voz" else silence(seconds, rng) for kind, seconds in parts])
+
+
+def test_detects_speech_regions_with_padding():
+    samples = build(("silencio", 2), ("voz", 2), ("silencio", 2), ("voz", 1), ("silencio", 1))
+    regions = detect_speech_regions(samples)
+    assert len(regions) == 2
+    for (start, end), (expected_start, expected_end) in zip(regions, [(2 * SR, 4 * SR), (6 * SR, 7 * SR)]):
+        assert abs(start - (expected_start - PAD)) <= FRAME
+        assert abs(end - (expected_end + PAD)) <= FRAME
+
+
+def test_short_pauses_are_filled_and_short_blips_dropped():
+    # Pausa de 300 ms (< min_silence_ms) dentro de una intervención y un chasquido de 90 ms
+    samples = build(("silencio", 1), ("voz", 1), ("silencio", 0.3), ("voz", 1), ("silencio", 2),
+                    ("voz", 0.09), ("silencio", 1))
+    regions = detect_speech_regions(samples)
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert abs(start - (SR - PAD)) <= FRAME
+    assert abs(end - (int(3.3 * SR) + PAD)) <= FRAME
+
+
+def test_hum_and_broadband_noise_are_not_speech():
+    rng = np.random.default_rng(1)
+    t = np.arange(3 * SR) / SR
+    hum = (0.3 * np.sin(2 * np.pi * 50 * t)).astype(np.float32)
+    hiss = (rng.standard_normal(3 * SR) * 0.3).astype(np.float32)
+    quiet = silence(1, rng)
+    assert detect_speech_regions(np.concatenate([quiet, hum, quiet])) == []
+    assert detect_speech_regions(np.concatenate([quiet, hiss, quiet])) == []
+    assert detect_speech_regions(np.zeros(0, dtype=np.float32)) == []
+
+
+def test_compact_speech_keeps_regions_separated_by_gaps():
+    samples = build(("silencio", 2), ("voz", 2), ("silencio", 2), ("voz", 1), ("silencio", 1))
+    regions = detect_speech_regions(samples)
+    compact, timeline = compact_speech(samples, gap_ms=300)
+    gap = int(0.3 * SR)
+    lengths = [end - start for start, end in regions]
+    assert len(compact) == sum(lengths) + gap
+    (s1, e1), (s2, e2) = regions
+    np.testing.assert_array_equal(compact[:lengths[0]], samples[s1:e1])
+    np.testing.assert_array_equal(compact[lengths[0]:lengths[0] + gap], 0)
+    np.testing.assert_array_equal(compact[lengths[0] + gap:], samples[s2:e2])
+    assert timeline.speech_seconds == pytest.approx(sum(lengths) / SR)
+    assert timeline.speech_ratio == pytest.approx(sum(lengths) / len(samples))
+
+
+def test_compact_speech_without_speech_is_empty():
+    samples = build(("silencio", 2))
+    compact, timeline = compact_speech(samples)
+    assert len(compact) == 0
+    assert timeline.speech_ratio == 0.0
+    assert timeline.to_original(1.25) == 1.25
+
+
+def test_timeline_maps_compact_seconds_to_original_sample_exactly():
+    regions = [(16000, 48000), (80000, 96000), (160000, 161600)] # 1-3 s, 5-6 s, 10-10.1 s
+    gap = 4800 # 0.3 s
+    timeline = SpeechTimeline(regions, gap, SR, 176000)
+    # Inicio de cada región en el audio compactado -> inicio exacto en el original
+    assert timeline.to_original(0.0) == pytest.approx(1.0)
+    assert timeline.to_original((32000 + gap) / SR) == pytest.approx(5.0)
+    assert timeline.to_original((32000 + 16000 + 2 * gap) / SR) == pytest.approx(10.0)
+    # Dentro de una región se conserva el desplazamiento
+    assert timeline.to_original(0.5) == pytest.approx(1.5)
+    assert timeline.to_original((32000 + gap) / SR + 0.25) == pytest.approx(5.25)
+    # Una muestra antes del inicio de la región 2 cae en el silencio agregado: se fija al final de la región 1
+    assert timeline.to_original((32000 + gap - 1) / SR) == pytest.approx(3.0)
+    assert timeline.to_original(2.0) == pytest.approx(3.0)
+    # Más allá del final se fija al final de la última región
+    assert timeline.to_original(100.0) == pytest.approx(10.1)
+    assert timeline.speech_seconds == pytest.approx(3.1)
+
+
+def test_timeline_is_monotonic():
+    timeline = SpeechTimeline([(8000, 24000), (40000, 56000)], 4800, SR, 64000)
+    mapped = [timeline.to_original(seconds) for seconds in np.linspace(0, 3, 301)]
+    assert all(b >= a for a, b in zip(mapped, mapped[1:]))
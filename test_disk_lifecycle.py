@@ -0,0 +1,39 @@
+# audio_transcriber_flask_whisper/test_disk_lifecycle.py
+import os
+import re
+import time
+
+from disk_lifecycle import prune_outputs
+
+GENERATED = re.compile(r"_[0-9a-f]{16}_transcripcion\.[A-Za-z0-9]+$")
+
+
+def write(folder, name, size, age_s):
+    path = folder / name
+    path.write_bytes(b"x" * size)
+    old = time.time() - age_s
+    os.utime(path, (old, old))
+
+
+def test_prune_outputs_only_touches_generated_files(tmp_path):
+    write(tmp_path, "C-224-2025_transcripcion.docx", 500, 10 * 86400) # Ejemplo versionado
+    write(tmp_path, "notas.txt", 500, 10 * 86400)
+    write(tmp_path, "audio_0123456789abcdef_transcripcion.docx", 100, 10 * 86400)
+    write(tmp_path, "audio_fedcba9876543210_transcripcion.srt", 100, 3600)
+    write(tmp_path, "audio_00112233aabbccdd_transcripcion.vtt", 100, 1800)
+    write(tmp_path, "audio_aabbccdd00112233_transcripcion.json", 100, 10) # Recién escrito
+
+    result = prune_outputs(str(tmp_path), max_age_s=86400, max_bytes=150, name_pattern=GENERATED)
+    assert result == {"removed_by_age": 1, "removed_by_quota": 2, "bytes": 100, "files": 1}
+    assert sorted(os.listdir(tmp_path)) == [
+        "C-224-2025_transcripcion.docx",
+        "audio_aabbccdd00112233_transcripcion.json",
+        "notas.txt",
+    ]
+
+
+def test_prune_outputs_without_pattern_considers_every_file(tmp_path):
+    write(tmp_path, "notas.txt", 500, 10 * 86400)
+    write(tmp_path, ".gitkeep", 0, 10 * 86400)
+    assert prune_outputs(str(tmp_path), max_age_s=86400)["removed_by_age"] == 1
+    assert os.listdir(tmp_path) == [".gitkeep"]
@@ -0,0 +1,136 @@
+# audio_transcriber_flask_whisper/test_job_broker.py
+import os
+import time
+
+import pytest
+
+import job_broker
+from disk_lifecycle import ScratchSpace
+from job_queue import JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, QueueFullError
+
+
+def transcribe_task(job, path):
+    return {"path": path}
+
+
+@pytest.fixture
+def broker(tmp_path):
+    broker = job_broker.SQLiteJobBroker(str(tmp_path / "jobs.db"), num_workers=0, lease_s=60,
+                                        max_attempts=2, start=False)
+    broker.register_task(transcribe_task)
+    return broker
+
+
+def expire_lease(broker, job_id):
+    # Simula un proceso caído: su último latido es anterior al lease
+    broker._write("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - broker.lease_s - 1, job_id))
+
+
+def test_claim_and_finish(broker):
+    job = broker.submit(transcribe_task, "a.wav", job_id="job1")
+    assert job.status == JOB_QUEUED
+    claimed, task, payload = broker._claim()
+    assert (claimed.id, task, payload["args"]) == ("job1", "transcribe_task", ["a.wav"])
+    assert broker.get("job1").status == JOB_RUNNING
+    assert broker._claim() is None
+    assert broker._finish("job1", claimed._worker, JOB_DONE, result={"path": "a.wav"})
+    done = broker.get("job1")
+    assert (done.status, done.result, done.progress) == (JOB_DONE, {"path": "a.wav"}, 1.0)
+    assert broker.active_ids() == set()
+
+
+def test_queue_full(tmp_path):
+    broker = job_broker.SQLiteJobBroker(str(tmp_path / "jobs.db"), max_queue_size=1, start=False)
+    broker.register_task(transcribe_task)
+    broker.submit(transcribe_task, "a.wav")
+    assert broker.is_full()
+    with pytest.raises(QueueFullError):
+        broker.submit(transcribe_task, "b.wav")
+
+
+def test_abandoned_job_is_requeued_without_its_segments(broker):
+    broker.submit(transcribe_task, "a.wav", job_id="job1")
+    job, _, _ = broker._claim()
+    job.add_segment({"start": 0.0, "end": 1.0, "text": "hola"})
+    job.set_progress(0.5, "transcribiendo")
+    assert len(broker.get("job1").segments) == 1
+
+    expire_lease(broker, "job1")
+    broker._reap_abandoned()
+    requeued = broker.get("job1")
+    assert (requeued.status, requeued.progress) == (JOB_QUEUED, 0)
+    assert requeued.segments == []
+    assert broker.active_ids() == {"job1"}
+
+    retry, _, _ = broker._claim()
+    retry.add_segment({"start": 0.0, "end": 1.5, "text": "hola mundo"})
+    assert [s["text"] for s in broker.get("job1").segments] == ["hola mundo"]
+
+
+def test_reader_restarts_segments_when_the_attempt_changes(broker):
+    broker.submit(transcribe_task, "a.wav", job_id="job1")
+    first, _, _ = broker._claim()
+    first.add_segment({"start": 0.0, "end": 1.0, "text": "uno"})
+    first.add_segment({"start": 1.0, "end": 2.0, "text": "dos"})
+    reader = broker.get("job1") # Como /stream en otro proceso
+    assert [s["text"] for s in reader.segments] == ["uno", "dos"]
+
+    expire_lease(broker, "job1")
+    broker._reap_abandoned()
+    retry, _, _ = broker._claim()
+    retry.add_segment({"start": 0.0, "end": 1.2, "text": "uno bis"})
+    reader.refresh()
+    assert reader.attempt == 2
+    assert [s["text"] for s in reader.segments] == ["uno bis"]
+
+
+def test_job_fails_after_max_attempts(broker):
+    broker.submit(transcribe_task, "a.wav", job_id="job1")
+    for _ in range(broker.max_attempts):
+        assert broker._claim() is not None
+        expire_lease(broker, "job1")
+        broker._reap_abandoned()
+    failed = broker.get("job1")
+    assert failed.status == JOB_FAILED
+    assert failed.error
+    assert broker._claim() is None
+
+
+def test_stale_attempt_cannot_overwrite_the_new_one(broker):
+    broker.submit(transcribe_task, "a.wav", job_id="job1")
+    stale, _, _ = broker._claim()
+    expire_lease(broker, "job1")
+    broker._reap_abandoned()
+    current, _, _ = broker._claim()
+    assert current._worker != stale._worker
+
+    # El intento viejo termina tarde: no publica segmentos, progreso ni resultado
+    stale.add_segment({"start": 0.0, "end": 1.0, "text": "viejo"})
+    stale.set_progress(0.9, "generando archivos")
+    assert not broker._finish("job1", stale._worker, JOB_FAILED, error="viejo")
+    job = broker.get("job1")
+    assert (job.status, job.stage, job.segments) == (JOB_RUNNING, "procesando", [])
+
+    assert broker._finish("job1", current._worker, JOB_DONE, result={"path": "a.wav"})
+    assert broker.get("job1").status == JOB_DONE
+
+
+def test_finished_job_is_not_reaped(broker):
+    broker.submit(transcribe_task, "a.wav", job_id="job1")
+    job, _, _ = broker._claim()
+    broker._finish("job1", job._worker, JOB_DONE, result={})
+    expire_lease(broker, "job1")
+    broker._reap_abandoned()
+    assert broker.get("job1").status == JOB_DONE
+
+
+def test_sweep_keeps_scratch_of_pending_jobs(broker, tmp_path):
+    scratch = ScratchSpace(str(tmp_path / "uploads"))
+    broker.submit(transcribe_task, "a.wav", job_id="job1")
+    for scratch_id in ("job1", "orphan"):
+        scratch.create(scratch_id)
+        scratch.detach(scratch_id) # Como un frontend web: la libera el proceso que ejecute el trabajo
+        old = time.time() - 3600
+        os.utime(os.path.join(scratch.disk_root, scratch_id), (old, old))
+    assert scratch.sweep(60, keep_ids=broker.active_ids()) == 1
+    assert os.listdir(scratch.disk_root) == ["job1"]
@@ -0,0 +1,108 @@
+# audio_transcriber_flask_whisper/test_streaming_upload.py
+import io
+import os
+
+import pytest
+
+import streaming_upload
+from streaming_upload import UploadRejected, receive_upload
+
+BOUNDARY = "----limite-de-prueba"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+WAV_HEADER = b"RIFF\x24\x00\x00\x00WAVEfmt "
+ALLOWED = {"wav", "mp3"}
+
+
+def field_part(name, value):
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode()
+
+
+def file_part(content, filename="audio.wav", name="audio_file"):
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + content + b"\r\n"
+
+
+def body(*parts):
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def receive(raw, tmp_path, max_bytes=1024 * 1024, validate_fields=None):
+    return receive_upload(io.BytesIO(raw), CONTENT_TYPE, str(tmp_path), max_bytes, ALLOWED,
+                          validate_fields=validate_fields)
+
+
+def test_receives_fields_and_file(tmp_path):
+    content = WAV_HEADER + b"\x00" * 100
+    upload = receive(body(field_part("model", "tiny"), file_part(content)), tmp_path)
+    assert upload["fields"] == {"model": "tiny"}
+    assert upload["container"] == "wav"
+    assert upload["bytes"] == len(content)
+    with open(upload["path"], "rb") as f:
+        assert f.read() == content
+
+
+def test_truncated_body_is_rejected_without_partial_file(tmp_path):
+    raw = body(file_part(WAV_HEADER + b"\x00" * 5000))
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(raw[:len(raw) // 2], tmp_path)
+    assert excinfo.value.code == "malformed_request"
+    assert os.listdir(tmp_path) == []
+    # Archivo completo pero sin el límite de cierre
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(file_part(WAV_HEADER + b"\x00" * 100), tmp_path)
+    assert excinfo.value.code == "malformed_request"
+    assert os.listdir(tmp_path) == []
+
+
+def test_size_limit_stops_writing_and_removes_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming_upload, "READ_CHUNK_SIZE", 1024)
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(body(file_part(WAV_HEADER + b"\x00" * 10_000)), tmp_path, max_bytes=4096)
+    assert excinfo.value.code == "file_too_large"
+    assert os.listdir(tmp_path) == []
+
+
+def test_fields_after_the_file_are_validated(tmp_path):
+    seen = []
+
+    def validate(fields):
+        seen.append(dict(fields))
+        return ["Modelo no disponible."] if fields.get("model") == "enorme" else []
+
+    raw = body(file_part(WAV_HEADER + b"\x00" * 100), field_part("model", "enorme"))
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(raw, tmp_path, validate_fields=validate)
+    assert excinfo.value.code == "invalid_fields"
+    assert excinfo.value.messages == ["Modelo no disponible."]
+    assert seen == [{}, {"model": "enorme"}] # Antes del archivo (sin campos) y al final
+    assert os.listdir(tmp_path) == []
+
+
+def test_invalid_fields_before_the_file_reject_without_writing(tmp_path):
+    raw = body(field_part("model", "enorme"), file_part(WAV_HEADER + b"\x00" * 100))
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(raw, tmp_path, validate_fields=lambda fields: ["Modelo no disponible."])
+    assert excinfo.value.code == "invalid_fields"
+    assert os.listdir(tmp_path) == []
+
+
+def test_content_not_matching_a_supported_container_is_rejected(tmp_path):
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(body(file_part(b"<html>no es audio</html>")), tmp_path)
+    assert excinfo.value.code == "unsupported_format"
+    assert os.listdir(tmp_path) == []
+
+
+def test_disallowed_extension_and_missing_file(tmp_path):
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(body(file_part(WAV_HEADER, filename="audio.exe")), tmp_path)
+    assert excinfo.value.code == "file_type_not_allowed"
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(body(field_part("model", "tiny")), tmp_path)
+    assert excinfo.value.code == "no_file"
+
+
+def test_empty_file_is_rejected(tmp_path):
+    with pytest.raises(UploadRejected) as excinfo:
+        receive(body(file_part(b"")), tmp_path)
+    assert excinfo.value.code == "empty_file"
@@ -0,0 +1,86 @@
+# audio_transcriber_flask_whisper/test_transcriber.py
+import numpy as np
+import pytest
+
+from audio_processor import WHISPER_SAMPLE_RATE as SR, find_chunk_boundaries
+from transcriber import merge_chunk_segments, merge_chunk_texts
+
+
+def tone(seconds, freq=440.0):
+    t = np.arange(int(seconds * SR)) / SR
+    return (0.3 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def test_merge_chunk_texts_drops_repeated_words():
+    assert merge_chunk_texts(["el contrato se firmó", "Se firmó ayer en Lima"]) == "el contrato se firmó ayer en Lima"
+    assert merge_chunk_texts(["uno dos tres", "", "cuatro cinco"]) == "uno dos tres cuatro cinco"
+    # Solo se compara hasta max_overlap_words palabras
+    assert merge_chunk_texts(["a b c", "a b c d"], max_overlap_words=2) == "a b c a b c d"
+
+
+def test_merge_chunk_segments_trims_partial_overlap():
+    segments, covered = merge_chunk_segments(
+        [(0.0, 2.0, "hola mundo"), (2.0, 4.0, "esto es una prueba")], offset_s=0.0, covered_until=0.0)
+    assert [s["text"] for s in segments] == ["hola mundo", "esto es una prueba"]
+    assert covered == 4.0
+
+    # El siguiente fragmento empieza 1 s antes del fin del anterior
+    segments, covered = merge_chunk_segments(
+        [(0.0, 0.8, "una prueba"), (0.5, 2.5, "prueba de hoy"), (2.5, 4.0, "fin")],
+        offset_s=3.0, covered_until=covered, previous_text="esto es una prueba")
+    assert segments == [
+        {"start": 4.0, "end": 5.5, "text": "de hoy"},
+        {"start": 5.5, "end": 7.0, "text": "fin"},
+    ]
+    assert covered == 7.0
+
+
+def test_merge_chunk_segments_drops_fully_covered_and_empty():
+    segments, covered = merge_chunk_segments(
+        [(0.0, 1.0, "ya dicho"), (0.5, 2.2, "mitad"), (2.0, 3.0, "")], offset_s=10.0, covered_until=12.0,
+        previous_text="ya dicho mitad")
+    assert segments == []
+    assert covered == 12.0
+
+
+def test_merge_chunk_segments_applies_time_map():
+    segments, _ = merge_chunk_segments([(0.0, 1.0, "hola")], offset_s=2.0, covered_until=0.0,
+                                       time_map=lambda seconds: seconds + 10.0)
+    assert segments == [{"start": 12.0, "end": 13.0, "text": "hola"}]
+
+
+def assert_covers(boundaries, total, overlap):
+    assert boundaries[0][0] == 0
+    assert boundaries[-1][1] == total
+    for (_, previous_end), (start, _) in zip(boundaries, boundaries[1:]):
+        # Cada lado de un corte sin silencio se extiende overlap muestras
+        assert previous_end - 2 * overlap <= start <= previous_end
+
+
+@pytest.mark.parametrize("seconds", [29, 61, 200])
+def test_chunks_never_exceed_whisper_window(seconds):
+    # Parámetros elegidos para que ningún fragmento pase de los 30 s que decodifica Whisper
+    search_s, overlap_s = 4.0, 1.0
+    target_s = 30.0 - search_s - 2 * overlap_s - 0.1
+    samples = tone(seconds)
+    boundaries = find_chunk_boundaries(samples, target_chunk_s=target_s, search_window_s=search_s,
+                                       overlap_s=overlap_s)
+    assert all(end - start <= 30 * SR for start, end in boundaries)
+    assert_covers(boundaries, len(samples), int(overlap_s * SR))
+
+
+def test_chunks_cut_in_silence_without_overlap():
+    # Voz continua con silencios de 1 s en 45 s y 95 s: los cortes caen ahí y no hace falta solapar
+    samples = np.concatenate([tone(45), np.zeros(SR, dtype=np.float32), tone(49),
+                              np.zeros(SR, dtype=np.float32), tone(40)])
+    boundaries = find_chunk_boundaries(samples, target_chunk_s=50.0, search_window_s=10.0, overlap_s=1.0)
+    assert len(boundaries) == 3
+    for (_, end), (start, _), silence_s in zip(boundaries, boundaries[1:], (45, 95)):
+        assert end == start
+        assert silence_s * SR <= start <= (silence_s + 1) * SR
+    assert_covers(boundaries, len(samples), 0)
+
+
+def test_short_audio_is_a_single_chunk():
+    samples = tone(20)
+    assert find_chunk_boundaries(samples, target_chunk_s=15.0, search_window_s=5.0) == [(0, len(samples))]
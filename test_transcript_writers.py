@@ -0,0 +1,86 @@
+# audio_transcriber_flask_whisper/test_transcript_writers.py
+import json
+import os
+
+import pytest
+from docx import Document
+
+import transcript_writers
+from transcript_writers import WRITERS, format_timestamp, write_outputs
+
+SEGMENTS = [
+    {"start": 0.0, "end": 2.5, "text": " Hola, buenos días."},
+    {"start": 2.5, "end": 3661.004, "text": "Audiencia -->\x07 <inicio> & fin"},
+]
+
+
+def test_format_timestamp():
+    assert format_timestamp(0) == "00:00:00.000"
+    assert format_timestamp(3661.004) == "01:01:01.004"
+    assert format_timestamp(59.9996, ",") == "00:01:00,000" # El redondeo pasa al minuto siguiente
+    assert format_timestamp(-0.2, ",") == "00:00:00,000"
+    assert format_timestamp(75.5, always_include_hours=False) == "01:15.500"
+
+
+def test_srt_and_vtt(tmp_path):
+    srt_path = tmp_path / "a.srt"
+    vtt_path = tmp_path / "a.vtt"
+    WRITERS["srt"].write(SEGMENTS, str(srt_path))
+    WRITERS["vtt"].write(SEGMENTS, str(vtt_path))
+    assert srt_path.read_text(encoding="utf-8") == (
+        "1\n00:00:00,000 --> 00:00:02,500\nHola, buenos días.\n\n"
+        "2\n00:00:02,500 --> 01:01:01,004\nAudiencia ->\x07 <inicio> & fin\n\n"
+    )
+    assert vtt_path.read_text(encoding="utf-8") == (
+        "WEBVTT\n\n"
+        "00:00:00.000 --> 00:00:02.500\nHola, buenos días.\n\n"
+        "00:00:02.500 --> 01:01:01.004\nAudiencia ->\x07 <inicio> & fin\n\n"
+    )
+
+
+def test_docx_round_trip(tmp_path):
+    path = tmp_path / "a.docx"
+    WRITERS["docx"].write(SEGMENTS, str(path), title="Transcripción de a.mp3")
+    paragraphs = [p.text for p in Document(str(path)).paragraphs]
+    assert paragraphs == [
+        "Transcripción de a.mp3",
+        "[00:00:00] Hola, buenos días.",
+        "[00:00:02] Audiencia --> <inicio> & fin", # Sin el carácter de control inválido en XML
+    ]
+
+
+def test_json_and_write_outputs(tmp_path):
+    files, total_bytes = write_outputs(SEGMENTS, str(tmp_path / "out"), "a_123", ["json", "srt"], title="a")
+    assert files == {"json": "a_123_transcripcion.json", "srt": "a_123_transcripcion.srt"}
+    assert total_bytes == sum(os.path.getsize(tmp_path / "out" / name) for name in files.values())
+    data = json.loads((tmp_path / "out" / files["json"]).read_text(encoding="utf-8"))
+    assert data["title"] == "a"
+    assert [s["text"] for s in data["segments"]] == ["Hola, buenos días.", "Audiencia -->\x07 <inicio> & fin"]
+
+
+def test_write_is_atomic(tmp_path):
+    path = tmp_path / "a.srt"
+    WRITERS["srt"].write(SEGMENTS, str(path))
+    assert os.listdir(tmp_path) == ["a.srt"]
+    original = path.read_bytes()
+
+    # Un segmento inválido a mitad de la escritura no deja el .part ni toca el archivo publicado
+    with pytest.raises(KeyError):
+        WRITERS["srt"].write(SEGMENTS + [{"start": 4.0}], str(path))
+    assert os.listdir(tmp_path) == ["a.srt"]
+    assert path.read_bytes() == original
+
+
+def test_register_writer(tmp_path):
+    class TxtWriter(transcript_writers.TranscriptWriter):
+        extension = "txt"
+
+        def _write(self, f, segments, title):
+            f.write(" ".join(segment["text"].strip() for segment in segments))
+
+    transcript_writers.register_writer(TxtWriter())
+    try:
+        files, _ = write_outputs(SEGMENTS[:1], str(tmp_path), "a", ["txt"])
+        assert (tmp_path / files["txt"]).read_text(encoding="utf-8") == "Hola, buenos días."
+    finally:
+        del WRITERS["txt"]
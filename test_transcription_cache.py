@@ -0,0 +1,77 @@
+# audio_transcriber_flask_whisper/test_transcription_cache.py
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+import transcription_cache
+from transcription_cache import TranscriptionCache, make_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TranscriptionCache(str(tmp_path / "cache"), max_bytes=10_000)
+
+
+def age(cache, key, seconds):
+    old = time.time() - seconds
+    os.utime(os.path.join(cache.cache_dir, key), (old, old))
+
+
+def test_cache_key_is_stable_and_covers_options():
+    key = make_cache_key("abc", 0, 5000, "base", "es", "vad,batch30")
+    assert key == make_cache_key("abc", 0, 5000, "base", "es", "vad,batch30")
+    variants = {
+        make_cache_key("abc", 0, 5000, "base", "es"),
+        make_cache_key("abc", 0, 5000, "base", "es", "vad"),
+        make_cache_key("abc", 0, 5000, "base", "es", "vad,batch60"),
+        make_cache_key("abc", 0, 5000, "base", "en", "vad,batch30"),
+        make_cache_key("abc", 0, 5000, "small", "es", "vad,batch30"),
+        make_cache_key("abc", 0, 6000, "base", "es", "vad,batch30"),
+        make_cache_key("abd", 0, 5000, "base", "es", "vad,batch30"),
+    }
+    assert key not in variants and len(variants) == 7
+    # Sin opciones la clave es la misma que antes de existir el parámetro
+    assert make_cache_key("abc", 0, 5000, "base", "es") == make_cache_key("abc", 0, 5000, "base", "es", "")
+
+
+def test_put_and_get(cache, tmp_path):
+    docx = tmp_path / "a.docx"
+    docx.write_bytes(b"docx")
+    segments = [{"start": 0.0, "end": 1.0, "text": "hola"}]
+    cache.put("k1", "hola", docx_path=str(docx), segments=segments)
+    entry = cache.get("k1")
+    assert (entry["transcription"], entry["segments"]) == ("hola", segments)
+    with open(entry["docx_path"], "rb") as f:
+        assert f.read() == b"docx"
+    assert cache.get("k2") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert [name for name in os.listdir(cache.cache_dir) if name.startswith(".")] == []
+
+
+def test_lru_eviction_under_byte_budget(cache):
+    text = "x" * 3000 # Cada entrada ocupa ~3 KB más los metadatos
+    for index, key in enumerate(("a", "b", "c")):
+        cache.put(key, text)
+        age(cache, key, 300 - index * 100)
+    assert cache.get("a") is not None # "a" pasa a ser la más reciente; "b" la menos usada
+    cache.put("d", text)
+    assert sorted(os.listdir(cache.cache_dir)) == ["a", "c", "d"]
+    assert cache.evictions == 1
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["bytes"] <= cache.max_bytes
+
+
+def test_entry_evicted_during_get_is_a_miss(cache, monkeypatch):
+    cache.put("k1", "hola", segments=[])
+    real_load = json.load
+
+    def evicted_by_other_process(f):
+        shutil.rmtree(os.path.join(cache.cache_dir, "k1"))
+        return real_load(f)
+
+    monkeypatch.setattr(transcription_cache.json, "load", evicted_by_other_process)
+    assert cache.get("k1") is None
+    assert (cache.hits, cache.misses) == (0, 1)
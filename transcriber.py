@@ -1,20 +1,117 @@
 # audio_transcriber_flask_whisper/transcriber.py
 import whisper # pip install openai-whisper
 import os
+import re
+import unicodedata
+import time
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+
+import audio_processor
+
+# --- Backends de inferencia -------------------------------------------------
+# Un backend es una función load(model_name) que retorna un modelo compatible con whisper
+# (model.transcribe y whisper.decode). "pytorch" es la referencia contra la que se comparan los demás.
+def _load_pytorch(model_name):
+    return whisper.load_model(model_name)
+
+def _as_plain_linear(model):
+    # whisper.model.Linear solo redefine forward() para convertir el dtype de los pesos; en CPU (fp32)
+    # equivale a nn.Linear, y quantize_dynamic solo reconoce nn.Linear por tipo exacto.
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    return model
+
+def _load_int8(model_name):
+    """Pesos de las capas lineales cuantizados a int8 con activaciones dinámicas (solo CPU)."""
+    model = _as_plain_linear(whisper.load_model(model_name, device="cpu"))
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def _load_torchscript(model_name):
+    """
+    Encoder exportado como grafo TorchScript congelado y optimizado para inferencia (solo CPU).
+    El decoder queda en eager: whisper le instala hooks de kv-cache y sus formas cambian por token.
+    """
+    model = _as_plain_linear(whisper.load_model(model_name, device="cpu")).eval()
+    encoder = model.encoder
+    # Los pesos pasan a ser constantes del grafo y dejan de aparecer en state_dict()
+    model.graph_constant_bytes = _tensor_bytes(list(encoder.state_dict().values()))
+    example = torch.zeros(1, model.dims.n_mels, 2 * model.dims.n_audio_ctx)
+    with torch.no_grad():
+        traced = torch.jit.trace(encoder, example, check_trace=False)
+        model.encoder = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        model.encoder(torch.zeros(2, model.dims.n_mels, 2 * model.dims.n_audio_ctx)) # Lotes > 1 (BatchingTranscriber)
+    return model
+
+MODEL_BACKENDS = {
+    "pytorch": _load_pytorch,
+    "int8": _load_int8,
+    "torchscript": _load_torchscript,
+}
+REFERENCE_BACKEND = "pytorch"
+
+def register_backend(name, loader):
+    """Agrega un backend: loader(model_name) -> modelo compatible con whisper."""
+    MODEL_BACKENDS[name] = loader
+
+def _tensor_bytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(v) for v in value) # p. ej. pesos empaquetados de capas cuantizadas
+    return 0
+
+def configure_torch_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Fija los hilos intra-op (dentro de cada operación) e inter-op (entre operaciones) de torch.
+    None o 0 deja el valor por defecto. Debe llamarse antes de la primera inferencia del proceso.
+    """
+    if intra_op_threads:
+        torch.set_num_threads(int(intra_op_threads))
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(int(inter_op_threads))
+        except RuntimeError:
+            pass # Solo se puede fijar antes del primer uso del paralelismo inter-op
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def make_segment(start_s, end_s, text, time_map=None):
+    """Segmento {'start', 'end', 'text'} en segundos; time_map traduce los tiempos al audio original."""
+    if time_map:
+        start_s, end_s = time_map(start_s), time_map(end_s)
+    return {"start": round(start_s, 2), "end": round(end_s, 2), "text": text}
+
 
 class WhisperTranscriber:
-    def __init__(self, model_name="base"):
+    def __init__(self, model_name="base", backend=REFERENCE_BACKEND):
         """
         Inicializa el transcriptor Whisper.
         Args:
             model_name (str): Nombre del modelo Whisper a usar 
                               (e.g., "tiny", "base", "small", "medium", "large").
                               Modelos más grandes son más precisos pero más lentos y consumen más recursos.
+            backend (str): Backend de inferencia de MODEL_BACKENDS ("pytorch", "int8", "torchscript").
         """
-        print(f"Cargando modelo Whisper '{model_name}'...")
+        if backend not in MODEL_BACKENDS:
+            raise ValueError(f"Backend de inferencia desconocido: '{backend}'.")
+        self.model_name = model_name
+        self.backend = backend
+        # Whisper instala hooks de kv-cache en el modelo durante cada decodificación, así que dos
+        # hilos no pueden usar el mismo modelo a la vez; las llamadas al modelo se serializan aquí.
+        self.inference_lock = threading.Lock()
+        print(f"Cargando modelo Whisper '{model_name}' (backend: {backend})...")
         try:
-            self.model = whisper.load_model(model_name)
-            print(f"Modelo Whisper '{model_name}' cargado exitosamente.")
+            started = time.perf_counter()
+            self.model = MODEL_BACKENDS[backend](model_name)
+            self.load_seconds = time.perf_counter() - started
+            print(f"Modelo Whisper '{model_name}' cargado exitosamente en {self.load_seconds:.2f} segundos.")
         except Exception as e:
             print(f"Error al cargar el modelo Whisper '{model_name}': {e}")
             print("Asegúrate de tener PyTorch instalado y de que el nombre del modelo sea correcto.")
@@ -22,27 +119,38 @@ class WhisperTranscriber:
             # Podrías querer re-lanzar la excepción o manejarla de forma que la app no inicie.
             raise  # Re-lanzar para que la aplicación falle si el modelo no carga.
 
-    def transcribe(self, audio_path, language="es"):
+    def memory_bytes(self):
+        """Memoria aproximada que ocupan los pesos del modelo (parámetros, buffers y pesos cuantizados)."""
+        return _tensor_bytes(list(self.model.state_dict().values())) + getattr(self.model, "graph_constant_bytes", 0)
+
+    def transcribe(self, audio, language="es"):
         """
-        Transcribe el archivo de audio usando Whisper.
+        Transcribe el audio usando Whisper.
         Args:
-            audio_path (str): Ruta al archivo de audio (WAV, MP3, etc., Whisper es flexible).
+            audio (str | np.ndarray): Ruta al archivo de audio (WAV, MP3, etc., Whisper es flexible),
+                                      o un arreglo NumPy float32 mono a 16 kHz ya decodificado
+                                      (ver audio_processor.load_slice_as_array).
             language (str): Código del idioma para la transcripción (e.g., "es", "en").
                             Whisper puede auto-detectar, pero especificarlo puede mejorar la precisión.
         Returns:
             str: El texto transcrito, o None si ocurre un error.
         """
-        if not os.path.exists(audio_path):
-            print(f"Error de transcripción: El archivo de audio '{audio_path}' no existe.")
-            return None
+        if isinstance(audio, str):
+            if not os.path.exists(audio):
+                print(f"Error de transcripción: El archivo de audio '{audio}' no existe.")
+                return None
+            audio_description = f"'{audio}'"
+        else:
+            audio_description = f"{len(audio) / whisper.audio.SAMPLE_RATE:.2f}s de audio en memoria"
         
-        print(f"Iniciando transcripción para '{audio_path}' con Whisper (idioma: {language})...")
+        print(f"Iniciando transcripción para {audio_description} con Whisper (idioma: {language})...")
         try:
-            # Whisper puede tomar la ruta del archivo directamente.
+            # Whisper puede tomar la ruta del archivo o un arreglo float32 a 16 kHz directamente.
             # La opción 'fp16=False' puede ser necesaria en CPUs sin soporte para half-precision.
             # Por defecto, Whisper intenta usar fp16 si CUDA está disponible.
-            # result = self.model.transcribe(audio_path, language=language, fp16=False)
-            result = self.model.transcribe(audio_path, language=language)
+            # result = self.model.transcribe(audio, language=language, fp16=False)
+            with self.inference_lock:
+                result = self.model.transcribe(audio, language=language)
             
             transcribed_text = result["text"]
             print("Transcripción completada.")
@@ -50,4 +158,453 @@ class WhisperTranscriber:
             return transcribed_text
         except Exception as e:
             print(f"Error durante la transcripción con Whisper: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def transcribe_segments(self, audio_samples, language="es", on_segment=None, time_map=None):
+        """
+        Igual que transcribe(), pero retorna también los segmentos con marcas de tiempo.
+        La decodificación es la nativa de Whisper (model.transcribe, con su ventana deslizante,
+        el contexto entre ventanas y el respaldo de temperatura), así que el texto es el mismo
+        que el de transcribe().
+        Args:
+            on_segment (callable): Opcional, recibe cada segmento {'start', 'end', 'text'}. Se llama
+                                   al terminar la decodificación, en orden.
+            time_map (callable): Opcional, traduce segundos de audio_samples a segundos del audio
+                                 original (p. ej. SpeechTimeline.to_original tras el VAD).
+        Returns:
+            dict: {'text': str, 'segments': list}, o None si ocurre un error.
+        """
+        to_original = time_map or (lambda seconds: seconds)
+        print(f"Iniciando transcripción con segmentos para {len(audio_samples) / whisper.audio.SAMPLE_RATE:.2f}s "
+              f"de audio en memoria (idioma: {language})...")
+        try:
+            with self.inference_lock:
+                result = self.model.transcribe(audio_samples, language=language)
+        except Exception as e:
+            print(f"Error durante la transcripción con Whisper: {e}")
+            return None
+        segments = []
+        for raw in result["segments"]:
+            text = raw["text"].strip()
+            if not text:
+                continue
+            segment = {"start": round(to_original(raw["start"]), 2), "end": round(to_original(raw["end"]), 2),
+                       "text": text}
+            segments.append(segment)
+            if on_segment:
+                on_segment(segment)
+        print("Transcripción completada.")
+        return {"text": result["text"].strip(), "segments": segments}
+
+# --- Transcripción larga en paralelo ---------------------------------------
+# Cada proceso del pool carga su propio modelo una sola vez (en el initializer).
+_worker_model = None
+
+def _init_chunk_worker(model_name, torch_threads, backend=REFERENCE_BACKEND):
+    global _worker_model
+    configure_torch_threads(torch_threads, 1)
+    _worker_model = MODEL_BACKENDS[backend](model_name)
+    print(f"[pid {os.getpid()}] Modelo '{model_name}' ({backend}) cargado con {torch_threads} hilo(s) de torch.")
+
+def _worker_pid(_):
+    time.sleep(0.05) # Dar tiempo a que cada tarea caiga en un proceso distinto
+    return os.getpid()
+
+def _transcribe_chunk(index, samples, language):
+    result = _worker_model.transcribe(samples, language=language)
+    segments = [(raw["start"], raw["end"], raw["text"].strip()) for raw in result["segments"]]
+    return index, result["text"], segments
+
+
+def _normalize_word(word):
+    # Minúsculas, sin tildes ni puntuación, para comparar palabras entre fragmentos
+    word = unicodedata.normalize("NFKD", word.lower())
+    return re.sub(r"[^\w]", "", "".join(c for c in word if not unicodedata.combining(c)))
+
+def word_error_rate(reference, hypothesis):
+    """
+    WER = (sustituciones + borrados + inserciones) / palabras de la referencia, comparando
+    palabras normalizadas (sin tildes, mayúsculas ni puntuación).
+    """
+    ref = [w for w in map(_normalize_word, reference.split()) if w]
+    hyp = [w for w in map(_normalize_word, hypothesis.split()) if w]
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    # Distancia de Levenshtein por palabras, una fila de la matriz a la vez
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+def merge_chunk_texts(texts, max_overlap_words=25):
+    """
+    Une los textos de fragmentos consecutivos eliminando las palabras repetidas por el solapamiento:
+    busca el sufijo más largo del texto acumulado que coincide con el prefijo del siguiente fragmento.
+    """
+    merged_words = []
+    for text in texts:
+        words = text.split()
+        if not words:
+            continue
+        max_k = min(max_overlap_words, len(merged_words), len(words))
+        overlap = 0
+        for k in range(max_k, 0, -1):
+            tail = [_normalize_word(w) for w in merged_words[-k:]]
+            head = [_normalize_word(w) for w in words[:k]]
+            if tail == head:
+                overlap = k
+                break
+        merged_words.extend(words[overlap:])
+    return " ".join(merged_words)
+
+def merge_chunk_segments(raw_segments, offset_s, covered_until, previous_text="", time_map=None):
+    """
+    Segmentos de un fragmento en tiempos absolutos, sin lo que ya se transcribió al final del fragmento
+    anterior (solapamiento): se descartan los que terminan, o tienen su punto medio, antes de covered_until,
+    y a los que lo cruzan se les recorta el inicio y las palabras repetidas respecto de previous_text.
+    Args:
+        raw_segments (list): Tuplas (inicio, fin, texto) relativas al inicio del fragmento.
+        offset_s (float): Inicio del fragmento en el audio.
+        covered_until (float): Fin del último segmento ya aceptado.
+        previous_text (str): Texto del último segmento aceptado.
+    Returns:
+        tuple: (lista de segmentos, covered_until actualizado).
+    """
+    segments = []
+    for seg_start, seg_end, text in raw_segments:
+        start_s, end_s = offset_s + seg_start, offset_s + seg_end
+        if not text or end_s <= covered_until + 0.05 or (start_s + end_s) / 2 <= covered_until:
+            continue # Vacío, o ya transcrito (en su mayor parte) al final del fragmento anterior
+        if start_s < covered_until:
+            # Solapamiento parcial: quitar las palabras que repiten el final del segmento anterior
+            previous_words = len(previous_text.split())
+            text = " ".join(merge_chunk_texts([previous_text, text]).split()[previous_words:])
+            if not text:
+                continue
+            start_s = covered_until
+        segments.append(make_segment(start_s, end_s, text, time_map))
+        covered_until = end_s
+        previous_text = text
+    return segments, covered_until
+
+
+class ParallelTranscriber:
+    def __init__(self, model_name="base", num_workers=None, torch_threads_per_worker=2,
+                 target_chunk_s=90.0, overlap_s=1.0, backend=REFERENCE_BACKEND):
+        """
+        Transcriptor para audios largos: divide el audio en fragmentos cortados en silencios
+        y los transcribe en paralelo en un pool de procesos, cada uno con su propio modelo.
+        Args:
+            model_name (str): Modelo Whisper que carga cada proceso.
+            num_workers (int): Procesos del pool. Por defecto, núcleos / torch_threads_per_worker.
+            torch_threads_per_worker (int): Hilos intra-op de torch en cada proceso.
+            target_chunk_s (float): Duración aproximada de cada fragmento en segundos.
+            overlap_s (float): Solapamiento usado cuando un corte no cae en silencio.
+            backend (str): Backend de inferencia que usa cada proceso (ver MODEL_BACKENDS).
+        """
+        self.model_name = model_name
+        self.backend = backend
+        self.torch_threads_per_worker = max(1, int(torch_threads_per_worker))
+        if num_workers is None:
+            num_workers = (os.cpu_count() or 1) // self.torch_threads_per_worker
+        self.num_workers = max(1, int(num_workers))
+        self.target_chunk_s = target_chunk_s
+        self.overlap_s = overlap_s
+        self.last_run_stats = None
+        self._executor = None
+
+    def _get_executor(self):
+        # El pool se crea en el primer uso; 'spawn' evita heredar el estado de torch/hilos del padre.
+        if self._executor is None:
+            print(f"Iniciando pool de {self.num_workers} proceso(s) para transcripción larga...")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_chunk_worker,
+                initargs=(self.model_name, self.torch_threads_per_worker, self.backend),
+            )
+        return self._executor
+
+    def warm_up(self, max_rounds=5):
+        """Arranca todos los procesos del pool y espera a que cada uno cargue su modelo."""
+        executor = self._get_executor()
+        ready = set()
+        for _ in range(max_rounds):
+            ready.update(executor.map(_worker_pid, range(self.num_workers)))
+            if len(ready) >= self.num_workers:
+                break
+        return len(ready)
+
+    def transcribe(self, audio_samples, language="es", progress_callback=None):
+        """
+        Transcribe un arreglo float32 mono a 16 kHz dividiéndolo en fragmentos paralelos.
+        Args:
+            progress_callback (callable): Opcional, recibe la fracción (0.0 - 1.0) de fragmentos terminados.
+        Returns:
+            str: El texto transcrito, o None si ocurre un error.
+        """
+        result = self.transcribe_segments(audio_samples, language=language, progress_callback=progress_callback)
+        return result["text"] if result else None
+
+    def transcribe_segments(self, audio_samples, language="es", progress_callback=None, time_map=None):
+        """
+        Igual que transcribe(), pero retorna {'text': str, 'segments': list} (o None si ocurre un error).
+        Los segmentos repetidos por el solapamiento entre fragmentos se descartan o recortan
+        (ver merge_chunk_segments).
+        """
+        started = time.perf_counter()
+        boundaries = audio_processor.find_chunk_boundaries(
+            audio_samples, target_chunk_s=self.target_chunk_s, overlap_s=self.overlap_s)
+        print(f"Transcripción paralela: {len(boundaries)} fragmento(s) en {self.num_workers} proceso(s).")
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(_transcribe_chunk, i, audio_samples[start:end], language)
+                       for i, (start, end) in enumerate(boundaries)]
+            texts = [None] * len(futures)
+            chunk_segments = [None] * len(futures)
+            for done, future in enumerate(as_completed(futures), start=1):
+                index, text, raw_segments = future.result()
+                texts[index] = text
+                chunk_segments[index] = raw_segments
+                if progress_callback:
+                    progress_callback(done / len(futures))
+        except Exception as e:
+            print(f"Error durante la transcripción paralela con Whisper: {e}")
+            return None
+
+        transcribed_text = merge_chunk_texts(texts)
+        segments = []
+        covered_until = 0.0
+        for (start, _), raw_segments in zip(boundaries, chunk_segments):
+            chunk_result, covered_until = merge_chunk_segments(
+                raw_segments, start / audio_processor.WHISPER_SAMPLE_RATE, covered_until,
+                previous_text=segments[-1]["text"] if segments else "", time_map=time_map)
+            segments.extend(chunk_result)
+        wall_s = time.perf_counter() - started
+        audio_s = len(audio_samples) / audio_processor.WHISPER_SAMPLE_RATE
+        self.last_run_stats = {
+            "chunks": len(boundaries),
+            "workers": self.num_workers,
+            "audio_seconds": round(audio_s, 2),
+            "wall_seconds": round(wall_s, 2),
+            "real_time_factor": round(wall_s / audio_s, 4) if audio_s else None,
+        }
+        print(f"Transcripción paralela completada: {self.last_run_stats}")
+        return {"text": transcribed_text, "segments": segments}
+
+    def compare_with_sequential(self, audio_samples, sequential_transcriber, language="es"):
+        """
+        Mide el tiempo de pared del camino secuencial (WhisperTranscriber) frente al paralelo
+        sobre el mismo audio y retorna un informe con la aceleración obtenida.
+        """
+        started = time.perf_counter()
+        sequential_text = sequential_transcriber.transcribe(audio_samples, language=language)
+        sequential_s = time.perf_counter() - started
+
+        self.warm_up() # Excluir del informe el arranque del pool y la carga de modelos
+        started = time.perf_counter()
+        parallel_text = self.transcribe(audio_samples, language=language)
+        parallel_s = time.perf_counter() - started
+
+        return {
+            "audio_seconds": round(len(audio_samples) / audio_processor.WHISPER_SAMPLE_RATE, 2),
+            "workers": self.num_workers,
+            "torch_threads_per_worker": self.torch_threads_per_worker,
+            "chunks": self.last_run_stats["chunks"] if self.last_run_stats else None,
+            "sequential_seconds": round(sequential_s, 2),
+            "parallel_seconds": round(parallel_s, 2),
+            "speedup": round(sequential_s / parallel_s, 2) if parallel_s else None,
+            "sequential_words": len((sequential_text or "").split()),
+            "parallel_words": len((parallel_text or "").split()),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# --- Inferencia por lotes ---------------------------------------------------
+class _PendingWindow:
+    """Ventana de 30 s en espera de ser decodificada dentro de un lote."""
+    def __init__(self, samples, model_name, language):
+        self.samples = samples
+        self.model_name = model_name
+        self.language = language
+        self.enqueued_at = time.perf_counter()
+        self.text = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def batched_log_mel_spectrogram(audio, n_mels):
+    """
+    Log-mel de un lote de ventanas (B, N_SAMPLES) en una sola STFT. Equivale a aplicar
+    whisper.log_mel_spectrogram a cada ventana: el piso de 80 dB se toma del máximo de cada
+    ventana, no del lote completo (que es lo que haría pasarle el lote entero a whisper).
+    """
+    window = torch.hann_window(whisper.audio.N_FFT, device=audio.device)
+    stft = torch.stft(audio, whisper.audio.N_FFT, whisper.audio.HOP_LENGTH, window=window, return_complex=True)
+    magnitudes = stft[..., :-1].abs() ** 2
+    mel_spec = whisper.audio.mel_filters(audio.device, n_mels) @ magnitudes
+    log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+    log_spec = torch.maximum(log_spec, log_spec.amax(dim=(-2, -1), keepdim=True) - 8.0)
+    return (log_spec + 4.0) / 4.0
+
+
+class BatchingTranscriber:
+    # Sin marcas de tiempo, un clip más largo que una ventana se cortaría en límites fijos
+    MAX_AUDIO_SECONDS = 30
+
+    def __init__(self, model_getter, max_batch_size=8, max_wait_ms=50):
+        """
+        Planificador que agrupa ventanas de 30 s de requests concurrentes y las decodifica
+        en una sola pasada del modelo (log-mel + encoder + decoder en lote vía whisper.decode).
+        Pensado para clips de hasta MAX_AUDIO_SECONDS; no aplica el fallback de temperatura
+        de model.transcribe ni genera marcas de tiempo dentro de la ventana.
+        Args:
+            model_getter (callable): model_getter(model_name) -> WhisperTranscriber
+                                     (p. ej. ModelRegistry.get).
+            max_batch_size (int): Máximo de ventanas por lote.
+            max_wait_ms (int): Espera máxima desde la primera ventana antes de lanzar un lote incompleto.
+        """
+        self.model_getter = model_getter
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0, int(max_wait_ms)) / 1000.0
+        self._pending = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_stats = {} # tamaño de lote -> acumulados
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _ensure_scheduler(self):
+        # El hilo se inicia en el primer uso, de modo que un servidor pre-fork lo crea en cada proceso hijo
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._scheduler_loop, name="whisper-batcher", daemon=True)
+                self._thread.start()
+
+    def transcribe(self, audio_samples, model_name, language="es"):
+        """
+        Transcribe un arreglo float32 mono a 16 kHz. El audio se divide en ventanas de 30 s
+        que se encolan junto con las de otros requests. Bloquea hasta tener todas.
+        Returns:
+            str: El texto transcrito, o None si ocurre un error.
+        """
+        result = self.transcribe_segments(audio_samples, model_name, language=language)
+        return result["text"] if result else None
+
+    def transcribe_segments(self, audio_samples, model_name, language="es", time_map=None):
+        """
+        Igual que transcribe(), pero retorna {'text': str, 'segments': list} (o None si ocurre un error).
+        Se decodifica sin marcas de tiempo, así que cada ventana de 30 s es un segmento.
+        """
+        window = whisper.audio.N_SAMPLES
+        starts = range(0, max(1, len(audio_samples)), window)
+        windows = [_PendingWindow(audio_samples[start:start + window], model_name, language) for start in starts]
+        self._ensure_scheduler()
+        for pending in windows:
+            self._pending.put(pending)
+        for pending in windows:
+            pending.done.wait()
+            if pending.error is not None:
+                print(f"Error durante la transcripción por lotes con Whisper: {pending.error}")
+                return None
+        segments = [make_segment(start / audio_processor.WHISPER_SAMPLE_RATE,
+                                 (start + len(pending.samples)) / audio_processor.WHISPER_SAMPLE_RATE,
+                                 pending.text.strip(), time_map)
+                    for start, pending in zip(starts, windows) if pending.text and pending.text.strip()]
+        return {"text": " ".join(s["text"] for s in segments), "segments": segments}
+
+    def _scheduler_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = batch[0].enqueued_at + self.max_wait_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Un lote de whisper.decode comparte modelo e idioma
+            groups = {}
+            for pending in batch:
+                groups.setdefault((pending.model_name, pending.language), []).append(pending)
+            for (model_name, language), group in groups.items():
+                self._run_batch(model_name, language, group)
+
+    def _run_batch(self, model_name, language, group):
+        started = time.perf_counter()
+        try:
+            whisper_transcriber = self.model_getter(model_name)
+            model = whisper_transcriber.model
+            audio = torch.from_numpy(np.stack([whisper.pad_or_trim(np.asarray(p.samples, dtype=np.float32))
+                                               for p in group]))
+            mels = batched_log_mel_spectrogram(audio.to(model.device), model.dims.n_mels)
+            options = whisper.DecodingOptions(language=language, without_timestamps=True,
+                                              fp16=model.device.type != "cpu")
+            with whisper_transcriber.inference_lock, torch.no_grad():
+                results = whisper.decode(model, mels, options)
+            for pending, result in zip(group, results):
+                pending.text = result.text
+        except Exception as e:
+            for pending in group:
+                pending.error = e
+        finally:
+            finished = time.perf_counter()
+            for pending in group:
+                pending.done.set()
+            self._record_batch(len(group), finished - started,
+                               sum(finished - p.enqueued_at for p in group) / len(group))
+
+    def _record_batch(self, batch_size, batch_seconds, mean_latency_seconds):
+        with self._stats_lock:
+            stats = self._batch_stats.setdefault(batch_size, {"batches": 0, "windows": 0,
+                                                              "compute_seconds": 0.0, "latency_seconds": 0.0})
+            stats["batches"] += 1
+            stats["windows"] += batch_size
+            stats["compute_seconds"] += batch_seconds
+            stats["latency_seconds"] += mean_latency_seconds
+
+    def stats(self):
+        """Rendimiento (ventanas/s) y latencia media por tamaño de lote."""
+        with self._stats_lock:
+            report = {}
+            for batch_size, stats in sorted(self._batch_stats.items()):
+                report[batch_size] = {
+                    "batches": stats["batches"],
+                    "windows": stats["windows"],
+                    "throughput_windows_per_s": round(stats["windows"] / stats["compute_seconds"], 3)
+                        if stats["compute_seconds"] else None,
+                    "mean_batch_seconds": round(stats["compute_seconds"] / stats["batches"], 3),
+                    "mean_latency_seconds": round(stats["latency_seconds"] / stats["batches"], 3),
+                }
+            return {"max_batch_size": self.max_batch_size,
+                    "max_wait_ms": int(self.max_wait_s * 1000),
+                    "by_batch_size": report}
+
+
+if __name__ == "__main__":
+    # Informe de aceleración: python transcriber.py <audio> [modelo] [procesos]
+    import sys
+    import json
+    if len(sys.argv) < 2:
+        print("Uso: python transcriber.py <archivo_audio> [modelo] [procesos]")
+        sys.exit(1)
+    model_name = sys.argv[2] if len(sys.argv) > 2 else "base"
+    num_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    samples = audio_processor.load_slice_as_array(sys.argv[1])
+    if isinstance(samples, str):
+        print(f"No se pudo cargar el audio: {samples}")
+        sys.exit(1)
+    parallel = ParallelTranscriber(model_name=model_name, num_workers=num_workers)
+    try:
+        report = parallel.compare_with_sequential(samples, WhisperTranscriber(model_name=model_name))
+    finally:
+        parallel.shutdown()
+    print(json.dumps(report, indent=2))
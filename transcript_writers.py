@@ -0,0 +1,181 @@
+# audio_transcriber_flask_whisper/transcript_writers.py
+"""
+Escritores de transcripciones a partir de una sola lista de segmentos {'start', 'end', 'text'}
+(tiempos en segundos): DOCX con un párrafo por segmento, SRT, VTT y JSON.
+
+Cada escritor recorre los segmentos una sola vez y los escribe a medida que avanza, sin armar el
+documento completo en memoria; el archivo se escribe como <ruta>.part y se publica con os.replace.
+Para agregar un formato basta con registrar una subclase de TranscriptWriter con register_writer().
+"""
+import json
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+import file_handler
+
+# Caracteres de control que XML 1.0 no admite (Whisper a veces los emite)
+_INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def format_timestamp(seconds, decimal_separator=".", always_include_hours=True):
+    """Segundos -> 'HH:MM:SS.mmm' (VTT) o 'HH:MM:SS,mmm' (SRT)."""
+    milliseconds = max(0, int(round(seconds * 1000)))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    prefix = f"{hours:02d}:" if always_include_hours or hours else ""
+    return f"{prefix}{minutes:02d}:{secs:02d}{decimal_separator}{milliseconds:03d}"
+
+
+class TranscriptWriter:
+    """Interfaz de los escritores: extension, mimetype y _write(f, segments, title)."""
+    extension = None
+    mimetype = "application/octet-stream"
+    binary = False
+
+    def write(self, segments, output_path, title=None):
+        """
+        Escribe los segmentos en output_path de forma atómica.
+        Retorna la cantidad de bytes escritos.
+        """
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        temp_path = output_path + ".part"
+        try:
+            if self.binary:
+                with open(temp_path, "wb") as f:
+                    self._write(f, segments, title)
+            else:
+                with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+                    self._write(f, segments, title)
+            os.replace(temp_path, output_path)
+        except Exception:
+            file_handler.cleanup_temp_file(temp_path)
+            raise
+        return os.path.getsize(output_path)
+
+    def _write(self, f, segments, title):
+        raise NotImplementedError
+
+
+class SrtWriter(TranscriptWriter):
+    extension = "srt"
+    mimetype = "application/x-subrip"
+
+    def _write(self, f, segments, title):
+        for index, segment in enumerate(segments, start=1):
+            f.write(f"{index}\n"
+                    f"{format_timestamp(segment['start'], ',')} --> {format_timestamp(segment['end'], ',')}\n"
+                    f"{segment['text'].strip().replace('-->', '->')}\n\n")
+
+
+class VttWriter(TranscriptWriter):
+    extension = "vtt"
+    mimetype = "text/vtt"
+
+    def _write(self, f, segments, title):
+        f.write("WEBVTT\n\n")
+        for segment in segments:
+            f.write(f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n"
+                    f"{segment['text'].strip().replace('-->', '->')}\n\n")
+
+
+class JsonWriter(TranscriptWriter):
+    extension = "json"
+    mimetype = "application/json"
+
+    def _write(self, f, segments, title):
+        # Se escribe segmento por segmento en lugar de json.dump() de la lista completa
+        f.write('{"title": ' + json.dumps(title, ensure_ascii=False) + ', "segments": [')
+        for index, segment in enumerate(segments):
+            record = {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+            f.write(("," if index else "") + "\n  " + json.dumps(record, ensure_ascii=False))
+        f.write("\n]}\n")
+
+
+class DocxWriter(TranscriptWriter):
+    """
+    DOCX mínimo (WordprocessingML) escrito directamente en el ZIP: un párrafo por segmento con su
+    marca de tiempo. Evita armar el árbol XML completo de python-docx, que en transcripciones de
+    varias horas es lo más lento y lo que más memoria usa al generar el archivo.
+    """
+    extension = "docx"
+    mimetype = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    binary = True
+
+    CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>'
+    )
+    RELATIONSHIPS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/>'
+        '</Relationships>'
+    )
+    DOCUMENT_HEADER = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+    )
+    DOCUMENT_FOOTER = '<w:sectPr/></w:body></w:document>'
+
+    @staticmethod
+    def _run(text, properties=""):
+        text = escape(_INVALID_XML_CHARS.sub("", text))
+        return f'<w:r>{properties}<w:t xml:space="preserve">{text}</w:t></w:r>'
+
+    def _write(self, f, segments, title):
+        with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as docx:
+            docx.writestr("[Content_Types].xml", self.CONTENT_TYPES)
+            docx.writestr("_rels/.rels", self.RELATIONSHIPS)
+            with docx.open("word/document.xml", "w") as document:
+                document.write(self.DOCUMENT_HEADER.encode("utf-8"))
+                if title:
+                    document.write(("<w:p>" + self._run(title, '<w:rPr><w:b/><w:sz w:val="28"/></w:rPr>')
+                                    + "</w:p>").encode("utf-8"))
+                for segment in segments:
+                    paragraph = ("<w:p>"
+                                 + self._run(f"[{format_timestamp(segment['start'])[:8]}] ",
+                                             '<w:rPr><w:color w:val="808080"/></w:rPr>')
+                                 + self._run(segment["text"].strip())
+                                 + "</w:p>")
+                    document.write(paragraph.encode("utf-8"))
+                document.write(self.DOCUMENT_FOOTER.encode("utf-8"))
+
+
+WRITERS = {}
+
+
+def register_writer(writer):
+    """Registra (o reemplaza) el escritor de writer.extension."""
+    WRITERS[writer.extension] = writer
+
+
+for _writer in (DocxWriter(), SrtWriter(), VttWriter(), JsonWriter()):
+    register_writer(_writer)
+
+
+def output_filename(base_name, extension):
+    return f"{base_name}_transcripcion.{extension}"
+
+
+def write_outputs(segments, output_folder, base_name, formats, title=None):
+    """
+    Escribe la transcripción en cada formato pedido desde la misma lista de segmentos.
+    Retorna ({formato: nombre_de_archivo}, bytes_escritos_en_total).
+    """
+    files = {}
+    total_bytes = 0
+    for extension in formats:
+        filename = output_filename(base_name, extension)
+        total_bytes += WRITERS[extension].write(segments, os.path.join(output_folder, filename), title=title)
+        files[extension] = filename
+    return files, total_bytes
@@ -0,0 +1,150 @@
+# audio_transcriber_flask_whisper/transcription_cache.py
+import hashlib
+import json
+import os
+import shutil
+import secrets
+import threading
+import time
+
+TRANSCRIPT_FILENAME = "transcript.txt"
+DOCX_FILENAME = "transcript.docx"
+META_FILENAME = "meta.json"
+SEGMENTS_FILENAME = "segments.json"
+
+
+def make_cache_key(audio_sha256, start_ms, end_ms, model_name, language, options=None):
+    """
+    Clave del caché: hash del audio + ventana de recorte + modelo + idioma.
+    options distingue variantes del pipeline que cambian el resultado (p. ej. "vad").
+    """
+    raw = f"{audio_sha256}|{start_ms}|{end_ms}|{model_name}|{language}"
+    if options:
+        raw += f"|{options}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        """
+        Caché persistente de transcripciones direccionado por contenido.
+        Cada entrada es una carpeta <cache_dir>/<clave>/ con el texto, los segmentos con tiempos,
+        el DOCX y metadatos.
+        Las entradas se publican y eliminan con os.replace (atómico), de modo que varios
+        procesos pueden compartir la carpeta: un lector ve la entrada completa o no la ve.
+        Args:
+            cache_dir (str): Carpeta del caché.
+            max_bytes (int): Tamaño máximo en disco; al superarlo se eliminan las entradas
+                             usadas hace más tiempo (LRU por fecha de modificación).
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Retorna un dict {'transcription', 'segments', 'docx_path'} si la clave está en caché, o None.
+        'segments' es None en entradas guardadas sin segmentos. Marca la entrada como usada recientemente.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, TRANSCRIPT_FILENAME), encoding="utf-8") as f:
+                transcription = f.read()
+            try:
+                with open(os.path.join(entry_dir, SEGMENTS_FILENAME), encoding="utf-8") as f:
+                    segments = json.load(f)
+            except FileNotFoundError:
+                segments = None
+            docx_path = os.path.join(entry_dir, DOCX_FILENAME)
+            if not os.path.exists(docx_path):
+                docx_path = None
+            os.utime(entry_dir) # Actualizar la fecha de uso para la política LRU
+        except (FileNotFoundError, NotADirectoryError):
+            # La entrada no existe o fue desalojada por otro proceso mientras se leía
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        print(f"Caché: acierto para la clave {key[:12]}...")
+        return {"transcription": transcription, "segments": segments, "docx_path": docx_path}
+
+    def put(self, key, transcription, docx_path=None, metadata=None, segments=None):
+        """Guarda una transcripción (y opcionalmente sus segmentos y su DOCX) en el caché."""
+        entry_dir = self._entry_dir(key)
+        staging_dir = os.path.join(self.cache_dir, f".tmp_{key}_{secrets.token_hex(4)}")
+        try:
+            os.makedirs(staging_dir)
+            with open(os.path.join(staging_dir, TRANSCRIPT_FILENAME), "w", encoding="utf-8") as f:
+                f.write(transcription)
+            if segments is not None:
+                with open(os.path.join(staging_dir, SEGMENTS_FILENAME), "w", encoding="utf-8") as f:
+                    json.dump(segments, f, ensure_ascii=False)
+            if docx_path and os.path.exists(docx_path):
+                shutil.copyfile(docx_path, os.path.join(staging_dir, DOCX_FILENAME))
+            with open(os.path.join(staging_dir, META_FILENAME), "w", encoding="utf-8") as f:
+                json.dump(dict(metadata or {}, created_at=time.time()), f)
+            try:
+                os.replace(staging_dir, entry_dir) # Publicación atómica
+            except OSError:
+                # Otro trabajador publicó la misma clave primero; su entrada es equivalente
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                return
+            print(f"Caché: transcripción guardada con la clave {key[:12]}...")
+        except Exception as e:
+            print(f"Advertencia: No se pudo guardar la transcripción en caché: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def _entries(self):
+        """Lista (mtime, tamaño, ruta) de las entradas publicadas."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except FileNotFoundError:
+                    continue # Desalojada por otro proceso
+        return entries
+
+    def evict(self):
+        """Elimina las entradas menos usadas hasta quedar bajo max_bytes."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                trash_dir = os.path.join(self.cache_dir, f".del_{secrets.token_hex(6)}")
+                try:
+                    os.replace(path, trash_dir) # Retirar atómicamente antes de borrar
+                except OSError:
+                    continue
+                shutil.rmtree(trash_dir, ignore_errors=True)
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+            }